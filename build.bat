@@ -8,6 +8,14 @@ if exist build rmdir /s /q build
 if exist dist rmdir /s /q dist
 if exist *.egg-info rmdir /s /q *.egg-info
 
+echo.
+echo 生成图片素材包...
+python -m whimbox.dev_tool.asset_pack_generator
+
+echo.
+echo 生成地图npy...
+python -m whimbox.dev_tool.map_assets_gen
+
 echo.
 echo 开始构建...
 python -m build --wheel
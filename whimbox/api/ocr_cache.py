@@ -0,0 +1,111 @@
+"""按图片感知哈希缓存OCR结果"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# 缓存的最大条数
+OCR_CACHE_SIZE = 256
+# 感知哈希的行数，列数按图片宽高比计算
+OCR_HASH_ROWS = 16
+OCR_HASH_MAX_COLS = 128
+# 相邻像素的亮度差超过该值才记为1，平坦区域的截图噪声不会改变哈希
+OCR_HASH_MARGIN = 4
+
+
+def image_hash(img: np.ndarray) -> bytes:
+    """
+    差值哈希(dHash)：缩小后比较每个像素和左边像素的亮度
+
+    单行文字区域通常很宽，列数按宽高比增加，保证每列不超过一两个字符宽，
+    文字不同时哈希也不同。
+
+    Returns:
+        bytes:
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    h, w = img.shape[:2]
+    cols = int(np.clip(round(OCR_HASH_ROWS * w / max(h, 1)), OCR_HASH_ROWS, OCR_HASH_MAX_COLS))
+    small = cv2.resize(img, (cols + 1, OCR_HASH_ROWS), interpolation=cv2.INTER_AREA)
+    diff = np.diff(small.astype(np.int16), axis=1)
+    # 变亮和变暗分别记录，文字的左右边缘都会影响哈希
+    return np.packbits(np.concatenate([diff > OCR_HASH_MARGIN, diff < -OCR_HASH_MARGIN])).tobytes()
+
+
+class OcrResultCache:
+    """
+    LRU缓存，键为(识别模式, 图片尺寸, 感知哈希)。
+
+    画面没变时重复的OCR（标题轮询、未滚动的列表等）直接返回上次的结果。
+    tolerance大于0时，哈希的汉明距离不超过tolerance的图片也视为相同，
+    可以容忍截图的轻微噪声，但太大会把只差一个字的文字当成相同。
+    """
+
+    def __init__(self, maxsize=OCR_CACHE_SIZE, tolerance=0):
+        self.maxsize = maxsize
+        self.tolerance = tolerance
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def make_key(self, img: np.ndarray, mode):
+        """
+        Args:
+            img: 预处理后送去OCR的图片
+            mode: 识别模式，不同模式的结果分开缓存
+
+        Returns:
+            tuple:
+        """
+        return (mode, img.shape, image_hash(img))
+
+    def _find_near(self, key):
+        mode, shape, digest = key
+        value = int.from_bytes(digest, 'big')
+        for other in reversed(self._cache):
+            if other[0] != mode or other[1] != shape:
+                continue
+            if (value ^ int.from_bytes(other[2], 'big')).bit_count() <= self.tolerance:
+                return other
+        return None
+
+    def get(self, key):
+        """
+        Returns:
+            缓存的结果，没有时返回None
+        """
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if self.tolerance > 0:
+                other = self._find_near(key)
+                if other is not None:
+                    self.near_hits += 1
+                    self._cache.move_to_end(other)
+                    return self._cache[other]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def cache_info(self):
+        total = self.hits + self.near_hits + self.misses
+        hit_rate = (self.hits + self.near_hits) / total if total else 0.
+        return {'hits': self.hits, 'near_hits': self.near_hits, 'misses': self.misses,
+                'hit_rate': hit_rate, 'size': len(self._cache)}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -3,14 +3,22 @@ import os
 import threading
 import time
 import cv2
+from concurrent.futures import Future
 from whimbox.common.logger import logger
 from whimbox.common.path_lib import ASSETS_PATH
+from whimbox.config.config import global_config
+from whimbox.api.ocr_service import OcrService, done_future, chain_future
+from whimbox.api.ocr_cache import OcrResultCache
+from whimbox.common.lazy_singleton import LazySingleton
 
 # 错误替换表
 REPLACE_DICT = {
     "拋掷": "抛掷",
 }
 
+# 跳过检测直接识别时，低于该置信度的结果丢弃（通常是没有文字的区域）
+REC_ONLY_MIN_SCORE = 0.5
+
 class RapidOcr():
 
     _instance = None
@@ -28,9 +36,18 @@ class RapidOcr():
         logger.info(f"Creating RapidOCR object")
         pt = time.time()
         config_path = os.path.join(ASSETS_PATH, 'rapidocr.yaml')
-        self.ocr = RapidOCR(config_path=config_path)
-        logger.info(f"created RapidOCR. cost {round(time.time() - pt, 2)}")
+        # 工作进程数大于0时，在多个进程中并行识别，不再在当前进程中加载模型
+        workers = global_config.get_int('General', 'ocr_workers', 0)
+        if workers > 0:
+            self.ocr = None
+            self.service = OcrService(config_path, workers=workers)
+        else:
+            self.ocr = RapidOCR(config_path=config_path)
+            self.service = None
+        logger.info(f"created RapidOCR. workers: {workers} cost {round(time.time() - pt, 2)}")
         self._lock = threading.Lock()
+        # 图片没变时直接返回上次的识别结果
+        self.cache = OcrResultCache()
         self._initialized = True
 
     def _replace_texts(self, text: str):
@@ -39,27 +56,87 @@ class RapidOcr():
                 text = text.replace(i, REPLACE_DICT[i])
         return text
 
+    def analyze_async(self, img) -> Future:
+        """
+        检测+识别，返回Future，结果有boxes, txts, scores属性
+        """
+        if self.service is not None:
+            return self.service.submit_analyze(img)
+        with self._lock:
+            # use_det等参数会保存在RapidOCR对象中，每次都要明确指定
+            return done_future(self.ocr(img, use_det=True, use_cls=False, use_rec=True))
+
     def analyze(self, img):
         """直接调用 RapidOCR 的接口"""
-        with self._lock:
-            result = self.ocr(img)
-            return result
+        return self.analyze_async(img).result()
 
-    def get_all_texts(self, img, mode=0, per_monitor=False):
-        if per_monitor:
-            pt = time.time()
-        res = self.analyze(img)  # res is a RapidOCROutput object
+    def recognize_async(self, img) -> Future:
+        """
+        跳过文字检测，把整张图片作为一行文字识别
 
-        rec_texts = []
-        if res and hasattr(res, 'txts') and res.txts:
-            rec_texts = [self._replace_texts(txt) for txt in res.txts if len(txt) > 0]
+        Args:
+            img: 紧贴文字的单行区域，不要加padding
 
+        Returns:
+            Future[list[str]]:
+        """
+        def parse(results):
+            return [txt for txt, score in results if len(txt) > 0 and score >= REC_ONLY_MIN_SCORE]
+
+        if self.service is not None:
+            return chain_future(self.service.submit_recognize(img), parse)
+        with self._lock:
+            res = self.ocr(img, use_det=False, use_cls=False, use_rec=True)
+        if not res or not getattr(res, 'txts', None):
+            return done_future([])
+        return done_future(parse(zip(res.txts, res.scores)))
+
+    def recognize(self, img):
+        return self.recognize_async(img).result()
+
+    def get_all_texts_async(self, img, mode=0, rec_only=False, use_cache=True) -> Future:
+        """
+        Args:
+            img:
+            mode: 0返回list，1拼接为str
+            rec_only: 跳过文字检测，只用于已知的单行文字区域
+            use_cache: 图片和之前识别过的相同时直接返回缓存的结果
+
+        Returns:
+            Future[list[str] | str]:
+        """
+        def format_texts(rec_texts):
+            return ''.join(rec_texts) if mode == 1 else list(rec_texts)
+
+        cache_key = None
+        if use_cache:
+            cache_key = self.cache.make_key(img, ('rec' if rec_only else 'texts'))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return done_future(format_texts(cached))
+
+        def parse(res):
+            if rec_only:
+                rec_texts = [self._replace_texts(txt) for txt in res]
+            else:
+                rec_texts = []
+                if res and hasattr(res, 'txts') and res.txts:
+                    rec_texts = [self._replace_texts(txt) for txt in res.txts if len(txt) > 0]
+            if cache_key is not None:
+                self.cache.set(cache_key, list(rec_texts))
+            return format_texts(rec_texts)
+
+        if rec_only:
+            return chain_future(self.recognize_async(img), parse)
+        return chain_future(self.analyze_async(img), parse)
+
+    def get_all_texts(self, img, mode=0, per_monitor=False, rec_only=False, use_cache=True):
+        if per_monitor:
+            pt = time.time()
+        res = self.get_all_texts_async(img, mode=mode, rec_only=rec_only, use_cache=use_cache).result()
         if per_monitor:
             logger.info(f"ocr performance: {round(time.time() - pt, 2)}")
-
-        if mode == 1:
-            return ''.join(rec_texts)
-        return rec_texts
+        return res
 
     def _show_ocr_result(self, img, res):
         """独立的画框和显示逻辑"""
@@ -74,28 +151,51 @@ class RapidOcr():
         cv2.imshow("OCR Debug", img_with_boxes)
         cv2.waitKey(0)
 
-    def detect_and_ocr(self, img, show_res=False):
-        res = self.analyze(img)
-        ret = {}
-        if res and res.boxes is not None and res.txts is not None:
-            for box, txt in zip(res.boxes, res.txts):
-                if len(txt) > 1:
-                    # 简化为左上角和右下角坐标，方便后续点击
-                    x_coords = [point[0] for point in box]
-                    y_coords = [point[1] for point in box]
-                    left_top_x = min(x_coords)
-                    left_top_y = min(y_coords)
-                    right_bottom_x = max(x_coords)
-                    right_bottom_y = max(y_coords)
-                    simplified_box = [left_top_x, left_top_y, right_bottom_x, right_bottom_y]
-                    # todo: 可能识别出多个相同的文本，需要优化
-                    ret[self._replace_texts(txt)] = simplified_box
-
+    def detect_and_ocr_async(self, img, use_cache=True) -> Future:
+        """
+        Returns:
+            Future[dict]: 文字 -> [x1, y1, x2, y2]
+        """
+        def copy_result(ret):
+            # 调用者可能会修改结果
+            return {txt: list(box) for txt, box in ret.items()}
+
+        cache_key = None
+        if use_cache:
+            cache_key = self.cache.make_key(img, 'detect')
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return done_future(copy_result(cached))
+
+        def parse(res):
+            ret = {}
+            if res and res.boxes is not None and res.txts is not None:
+                for box, txt in zip(res.boxes, res.txts):
+                    if len(txt) > 1:
+                        # 简化为左上角和右下角坐标，方便后续点击
+                        x_coords = [point[0] for point in box]
+                        y_coords = [point[1] for point in box]
+                        left_top_x = min(x_coords)
+                        left_top_y = min(y_coords)
+                        right_bottom_x = max(x_coords)
+                        right_bottom_y = max(y_coords)
+                        simplified_box = [left_top_x, left_top_y, right_bottom_x, right_bottom_y]
+                        # todo: 可能识别出多个相同的文本，需要优化
+                        ret[self._replace_texts(txt)] = simplified_box
+            if cache_key is not None:
+                self.cache.set(cache_key, copy_result(ret))
+            return ret
+
+        return chain_future(self.analyze_async(img), parse)
+
+    def detect_and_ocr(self, img, show_res=False, use_cache=True):
+        ret = self.detect_and_ocr_async(img, use_cache=use_cache).result()
         if show_res:
             self._show_ocr_result(img, ret)
         return ret
 
-ocr = RapidOcr()
+# 第一次使用时才加载模型
+ocr = LazySingleton('ocr', RapidOcr)
 
 # ---------------- 调用 Demo ----------------
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+"""多进程OCR服务，每个工作进程有独立的RapidOCR实例"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import cv2
+from rapidocr import RapidOCR
+from rapidocr.ch_ppocr_rec import TextRecInput
+
+# 单行识别请求合并为一批时，最多等待的时间（秒）
+OCR_BATCH_WAIT = 0.005
+# 单行识别请求合并的最大数量
+OCR_BATCH_SIZE = 8
+
+# 工作进程中的RapidOCR实例
+_engine = None
+
+
+def _init_worker(config_path):
+    global _engine
+    _engine = RapidOCR(config_path=config_path)
+
+
+class OcrResult:
+    """可以在进程间传递的OCR结果，属性同RapidOCROutput"""
+
+    def __init__(self, boxes=None, txts=None, scores=None):
+        self.boxes = boxes
+        self.txts = txts
+        self.scores = scores
+
+
+def _worker_analyze(img):
+    res = _engine(img, use_det=True, use_cls=False, use_rec=True)
+    return OcrResult(getattr(res, 'boxes', None), getattr(res, 'txts', None), getattr(res, 'scores', None))
+
+
+def _worker_recognize(imgs):
+    imgs = [cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else img for img in imgs]
+    res = _engine.text_rec(TextRecInput(img=imgs))
+    return list(zip(res.txts, res.scores))
+
+
+def done_future(result) -> Future:
+    """已经完成的Future"""
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def chain_future(future: Future, func) -> Future:
+    """
+    Returns:
+        Future: future完成后，结果为func(future.result())
+    """
+    chained = Future()
+
+    def callback(f):
+        try:
+            chained.set_result(func(f.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(callback)
+    return chained
+
+
+class OcrService:
+    """
+    在工作进程中执行OCR，返回Future。
+
+    完整的检测+识别请求直接提交给进程池；单行识别请求先进入队列，
+    在OCR_BATCH_WAIT内到达的请求合并为一次识别模型调用。
+    """
+
+    def __init__(self, config_path, workers=2, batch_size=OCR_BATCH_SIZE, batch_wait=OCR_BATCH_WAIT):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config_path,))
+        self._rec_queue = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True, name='OcrServiceDispatcher')
+        self._dispatcher.start()
+
+    def submit_analyze(self, img) -> Future:
+        """
+        Returns:
+            Future[OcrResult]:
+        """
+        return self.executor.submit(_worker_analyze, img)
+
+    def submit_recognize(self, img) -> Future:
+        """
+        Returns:
+            Future[list[tuple[str, float]]]: 文字和置信度
+        """
+        future = Future()
+        self._rec_queue.put((img, future))
+        return future
+
+    def _dispatch_loop(self):
+        while True:
+            item = self._rec_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.time() + self.batch_wait
+            stop = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._rec_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._submit_batch(batch)
+            if stop:
+                return
+
+    def _submit_batch(self, batch):
+        try:
+            batch_future = self.executor.submit(_worker_recognize, [img for img, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        def callback(f):
+            try:
+                results = f.result()
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            for (_, future), result in zip(batch, results):
+                future.set_result([result])
+
+        batch_future.add_done_callback(callback)
+
+    def shutdown(self):
+        self._rec_queue.put(None)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,6 @@
 """Constants."""
 
+import os
 import threading
 import contextvars
 from whimbox.common.path_lib import IS_DEV_MODE
@@ -57,6 +58,11 @@ ANGLE_NEGATIVE_XY = 3
 # Process name
 PROCESS_NAME = 'X6Game-Win64-Shipping.exe'
 
+# 回放录制的画面代替游戏窗口，用于离线测试识别性能，可以是png文件夹、npz或视频
+REPLAY_SOURCE = os.environ.get('WHIMBOX_REPLAY')
+# 为1时按录制时的时间戳回放，否则每次截图取下一帧
+REPLAY_REALTIME = os.environ.get('WHIMBOX_REPLAY_REALTIME') == '1'
+
 # log
 LOG_NONE = 0
 LOG_WHEN_TRUE = 1
@@ -1,6 +1,7 @@
 import psutil
-import win32gui, win32process, win32con
-from whimbox.common.cvars import PROCESS_NAME
+from whimbox.common.cvars import PROCESS_NAME, REPLAY_SOURCE
+if not REPLAY_SOURCE:
+    import win32gui, win32process, win32con
 
 def get_hwnd_for_pid(pid):
     hwnds = []
@@ -81,7 +82,39 @@ class ProcessHandler():
         return False, 0, 0
             
 
-HANDLE_OBJ = ProcessHandler(PROCESS_NAME)
+class ReplayHandler():
+    """回放录制画面时代替ProcessHandler，不依赖游戏窗口和win32"""
+    def __init__(self, width=1920, height=1080) -> None:
+        self.handle = 1
+        self.width = width
+        self.height = height
+
+    def get_handle(self):
+        return self.handle
+
+    def refresh_handle(self):
+        pass
+
+    def is_foreground(self):
+        return True
+
+    def is_minimized(self):
+        return False
+
+    def set_foreground(self):
+        pass
+
+    def is_alive(self):
+        return True
+
+    def check_shape(self):
+        return True, self.width, self.height
+
+
+if REPLAY_SOURCE:
+    HANDLE_OBJ = ReplayHandler()
+else:
+    HANDLE_OBJ = ProcessHandler(PROCESS_NAME)
 
 if __name__ == '__main__':
     pass
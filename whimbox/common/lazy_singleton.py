@@ -0,0 +1,115 @@
+"""惰性初始化的模块级单例，以及启动耗时统计"""
+
+import threading
+import time
+
+from whimbox.common.logger import logger
+
+# 启动耗时记录，(子系统名称, 'import'或'init', 耗时秒, 线程名)
+startup_timings = []
+# 名称 -> LazySingleton
+_singletons = {}
+
+
+def record_startup_timing(name, kind, cost):
+    startup_timings.append((name, kind, cost, threading.current_thread().name))
+
+
+class LazySingleton:
+    """
+    模块级单例的代理，第一次访问属性时才创建真正的对象。
+
+    创建时要截图、加载模型、读取文件或者启动线程的单例，放到第一次使用时再创建，
+    导入模块就很快。属性访问、下标、in、迭代、len都转发给真正的对象，
+    需要真正的对象时（如isinstance）用lazy_get()。
+    """
+
+    def __init__(self, name, factory):
+        """
+        Args:
+            name (str): 单例名称，用于启动耗时统计和warm_up
+            factory (callable): 无参数，返回真正的对象
+        """
+        object.__setattr__(self, '_lazy_name', name)
+        object.__setattr__(self, '_lazy_factory', factory)
+        object.__setattr__(self, '_lazy_instance', None)
+        object.__setattr__(self, '_lazy_creating', False)
+        object.__setattr__(self, '_lazy_lock', threading.RLock())
+        _singletons[name] = self
+
+    def lazy_get(self):
+        instance = self._lazy_instance
+        if instance is not None:
+            return instance
+        with self._lazy_lock:
+            if self._lazy_instance is None:
+                if self._lazy_creating:
+                    raise RuntimeError(f"{self._lazy_name}在创建过程中被访问，存在循环依赖")
+                object.__setattr__(self, '_lazy_creating', True)
+                try:
+                    t = time.perf_counter()
+                    instance = self._lazy_factory()
+                    record_startup_timing(self._lazy_name, 'init', time.perf_counter() - t)
+                finally:
+                    object.__setattr__(self, '_lazy_creating', False)
+                object.__setattr__(self, '_lazy_instance', instance)
+            return self._lazy_instance
+
+    def lazy_initialized(self):
+        return self._lazy_instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self.lazy_get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.lazy_get(), name, value)
+
+    def __getitem__(self, key):
+        return self.lazy_get()[key]
+
+    def __setitem__(self, key, value):
+        self.lazy_get()[key] = value
+
+    def __contains__(self, key):
+        return key in self.lazy_get()
+
+    def __iter__(self):
+        return iter(self.lazy_get())
+
+    def __len__(self):
+        return len(self.lazy_get())
+
+    def __bool__(self):
+        return bool(self.lazy_get())
+
+    def __repr__(self):
+        if self.lazy_initialized():
+            return repr(self._lazy_instance)
+        return f"<LazySingleton {self._lazy_name} (not initialized)>"
+
+
+def get_singletons() -> dict:
+    return dict(_singletons)
+
+
+def warm_up(*singletons):
+    """
+    在后台线程中提前创建单例，主线程第一次使用时如果还没创建完，会等待创建完成
+
+    Args:
+        singletons (LazySingleton): 按顺序创建
+
+    Returns:
+        threading.Thread:
+    """
+    def run():
+        for singleton in singletons:
+            try:
+                singleton.lazy_get()
+            except Exception as e:
+                # 主线程使用时会重新创建并抛出异常
+                logger.error(f"预加载{singleton._lazy_name}失败: {e}")
+
+    thread = threading.Thread(target=run, daemon=True, name='SingletonWarmUp')
+    thread.start()
+    return thread
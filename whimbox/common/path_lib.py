@@ -1,5 +1,4 @@
 import os
-import win32api, win32con
 import configparser
 
 ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,12 +10,14 @@ ASSETS_PATH = os.path.join(ROOT_PATH, 'assets')
 CONFIG_PATH = os.path.join(os.getcwd(), 'configs')
 LOG_PATH = os.path.join(os.getcwd(), 'logs')
 SCRIPT_PATH = os.path.join(os.getcwd(), 'scripts')
+CACHE_PATH = os.path.join(os.getcwd(), 'cache')
 
 def find_game_launcher_folder():
     # HKEY_CURRENT_USER\Software\InfinityNikki Launcher
     path = ""
     key = 'Software\\InfinityNikki Launcher'
     try:
+        import win32api, win32con
         key = win32api.RegOpenKey(win32con.HKEY_CURRENT_USER, key, 0, win32con.KEY_READ)
         path, _ = win32api.RegQueryValueEx(key, "")  # 读取默认值
         win32api.RegCloseKey(key)
@@ -2,9 +2,13 @@ from pydantic import BaseModel
 from typing import Optional, Literal
 import os
 import json
+import threading
 
-from whimbox.common.path_lib import SCRIPT_PATH
+import numpy as np
+
+from whimbox.common.path_lib import SCRIPT_PATH, CONFIG_PATH
 from whimbox.common.logger import logger
+from whimbox.common.lazy_singleton import LazySingleton
 
 # 基础脚本信息
 class ScriptInfo(BaseModel):
@@ -35,6 +39,82 @@ class PathRecord(BaseModel):
     info: PathInfo
     points: list[PathPoint]
 
+    def to_arrays(self) -> "PathArrays":
+        return PathArrays.from_points(self.points)
+
+    @classmethod
+    def from_arrays(cls, info: PathInfo, arrays: "PathArrays") -> "PathRecord":
+        return cls(info=info, points=arrays.to_points())
+
+
+def _encode_column(values):
+    """把字符串列编码为小整数，返回(取值列表, 编码数组)"""
+    names = {}
+    codes = np.fromiter((names.setdefault(v, len(names)) for v in values), dtype=np.int16, count=len(values))
+    return list(names), codes
+
+
+# 跑图脚本点位的列存储，坐标换算、距离计算可以对整条路线一次完成
+class PathArrays:
+    def __init__(self, ids, positions, move_mode_names, move_modes, point_type_names, point_types,
+                 action_names, actions, action_params):
+        self.ids = ids                          # (N,) int
+        self.positions = positions              # (N, 2) float64
+        # 移动模式、点位类型、动作编码为小整数，xxx_names[code]为原来的值
+        self.move_mode_names = move_mode_names
+        self.move_modes = move_modes            # (N,) int16
+        self.point_type_names = point_type_names
+        self.point_types = point_types          # (N,) int16
+        self.action_names = action_names
+        self.actions = actions                  # (N,) int16
+        self.action_params = action_params     # list[str | None]
+
+    @classmethod
+    def from_points(cls, points: list[PathPoint]) -> "PathArrays":
+        # 只用平面坐标，多出的坐标（如高度）忽略
+        for p in points:
+            if len(p.position) < 2:
+                raise ValueError(f"点位{p.id}的坐标{p.position}少于2个值")
+        move_mode_names, move_modes = _encode_column([p.move_mode for p in points])
+        point_type_names, point_types = _encode_column([p.point_type for p in points])
+        action_names, actions = _encode_column([p.action for p in points])
+        return cls(
+            ids=np.array([p.id for p in points], dtype=np.int64),
+            positions=np.array([p.position[:2] for p in points], dtype=np.float64).reshape(-1, 2),
+            move_mode_names=move_mode_names,
+            move_modes=move_modes,
+            point_type_names=point_type_names,
+            point_types=point_types,
+            action_names=action_names,
+            actions=actions,
+            action_params=[p.action_params for p in points],
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def indexes_of(self, point_type) -> np.ndarray:
+        """某种点位类型的所有下标"""
+        if point_type not in self.point_type_names:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.point_types == self.point_type_names.index(point_type))
+
+    def to_points(self) -> list[PathPoint]:
+        # 数据来自校验过的PathPoint，不用再校验
+        return [
+            PathPoint.model_construct(
+                id=point_id,
+                move_mode=self.move_mode_names[move_mode],
+                point_type=self.point_type_names[point_type],
+                action=self.action_names[action],
+                action_params=action_params,
+                position=position,
+            )
+            for point_id, position, move_mode, point_type, action, action_params in zip(
+                self.ids.tolist(), self.positions.tolist(), self.move_modes.tolist(),
+                self.point_types.tolist(), self.actions.tolist(), self.action_params)
+        ]
+
 # 宏脚本信息
 class MacroInfo(ScriptInfo):
     aspect_ratio: Optional[Literal["16:9", "16:10"]] = None  # 分辨率比例
@@ -55,6 +135,83 @@ class MacroRecord(BaseModel):
     steps: list[MacroStep] = []  # 操作步骤列表
 
 
+# 脚本目录的索引文件，记录每个脚本文件的修改时间、大小和info，没改动过的文件不用重新读取
+SCRIPT_INDEX_FILE = os.path.join(CONFIG_PATH, "scripts_index.json")
+# 索引格式的版本号，修改索引内容后要增加
+SCRIPT_INDEX_VERSION = 2
+# 路线的筛选索引
+PATH_INDEX_FIELDS = ("target", "type", "region", "map")
+MACRO_TYPE = "宏"
+
+
+class ScriptEntry:
+    """
+    脚本目录中的一个脚本文件。
+
+    新增和改动过的文件在刷新目录时完整校验一次，之后只在内存中保留info，
+    points和steps在第一次使用时才读取，查询结果可以直接当作PathRecord或MacroRecord使用。
+    """
+
+    def __init__(self, file_name: str, mtime: int, size: int, info: PathInfo | MacroInfo):
+        self.file_name = file_name
+        self.mtime = mtime
+        self.size = size
+        self.info = info
+        # on_load_error(entry)，读取失败时调用，从目录中去掉这个脚本
+        self.on_load_error = None
+        self._record = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_macro(self):
+        return self.info.type == MACRO_TYPE
+
+    @property
+    def file_path(self):
+        return os.path.join(SCRIPT_PATH, self.file_name)
+
+    def load(self) -> PathRecord | MacroRecord:
+        """
+        读取完整的脚本。刷新后文件被改坏或删除时抛出ValueError，
+        不会换成其他文件，否则info和points/steps可能来自不同的文件。需要换成同名脚本时用ScriptsManager.load_script
+        """
+        with self._lock:
+            if self._record is not None:
+                return self._record
+            record_cls = MacroRecord if self.is_macro else PathRecord
+            try:
+                with open(self.file_path, "r", encoding="utf-8") as f:
+                    self._record = record_cls.model_validate_json(f.read())
+                return self._record
+            except Exception as e:
+                error = ValueError(f"读取脚本文件{self.file_name}失败: {e}")
+        logger.error(str(error))
+        if self.on_load_error is not None:
+            self.on_load_error(self)
+        raise error
+
+    @property
+    def points(self) -> list[PathPoint]:
+        return self.load().points
+
+    @property
+    def steps(self) -> list[MacroStep]:
+        return self.load().steps
+
+    def to_index(self) -> dict:
+        return {
+            "mtime": self.mtime,
+            "size": self.size,
+            "info": self.info.model_dump(exclude_none=True),
+        }
+
+    @classmethod
+    def from_index(cls, file_name, data):
+        info = data["info"]
+        info_cls = MacroInfo if info.get("type") == MACRO_TYPE else PathInfo
+        return cls(file_name, data["mtime"], data["size"], info_cls.model_validate(info))
+
+
 class ScriptsManager:
 
     _instance = None
@@ -69,77 +226,171 @@ class ScriptsManager:
     def __init__(self):
         if self._initialized:
             return
+        self._lock = threading.RLock()
+        # 脚本名 -> ScriptEntry，同名的脚本只保留更新时间最新的
         self.path_dict = {}
         self.macro_dict = {}
+        # 筛选字段 -> 字段值 -> {路线名: ScriptEntry}
+        self.path_index = {field: {} for field in PATH_INDEX_FIELDS}
+        # 文件名 -> ScriptEntry，先从索引文件读取，刷新时只重新读取改动过的文件
+        self.entries = self._load_index()
+        # 校验失败的文件名 -> (修改时间, 大小)，没再改动就不重复读取和报错
+        self._bad_files = {}
         self.init_scripts_dict()
 
         self._initialized = True
 
+    def _load_index(self) -> dict:
+        if not os.path.exists(SCRIPT_INDEX_FILE):
+            return {}
+        try:
+            with open(SCRIPT_INDEX_FILE, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") != SCRIPT_INDEX_VERSION:
+                return {}
+            return {file_name: ScriptEntry.from_index(file_name, data) for file_name, data in index["files"].items()}
+        except Exception as e:
+            logger.warning(f"读取脚本索引失败，重新读取所有脚本: {e}")
+            return {}
+
+    def _save_index(self):
+        index = {
+            "version": SCRIPT_INDEX_VERSION,
+            "files": {file_name: entry.to_index() for file_name, entry in self.entries.items()},
+        }
+        try:
+            os.makedirs(os.path.dirname(SCRIPT_INDEX_FILE), exist_ok=True)
+            tmp_file = SCRIPT_INDEX_FILE + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_file, SCRIPT_INDEX_FILE)
+        except Exception as e:
+            logger.warning(f"保存脚本索引失败: {e}")
+
+    def _read_entry(self, file_name, mtime, size) -> ScriptEntry | None:
+        """完整校验一次，校验失败的文件不加入目录，只保留info"""
+        try:
+            with open(os.path.join(SCRIPT_PATH, file_name), "r", encoding="utf-8") as f:
+                json_text = f.read()
+            json_dict = json.loads(json_text)
+            record_cls = MacroRecord if json_dict['info']['type'] == MACRO_TYPE else PathRecord
+            record = record_cls.model_validate_json(json_text)
+            return ScriptEntry(file_name, mtime, size, record.info)
+        except Exception as e:
+            logger.error(f"读取脚本文件{file_name}失败: {e}")
+            return None
+
+    def _drop_entry(self, entry: ScriptEntry):
+        """从目录中去掉读取失败的脚本，重建索引"""
+        with self._lock:
+            if self.entries.get(entry.file_name) is entry:
+                self.entries = {name: e for name, e in self.entries.items() if e is not entry}
+                self._save_index()
+                self._build_indexes()
+
+    def load_script(self, entry: ScriptEntry) -> PathRecord | MacroRecord:
+        """
+        读取查询到的脚本。文件读取失败时换成同名的其他脚本重新读取，返回的info和points/steps来自同一个文件
+
+        Raises:
+            ValueError: 同名的脚本都读取失败
+        """
+        while True:
+            try:
+                return entry.load()
+            except ValueError:
+                # 读取失败的脚本已经从目录中去掉，重新查询
+                script_dict = self.macro_dict if entry.is_macro else self.path_dict
+                replacement = script_dict.get(entry.info.name)
+                if replacement is None or replacement is entry:
+                    raise
+                logger.info(f"使用同名脚本文件{replacement.file_name}")
+                entry = replacement
+
     def init_scripts_dict(self):
-        self.path_dict = {}
-        self.macro_dict = {}
-        for file in os.listdir(SCRIPT_PATH):
-            if file.endswith(".json"):
-                with open(os.path.join(SCRIPT_PATH, file), "r", encoding="utf-8") as f:
-                    try:
-                        json_text = f.read()
-                        json_dict = json.loads(json_text)
-                        if json_dict['info']['type'] == '宏':
-                            macro_record = MacroRecord.model_validate_json(json_text)
-                            macro_name = macro_record.info.name
-                            if macro_name in self.macro_dict:
-                                if self.macro_dict[macro_name].info.update_time < macro_record.info.update_time:
-                                    self.macro_dict[macro_name] = macro_record
-                                else:
-                                    continue
-                            else:
-                                self.macro_dict[macro_name] = macro_record
-                        else:
-                            path_record = PathRecord.model_validate_json(json_text)
-                            path_name = path_record.info.name
-                            if path_name in self.path_dict:
-                                if self.path_dict[path_name].info.update_time < path_record.info.update_time:
-                                    self.path_dict[path_name] = path_record
-                                else:
-                                    continue
-                            else:
-                                self.path_dict[path_name] = path_record
-                    except Exception as e:
-                        logger.error(f"读取脚本文件{file}失败: {e}")
+        """刷新脚本目录，只重新读取新增和改动过的文件"""
+        with self._lock:
+            entries = {}
+            changed = False
+            if os.path.exists(SCRIPT_PATH):
+                for dir_entry in sorted(os.scandir(SCRIPT_PATH), key=lambda e: e.name):
+                    if not dir_entry.name.endswith(".json") or not dir_entry.is_file():
                         continue
+                    stat = dir_entry.stat()
+                    entry = self.entries.get(dir_entry.name)
+                    if entry is None or entry.mtime != stat.st_mtime_ns or entry.size != stat.st_size:
+                        if self._bad_files.get(dir_entry.name) == (stat.st_mtime_ns, stat.st_size):
+                            continue
+                        entry = self._read_entry(dir_entry.name, stat.st_mtime_ns, stat.st_size)
+                        changed = True
+                        if entry is None:
+                            self._bad_files[dir_entry.name] = (stat.st_mtime_ns, stat.st_size)
+                            continue
+                    entries[dir_entry.name] = entry
+            if changed or entries.keys() != self.entries.keys():
+                self.entries = entries
+                self._save_index()
+            self._build_indexes()
+
+    def _build_indexes(self):
+        path_dict = {}
+        macro_dict = {}
+        for entry in self.entries.values():
+            entry.on_load_error = self._drop_entry
+            script_dict = macro_dict if entry.is_macro else path_dict
+            name = entry.info.name
+            if name in script_dict and (script_dict[name].info.update_time or "") >= (entry.info.update_time or ""):
+                continue
+            script_dict[name] = entry
+        path_index = {field: {} for field in PATH_INDEX_FIELDS}
+        for name, entry in path_dict.items():
+            for field in PATH_INDEX_FIELDS:
+                path_index[field].setdefault(getattr(entry.info, field), {})[name] = entry
+        self.path_dict = path_dict
+        self.macro_dict = macro_dict
+        self.path_index = path_index
 
-    def query_path(self, path_name=None, target=None, type=None, count=None, return_one=False) -> list[PathRecord] | PathRecord | None:
+    def query_path(self, path_name=None, target=None, type=None, count=None, region=None, map=None,
+                   return_one=False) -> list[ScriptEntry] | ScriptEntry | None:
         # 指定名字就直接返回单文件（用于内部固定路线的任务使用，比如每日任务）
         if path_name:
             return self.path_dict.get(path_name, None)
         
-        # 根据要求进行筛选
-        res = []
-        for _, path_record in self.path_dict.items():
-            match = True
-            
-            # Filter by target (exact match)
-            if target is not None:
-                if path_record.info.target != target:
-                    match = False
-            
-            # Filter by type (exact match)
-            if type is not None:
-                if path_record.info.type != type:
-                    match = False
-            
-            # Filter by count (greater than or equal)
-            if count is not None:
-                if path_record.info.count is None or path_record.info.count < count:
-                    match = False
-            
-            if match:
-                res.append(path_record)
+        # 先用筛选索引找到候选路线，从最少的候选开始过滤
+        filters = {"target": target, "type": type, "region": region, "map": map}
+        candidates = [self.path_index[field].get(value, {}) for field, value in filters.items() if value is not None]
+        if candidates:
+            candidates.sort(key=len)
+            res = [entry for name, entry in candidates[0].items() if all(name in c for c in candidates[1:])]
+        else:
+            res = list(self.path_dict.values())
+
+        # Filter by count (greater than or equal)
+        if count is not None:
+            res = [entry for entry in res if entry.info.count is not None and entry.info.count >= count]
         
         if return_one:
             return res[0] if res else None
         else:
             return res
+
+    def _delete_scripts(self, name: str, is_macro: bool) -> int:
+        """删除指定名称的所有脚本文件，返回删除的文件数量"""
+        with self._lock:
+            self.init_scripts_dict()
+            deleted_count = 0
+            for entry in list(self.entries.values()):
+                if entry.info.name != name or entry.is_macro != is_macro:
+                    continue
+                try:
+                    os.remove(entry.file_path)
+                    deleted_count += 1
+                except Exception as e:
+                    logger.warning(f"Failed to delete file {entry.file_path}: {e}")
+                    continue
+            if deleted_count > 0:
+                self.init_scripts_dict()
+            return deleted_count
     
     def delete_path(self, path_name: str) -> int:
         """
@@ -160,37 +411,8 @@ class ScriptsManager:
             return 0
         
         try:
-            target_filepath = []
-            for file in os.listdir(SCRIPT_PATH):
-                if not file.endswith(".json"):
-                    continue
-                
-                file_path = os.path.join(SCRIPT_PATH, file)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        try:
-                            path_data = json.load(f)
-                            # 检查路线名是否匹配
-                            if path_data.get("info", {}).get("name") == path_name:
-                                target_filepath.append(file_path)
-                        except (json.JSONDecodeError, KeyError, TypeError):
-                            # 跳过格式错误的文件
-                            continue
-                except Exception as e:
-                    logger.warning(f"Failed to read file {file}: {e}")
-                    continue
-            
-            # 删除成功后，重新初始化路径字典
-            deleted_count = 0
-            for file_path in target_filepath:
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                except Exception as e:
-                    logger.warning(f"Failed to delete file {file_path}: {e}")
-                    continue
+            deleted_count = self._delete_scripts(path_name, is_macro=False)
             if deleted_count > 0:
-                self.init_scripts_dict()
                 logger.info(f"Deleted {deleted_count} file(s) for path '{path_name}'")
             return deleted_count
             
@@ -211,7 +433,7 @@ class ScriptsManager:
             return False, f"无法打开路线文件夹:{str(e)}"
         return True, f"已打开路线文件夹:{SCRIPT_PATH}"
 
-    def query_macro(self, name=None) -> list[MacroRecord] | MacroRecord | None:
+    def query_macro(self, name=None) -> list[ScriptEntry] | ScriptEntry | None:
         """
         查询宏
         
@@ -256,37 +478,8 @@ class ScriptsManager:
             return 0
         
         try:
-            target_filepath = []
-            for file in os.listdir(SCRIPT_PATH):
-                if not file.endswith(".json"):
-                    continue
-                
-                file_path = os.path.join(SCRIPT_PATH, file)
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        try:
-                            macro_data = json.load(f)
-                            # 检查宏名是否匹配
-                            if macro_data.get("info", {}).get("name") == macro_name:
-                                target_filepath.append(file_path)
-                        except (json.JSONDecodeError, KeyError, TypeError):
-                            # 跳过格式错误的文件
-                            continue
-                except Exception as e:
-                    logger.warning(f"Failed to read file {file}: {e}")
-                    continue
-            
-            # 删除成功后，重新初始化脚本字典
-            deleted_count = 0
-            for file_path in target_filepath:
-                try:
-                    os.remove(file_path)
-                    deleted_count += 1
-                except Exception as e:
-                    logger.warning(f"Failed to delete file {file_path}: {e}")
-                    continue
+            deleted_count = self._delete_scripts(macro_name, is_macro=True)
             if deleted_count > 0:
-                self.init_scripts_dict()
                 logger.info(f"Deleted {deleted_count} file(s) for macro '{macro_name}'")
             return deleted_count
             
@@ -307,4 +500,5 @@ class ScriptsManager:
             return False, f"无法打开宏文件夹:{str(e)}"
         return True, f"已打开宏文件夹:{SCRIPT_PATH}"
 
-scripts_manager = ScriptsManager()
\ No newline at end of file
+# 第一次使用时才读取脚本目录
+scripts_manager = LazySingleton('scripts_manager', ScriptsManager)
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import numpy as np
+from functools import lru_cache
 
 from whimbox.common.errors import *
 from whimbox.common.utils.utils import load_json
@@ -66,6 +67,16 @@ def asset_get_bbox(image, anchor=ANCHOR_TOP_LEFT, expand=False, black_offset=15)
     return AnchorPosi(x[0], y[0], x[-1] + 1, y[-1] + 1, anchor, expand)
 
 
+@lru_cache(maxsize=None)
+def _assets_file_index() -> dict:
+    """不在imgs_index.json中的素材按文件名查找，只遍历一次assets目录"""
+    index = {}
+    for root, dirs, files in os.walk(ASSETS_PATH):
+        for f in files:
+            index.setdefault(f, os.path.abspath(os.path.join(root, f)))
+    return index
+
+
 class AssetBase():
     def __init__(self, name: str, print_log:int=LOG_NONE) -> None:
         if name is None:
@@ -75,7 +86,8 @@ class AssetBase():
 
     def get_img_path(self):
         if self.name in ASSETS_INDEX_JSON:
-            return os.path.join(ASSETS_PATH, ASSETS_INDEX_JSON[self.name]['rel_path'])
+            # 索引中是windows路径，回放测试时可能在其他系统上运行
+            return os.path.join(ASSETS_PATH, ASSETS_INDEX_JSON[self.name]['rel_path'].replace('\\', os.sep))
         r = self.search_path(self.name)
         if r != None:
             return r
@@ -83,11 +95,10 @@ class AssetBase():
             raise IMG_NOT_FOUND(self.name)
 
     def search_path(self, filename) -> str:
+        files = _assets_file_index()
         for comp_filename in [filename + '.png', filename + '.jpg']:
-            folder_path = os.path.join(ASSETS_PATH)
-            for root, dirs, files in os.walk(folder_path):
-                if comp_filename in files:
-                    return os.path.abspath(os.path.join(root, comp_filename))
+            if comp_filename in files:
+                return files[comp_filename]
 
     def is_print_log(self, b: bool):
         if b:
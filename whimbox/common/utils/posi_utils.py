@@ -217,12 +217,8 @@ def area_cross_area(area1, area2, threshold=5):
 
 
 def linspace(point1, point2, num_points=5):
-    """获取两个点之间的n等分点"""
-    x_points = np.linspace(point1[0], point2[0], num_points)
-    y_points = np.linspace(point1[1], point2[1], num_points)
-    # 将x和y坐标合并成一个数组
-    points = np.array([x_points, y_points]).T
-    return points
+    """获取两个点之间的n等分点，返回(num_points, 2)的数组"""
+    return np.linspace(np.asarray(point1, dtype=np.float64)[:2], np.asarray(point2, dtype=np.float64)[:2], num_points)
 
 
 def euclidean_distance(p1, p2):
@@ -248,11 +244,9 @@ def euclidean_distance_plist(p1, plist) -> np.ndarray:
     Returns:
         np.ndarray: p1到plist的距离列表.
     """
-    if not isinstance(p1, np.ndarray):
-        p1 = np.array(p1)
-    if not isinstance(plist, np.ndarray):
-        plist = np.array(plist)
-    return np.sqrt((p1[0] - plist[:,0]) ** 2 + (p1[1] - plist[:,1]) ** 2)
+    p1 = np.asarray(p1)
+    plist = np.asarray(plist)
+    return np.hypot(p1[0] - plist[:,0], p1[1] - plist[:,1])
 
 
 def random_rectangle_point(area, n=3):
@@ -1,6 +1,6 @@
 
 import os, json
-import win32gui, win32process, psutil, ctypes
+import psutil, ctypes
 import numpy as np
 from collections import OrderedDict
 from typing import Union
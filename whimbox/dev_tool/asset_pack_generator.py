@@ -0,0 +1,37 @@
+'''把所有图片素材预处理后打包成一个文件，见ui/template/asset_pack.py。修改素材图片后重新运行'''
+
+import importlib
+import time
+
+from whimbox.common.lazy_singleton import LazySingleton
+from whimbox.ui.template.asset_pack import asset_pack, save_asset_pack, ASSET_PACK_PATH
+
+# 创建素材的模块，导入时会创建所有素材
+ASSET_MODULES = [
+    'whimbox.ui.ui_assets',
+    'whimbox.ui.material_icon_assets',
+]
+
+
+class AssetPackGenerator():
+    def collect(self):
+        # 不使用旧的素材包，全部从图片重新计算
+        asset_pack.enabled = False
+        for name in ASSET_MODULES:
+            module = importlib.import_module(name)
+            # 惰性创建的素材字典也要创建出来
+            for value in list(vars(module).values()):
+                if isinstance(value, LazySingleton):
+                    value.lazy_get()
+        assets = sorted(asset_pack.assets, key=lambda asset: asset.pack_key)
+        return [asset.pack_entry() for asset in assets]
+
+    def generate(self):
+        t = time.time()
+        entries = self.collect()
+        count = save_asset_pack(entries, ASSET_PACK_PATH)
+        print(f"{count} assets packed to {ASSET_PACK_PATH}, cost {round(time.time() - t, 2)}s")
+
+
+if __name__ == '__main__':
+    AssetPackGenerator().generate()
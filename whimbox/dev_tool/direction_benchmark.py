@@ -0,0 +1,97 @@
+'''角色朝向识别性能测试：在合成的旋转箭头上，对比旧的两级模板匹配和新的描述子查表的误差与耗时'''
+
+import time
+import numpy as np
+
+from whimbox.map.detection.minimap import MiniMap
+from whimbox.map.detection.map_assets import *
+from whimbox.map.detection.cvars import *
+from whimbox.map.detection.utils import *
+from whimbox.common.utils.posi_utils import area_pad
+
+
+def template_direction(minimap: MiniMap, image):
+    '''替换前的实现：先匹配ArrowRotateMap得到5度精度，再在ArrowRotateMapAll上逐度比较'''
+    image = minimap._get_minimap(image, DIRECTION_RADIUS)
+    image = color_similarity_2d(image, color=DIRECTION_SIMILARITY_COLOR)
+    area = area_pad(get_bbox(image, threshold=128), pad=-1)
+    image = crop(image, AnchorPosi(area[0], area[1], area[2], area[3]))
+
+    scale = DIRECTION_ROTATION_SCALE * DIRECTION_SEARCH_SCALE
+    mapping = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    result = cv2.matchTemplate(ArrowRotateMap.img, mapping, cv2.TM_CCOEFF_NORMED)
+    result = cv2.subtract(result, cv2.GaussianBlur(result, (5, 5), 0))
+    _, sim, _, loca = cv2.minMaxLoc(result)
+    loca = np.array(loca) / DIRECTION_SEARCH_SCALE // (DIRECTION_RADIUS * 2)
+    degree = int((loca[0] + loca[1] * 8) * 5)
+
+    def to_map(x):
+        return int((x * DIRECTION_RADIUS * 2 + DIRECTION_RADIUS) * POSITION_SEARCH_SCALE)
+
+    row = int(degree // 8) + 45
+    row = (row - 2, row + 3)
+    row = (to_map(row[0]) - 5, to_map(row[1]) + 5)
+    precise_map = ArrowRotateMapAll.img[row[0]:row[1], :]
+    result = cv2.matchTemplate(precise_map, mapping, cv2.TM_CCOEFF_NORMED)
+    result = cv2.subtract(result, cv2.GaussianBlur(result, (5, 5), 0))
+
+    def to_map(x):
+        return int((x * DIRECTION_RADIUS * 2) * POSITION_SEARCH_SCALE)
+
+    def get_precise_sim(d):
+        y, x = divmod(d, 8)
+        im = result[to_map(y):to_map(y + 1), to_map(x):to_map(x + 1)]
+        _, sim, _, _ = cv2.minMaxLoc(im)
+        return sim
+
+    precise = np.array([[get_precise_sim(_) for _ in range(24)]])
+    _, precise_loca = cubic_find_maximum(precise, precision=0.1)
+    direction = (degree // 8 * 8 - 8 + precise_loca[0]) % 360
+    return 360 - direction if direction > 180 else -direction
+
+
+def synthetic_screenshot(degree, rng, noise=4):
+    '''
+    在随机背景的小地图中心画一个旋转了degree度的箭头
+
+    Returns:
+        tuple[np.ndarray, float]: 1920x1080截图，update_direction应返回的朝向
+    '''
+    image = rng.integers(40, 120, (1080, 1920, 3)).astype(np.float32)
+    image = cv2.GaussianBlur(image, (9, 9), 0)
+    alpha = rotate_bound(MapAsset('ARROW').img, degree)[:, :, 0].astype(np.float32) / 255
+    h, w = alpha.shape
+    x, y = MINIMAP_CENTER[0] - w // 2, MINIMAP_CENTER[1] - h // 2
+    patch = image[y:y + h, x:x + w]
+    image[y:y + h, x:x + w] = patch * (1 - alpha[..., None]) + np.array(DIRECTION_SIMILARITY_COLOR) * alpha[..., None]
+    image += rng.normal(0, noise, image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    expected = degree % 360
+    return image, 360 - expected if expected > 180 else -expected
+
+
+def angle_error(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+def benchmark(count=200, seed=0):
+    rng = np.random.default_rng(seed)
+    samples = [synthetic_screenshot(degree, rng) for degree in rng.uniform(0, 360, count)]
+    minimap = MiniMap()
+    # 第一次调用时加载或生成朝向表，不计入耗时
+    minimap.update_direction(samples[0][0])
+
+    for name, func in [('template', lambda image: template_direction(minimap, image)),
+                       ('lookup', lambda image: minimap.update_direction(image))]:
+        errors, cost = [], []
+        for image, expected in samples:
+            t = time.perf_counter()
+            direction = func(image)
+            cost.append(time.perf_counter() - t)
+            errors.append(angle_error(direction, expected))
+        print(f"{name:8s} {np.mean(cost) * 1000:.3f} ms/frame, "
+              f"error mean {np.mean(errors):.2f}°, p95 {np.percentile(errors, 95):.2f}°, max {np.max(errors):.2f}°")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -3,6 +3,9 @@ import os
 from whimbox.map.detection.utils import *
 from whimbox.common.utils.img_utils import *
 from whimbox.map.detection.cvars import *
+from whimbox.map.detection import map_assets as map_assets_module
+from whimbox.map.detection.map_assets import MAP_ASSETS_DICT, regenerate_minimap_tables
+from whimbox.map.detection.tiled_map import split_map_tiles, get_map_tiles_npy_path
 
 
 def gen_luma_05x_0125x_map(org_map: MapAsset):
@@ -77,10 +80,42 @@ def gen_ArrowRotateMapAll(arrow: MapAsset, arrows_map):
     save_image(image, path)
 
 
+def gen_map_npy(map_asset: MapAsset, pyramid_scales=()):
+    '''
+    将地图图片及其金字塔转存为npy，运行时以memmap方式按需加载，免去启动时解码大图
+    '''
+    image = load_image(map_asset.path)
+    np.save(get_map_npy_path(map_asset.path), image)
+    for scale in pyramid_scales:
+        pyramid = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        np.save(get_map_npy_path(map_asset.path, scale), pyramid)
+
+
+def gen_map_tiles_npy(map_asset: MapAsset):
+    '''
+    将地图切成MAP_TILE_SIZE大小的tile后转存为npy，每个tile在文件中是连续的，供TiledMap按需读取
+    '''
+    image = load_image(map_asset.path)
+    np.save(get_map_tiles_npy_path(map_asset.path), split_map_tiles(image))
+
+
+def gen_all_map_npy():
+    for map_assets in MAP_ASSETS_DICT.values():
+        gen_map_npy(map_assets['luma_05x'], pyramid_scales=POSITION_PYRAMID_SCALES)
+        gen_map_npy(map_assets['luma_0125x'])
+        gen_map_npy(map_assets['mask_0125x'])
+        gen_map_tiles_npy(map_assets['luma_05x'])
+        gen_map_tiles_npy(map_assets['luma_0125x'])
+    # 小地图的表随安装包发布，保存到地图目录而不是运行时的缓存目录
+    map_assets_module.MINIMAP_TABLE_SAVE_FOLDER = map_assets_module.MINIMAP_TABLE_FOLDER
+    regenerate_minimap_tables()
+
+
 if __name__ == '__main__':
     Image.MAX_IMAGE_PIXELS = None
-    mapOrg = MapAsset('w01_v10')
-    gen_luma_05x_0125x_map(mapOrg)
+    # 地图原图不在仓库中，原图更新时再取消注释
+    # mapOrg = MapAsset('w01_v10')
+    # gen_luma_05x_0125x_map(mapOrg)
 
     # ARROW = MapAsset('ARROW')
     # arrows_map = gen_arrows_map(ARROW)
@@ -89,3 +124,6 @@ if __name__ == '__main__':
 
     # StartSeaMapOrg = MapAsset('w14000000_v2')
     # gen_luma_05x_0125x_map(StartSeaMapOrg)
+
+    # 地图图片更新后，重新生成npy。build.bat打包前会运行
+    gen_all_map_npy()
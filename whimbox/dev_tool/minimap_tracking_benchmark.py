@@ -0,0 +1,62 @@
+'''小地图定位性能测试：对比完整模板匹配和相位相关追踪的耗时与漂移'''
+
+import os
+import time
+import numpy as np
+
+from whimbox.interaction.interaction_core import itt
+from whimbox.interaction.replay_capture import load_recording, record_frames
+from whimbox.map.detection.minimap import MiniMap
+from whimbox.map.detection.cvars import *
+from whimbox.common.utils.posi_utils import euclidean_distance
+
+
+class BenchmarkMiniMap(MiniMap):
+    def verify_position(self, pos):
+        # 回放比录制时快得多，不做移动速度校验
+        return True
+
+
+def benchmark(frames, map_name, init_position):
+    '''
+    以每帧完整匹配的结果作为基准，统计追踪模式的漂移
+
+    Args:
+        frames (Sequence[np.ndarray]): 录制的游戏画面，见replay_capture.load_recording
+        map_name (str):
+        init_position (tuple): 第一帧的png地图坐标
+    '''
+    full_minimap = BenchmarkMiniMap()
+    full_minimap.map_name = map_name
+    full_minimap.init_position(init_position)
+    track_minimap = BenchmarkMiniMap()
+    track_minimap.map_name = map_name
+    track_minimap.init_position(init_position)
+    track_minimap.set_position_tracking(True)
+
+    full_cost, track_cost, drift = [], [], []
+    for i in range(len(frames)):
+        frame = frames[i]
+        t = time.perf_counter()
+        full_position = full_minimap.update_position(frame)
+        full_cost.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        track_position = track_minimap.track_position(frame)
+        track_cost.append(time.perf_counter() - t)
+
+        drift.append(euclidean_distance(full_position, track_position))
+
+    print(f"frames: {len(frames)}")
+    print(f"full match: {np.mean(full_cost) * 1000:.2f} ms/frame")
+    print(f"tracking:   {np.mean(track_cost) * 1000:.2f} ms/frame "
+          f"(full match every {POSITION_TRACK_FULL_INTERVAL} frames)")
+    print(f"drift: mean {np.mean(drift):.2f} px, max {np.max(drift):.2f} px")
+
+
+if __name__ == '__main__':
+    folder = os.path.join(os.getcwd(), 'minimap_frames')
+    # 先在游戏里跑一段路，录制画面
+    # record_frames(itt.capture, folder)
+    frames, _ = load_recording(folder)
+    benchmark(frames, MAP_NAME_MIRALAND, (3213 * 2, 2203 * 2))
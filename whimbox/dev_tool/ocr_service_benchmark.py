@@ -0,0 +1,51 @@
+'''OCR服务吞吐量测试：对比不同工作进程数下，整图识别和单行识别的吞吐量'''
+
+import os
+import time
+
+from whimbox.common.path_lib import ASSETS_PATH
+from whimbox.common.utils.img_utils import crop
+from whimbox.interaction.replay_capture import load_recording
+from whimbox.api.ocr_service import OcrService
+from whimbox.ui.ui_assets import AreaPageTitleFeature, AreaUITime
+
+
+def benchmark(frames, workers, rounds=5):
+    '''
+    Args:
+        frames (Sequence[np.ndarray]): 录制的游戏画面，见replay_capture.load_recording
+        workers (int): 工作进程数
+        rounds (int): 每帧重复提交的次数
+    '''
+    service = OcrService(os.path.join(ASSETS_PATH, 'rapidocr.yaml'), workers=workers)
+    try:
+        images = [frames[i][:, :, :3] for i in range(len(frames))]
+        lines = [crop(image, area.position) for image in images for area in [AreaPageTitleFeature, AreaUITime]]
+        # 预热，等所有工作进程加载完模型
+        for future in [service.submit_analyze(images[0]) for _ in range(workers)]:
+            future.result()
+
+        t = time.perf_counter()
+        futures = [service.submit_analyze(image) for _ in range(rounds) for image in images]
+        for future in futures:
+            future.result()
+        analyze_cost = time.perf_counter() - t
+
+        t = time.perf_counter()
+        futures = [service.submit_recognize(line) for _ in range(rounds) for line in lines]
+        for future in futures:
+            future.result()
+        recognize_cost = time.perf_counter() - t
+    finally:
+        service.shutdown()
+
+    print(f"workers: {workers}")
+    print(f"  analyze:   {len(images) * rounds / analyze_cost:.1f} frames/s")
+    print(f"  recognize: {len(lines) * rounds / recognize_cost:.1f} lines/s")
+
+
+if __name__ == '__main__':
+    folder = os.path.join(os.getcwd(), 'minimap_frames')
+    frames, _ = load_recording(folder)
+    for workers in [1, 2, 4]:
+        benchmark(frames, workers)
@@ -3,18 +3,48 @@ import time
 
 from whimbox.common import timer_module
 import numpy as np
-import win32ui
 import cv2
-import win32gui
 import ctypes
 from whimbox.common.logger import logger
 from whimbox.common.cvars import DEBUG_MODE
+from whimbox.common.utils.img_utils import crop
+from whimbox.common.utils.asset_utils import AnchorPosi
+
+
+class FrameLease():
+    """
+    对缓冲环中一块缓冲的租约。截图返回的只读视图都由它派生，numpy的视图会一直引用它，
+    最后一个视图释放时租约结束，缓冲才可以被之后的截图覆盖
+    """
+
+    def __init__(self, capture_obj, buffer: np.ndarray):
+        self._capture_obj = capture_obj
+        self._buffer = buffer
+        interface = dict(buffer.__array_interface__)
+        interface['data'] = (interface['data'][0], True)
+        self.__array_interface__ = interface
+        capture_obj._acquire_buffer(buffer)
+
+    def __del__(self):
+        self._capture_obj._release_buffer(self._buffer)
 
 
 class Capture():
     def __init__(self, hwnd_handler):
         self.hwnd_handler = hwnd_handler
-        self.capture_cache = np.zeros_like((1080,1920,3), dtype="uint8")
+        # 预分配的截图缓冲环，每次截图写入下一个缓冲，不再重复申请整帧内存
+        # 还有租约的缓冲不会被覆盖，会换一块新的，所以视图在被引用期间一直有效
+        self.frame_ring_size = 4
+        self.frame_ring = [None] * self.frame_ring_size
+        # id(缓冲) -> 租约数，见FrameLease
+        self._buffer_leases = {}
+        # 租约可能在任意位置随视图释放，包括持有这个锁的时候
+        self._buffer_leases_lock = threading.RLock()
+        # 非1080p分辨率的原始截图，缩放后写入缓冲环
+        self._raw_buffer = None
+        self.frame_seq = 0
+        self.capture_cache = np.zeros((1080,1920,4), dtype="uint8")
+        self.capture_cache.flags.writeable = False
         self.resolution = None
         self.max_fps = 30
         self.fps_timer = timer_module.Timer(diff_start_time=1)
@@ -34,8 +64,8 @@ class Capture():
             else:
                 new_width = 1920
                 new_height = int(1920 / self.resolution[1] * self.resolution[0])
-                new_img = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_NEAREST)
-                return new_img
+                buffer = self._next_ring_buffer((new_height, new_width, img.shape[2]))
+                return cv2.resize(img, (new_width, new_height), dst=buffer, interpolation=cv2.INTER_NEAREST)
         else:
             self.resolution = None
             return None
@@ -43,17 +73,61 @@ class Capture():
     def _get_capture(self) -> np.ndarray:
         """
         需要根据不同截图方法实现该函数。
+        可以通过_next_buffer获取缓冲，直接写入，避免额外的复制。
+        """
+
+    def _next_buffer(self, shape) -> np.ndarray:
+        """
+        获取截图写入的缓冲。1080p直接写入缓冲环，其他分辨率写入临时缓冲，缩放时再写入缓冲环
+
+        Args:
+            shape (tuple): (height, width, channel)
+        """
+        if shape == (1080, 1920, 4):
+            return self._next_ring_buffer(shape)
+        if self._raw_buffer is None or self._raw_buffer.shape != shape:
+            self._raw_buffer = np.empty(shape, dtype=np.uint8)
+        return self._raw_buffer
+
+    def _acquire_buffer(self, buffer):
+        with self._buffer_leases_lock:
+            self._buffer_leases[id(buffer)] = self._buffer_leases.get(id(buffer), 0) + 1
+
+    def _release_buffer(self, buffer):
+        with self._buffer_leases_lock:
+            count = self._buffer_leases.get(id(buffer), 0) - 1
+            if count > 0:
+                self._buffer_leases[id(buffer)] = count
+            else:
+                self._buffer_leases.pop(id(buffer), None)
+
+    def _is_leased(self, buffer) -> bool:
+        with self._buffer_leases_lock:
+            return self._buffer_leases.get(id(buffer), 0) > 0
+
+    def _next_ring_buffer(self, shape) -> np.ndarray:
+        """
+        获取缓冲环中下一帧的可写缓冲，形状不同或者还有租约时重新分配
         """
+        index = (self.frame_seq + 1) % self.frame_ring_size
+        buffer = self.frame_ring[index]
+        # 有租约的缓冲被FrameLease引用，id不会被新分配的缓冲复用
+        if buffer is None or buffer.shape != shape or self._is_leased(buffer):
+            buffer = np.empty(shape, dtype=np.uint8)
+            self.frame_ring[index] = buffer
+        return buffer
     
     def _check_shape(self, img:np.ndarray):
         return True
         
-    def capture(self, force=False) -> np.ndarray:
+    def capture(self, force=False, region: AnchorPosi = None, copy=True) -> np.ndarray:
         """
         供外部调用的截图接口
 
         Args:
             force: 无视帧率限制，强制截图
+            region: 截图区域，只复制该区域，None为全屏
+            copy: 为False时返回缓冲的只读视图，视图及其派生的视图被引用期间缓冲不会被之后的截图覆盖
         """
         if DEBUG_MODE:
             r = self.cap_per_sec.count_times()
@@ -69,8 +143,24 @@ class Capture():
                     logger.info(f"capps: {r/3}")
         with self.capture_cache_lock:
             self._capture(force)
-            cp = self.capture_cache.copy()
-        return cp
+            frame = self.capture_cache
+            if region is not None:
+                return crop(frame, region, copy=copy)
+            elif copy:
+                return frame.copy()
+            else:
+                return frame
+
+    def get_frame_view(self, force=False):
+        """
+        获取最新一帧的只读视图和帧序号，不复制，视图被引用期间缓冲不会被之后的截图覆盖
+
+        Returns:
+            tuple[int, np.ndarray]: 帧序号，只读视图
+        """
+        with self.capture_cache_lock:
+            self._capture(force)
+            return self.frame_seq, self.capture_cache
     
     def _capture(self, force) -> None:
         if (self.fps_timer.get_diff_time() >= 1/self.max_fps) or force:
@@ -78,13 +168,35 @@ class Capture():
             self.capture_times += 1
             normalized_img = self._normalize_shape(self._get_capture())
             if normalized_img is not None:
-                self.capture_cache = normalized_img
+                self.frame_seq += 1
+                self.frame_ring[self.frame_seq % self.frame_ring_size] = normalized_img
+                # 从capture_cache派生的视图都持有这一帧的租约
+                self.capture_cache = np.asarray(FrameLease(self, normalized_img))
 
     
 class PrintWindowCapture(Capture):
     def __init__(self, hwnd_handler):
         super().__init__(hwnd_handler)
         self.max_fps = 30
+        # 窗口大小不变时复用DC和位图
+        self._gdi_key = None
+        self._gdi_objs = None
+
+    def _release_gdi(self):
+        if self._gdi_objs is None:
+            return
+        import win32gui
+        hwnd = self._gdi_key[0]
+        hdc_window, hdc_mem, hdc_compat, bmp = self._gdi_objs
+        self._gdi_key = None
+        self._gdi_objs = None
+        try:
+            win32gui.DeleteObject(bmp.GetHandle())
+            hdc_compat.DeleteDC()
+            hdc_mem.DeleteDC()
+            win32gui.ReleaseDC(hwnd, hdc_window)
+        except Exception as e:
+            logger.debug(f"释放截图资源失败: {e}")
 
     def _check_shape(self, img:np.ndarray):
         if img.shape[2] == 4 and img.shape[1] > 0 and 1.55<img.shape[1]/img.shape[0]<1.80:
@@ -96,33 +208,35 @@ class PrintWindowCapture(Capture):
             return False
 
     def _get_capture(self):
+        import win32gui, win32ui
         hwnd = self.hwnd_handler.get_handle()
         left, top, right, bottom = win32gui.GetClientRect(hwnd)
         width = right - left
         height = bottom - top
 
-        hdc_window = win32gui.GetWindowDC(hwnd)
-        hdc_mem = win32ui.CreateDCFromHandle(hdc_window)
-        hdc_compat = hdc_mem.CreateCompatibleDC()
-
-        bmp = win32ui.CreateBitmap()
-        bmp.CreateCompatibleBitmap(hdc_mem, width, height)
-        hdc_compat.SelectObject(bmp)
+        if self._gdi_key != (hwnd, width, height):
+            self._release_gdi()
+            hdc_window = win32gui.GetWindowDC(hwnd)
+            hdc_mem = win32ui.CreateDCFromHandle(hdc_window)
+            hdc_compat = hdc_mem.CreateCompatibleDC()
+            bmp = win32ui.CreateBitmap()
+            bmp.CreateCompatibleBitmap(hdc_mem, width, height)
+            hdc_compat.SelectObject(bmp)
+            self._gdi_key = (hwnd, width, height)
+            self._gdi_objs = (hdc_window, hdc_mem, hdc_compat, bmp)
+        hdc_window, hdc_mem, hdc_compat, bmp = self._gdi_objs
 
         result = ctypes.windll.user32.PrintWindow(hwnd, hdc_compat.GetSafeHdc(), 3)
 
+        # 直接把位图数据写入缓冲环
         bmpinfo = bmp.GetInfo()
-        bmpstr = bmp.GetBitmapBits(True)
-        img = np.frombuffer(bmpstr, dtype=np.uint8)
-        img.shape = (bmpinfo['bmHeight'], bmpinfo['bmWidth'], 4)
-
-        win32gui.DeleteObject(bmp.GetHandle())
-        hdc_compat.DeleteDC()
-        hdc_mem.DeleteDC()
-        win32gui.ReleaseDC(hwnd, hdc_window)
-        
+        img = self._next_buffer((bmpinfo['bmHeight'], bmpinfo['bmWidth'], 4))
+        ctypes.windll.gdi32.GetBitmapBits(bmp.GetHandle(), img.nbytes, img.ctypes.data)
         return img
 
+    def __del__(self):
+        self._release_gdi()
+
 
 if __name__ == '__main__':
     c = PrintWindowCapture()
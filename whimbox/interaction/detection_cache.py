@@ -0,0 +1,62 @@
+import threading
+
+from whimbox.common.utils.asset_utils import AnchorPosi
+
+
+def posi_key(anchor_posi: AnchorPosi):
+    """AnchorPosi转为可以作为字典键的元组"""
+    if anchor_posi is None:
+        return None
+    return (anchor_posi.x1, anchor_posi.y1, anchor_posi.x2, anchor_posi.y2, anchor_posi.anchor, anchor_posi.expand)
+
+
+class FrameResultCache:
+    """
+    按帧缓存识别结果。
+
+    同一帧上重复的模板匹配和OCR直接返回缓存，键为(检测类型, 素材, 裁剪区域, 预处理参数)。
+    截图产生新帧后，旧帧的结果全部清空。
+    """
+
+    def __init__(self):
+        self.frame_seq = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, frame_seq, key):
+        """
+        Returns:
+            缓存的结果，没有时返回None
+        """
+        with self._lock:
+            if frame_seq != self.frame_seq:
+                self.misses += 1
+                return None
+            ret = self._cache.get(key)
+            if ret is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return ret
+
+    def set(self, frame_seq, key, value):
+        with self._lock:
+            if frame_seq != self.frame_seq:
+                # 旧帧的结果没用了，只保留更新的帧
+                if self.frame_seq is not None and frame_seq < self.frame_seq:
+                    return
+                self.frame_seq = frame_seq
+                self._cache.clear()
+            self._cache[key] = value
+
+    def cache_info(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate, 'size': len(self._cache)}
+
+    def clear(self):
+        with self._lock:
+            self.frame_seq = None
+            self._cache.clear()
@@ -0,0 +1,157 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from whimbox.interaction.interaction_core import itt
+from whimbox.ui.template import img_manager
+from whimbox.common.utils.asset_utils import AnchorPosi
+from whimbox.common.utils.img_utils import crop
+from whimbox.interaction.detection_cache import posi_key
+
+
+class Frame:
+    """
+    一次截图，以及基于它惰性计算的派生图像（裁剪、灰度、HSV等）。
+
+    派生图像按区域缓存，同一帧上的多个检测器共享一次截图和每个区域的一次颜色转换。
+    可以在多个线程中同时使用。
+    """
+
+    def __init__(self, image, timestamp=None):
+        self.image = image
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._cache = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key, func):
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 每个key单独加锁，不同区域的计算可以并行，同一区域只计算一次
+        with key_lock:
+            with self._lock:
+                if key in self._cache:
+                    return self._cache[key]
+            value = func()
+            with self._lock:
+                self._cache[key] = value
+            return value
+
+    def crop(self, anchor_posi: AnchorPosi = None):
+        """
+        Args:
+            anchor_posi: 裁剪区域，None为整张截图
+
+        Returns:
+            np.ndarray: 不要原地修改
+        """
+        if anchor_posi is None:
+            return self.image
+        return self._cached(('crop', posi_key(anchor_posi)), lambda: crop(self.image, anchor_posi))
+
+    def gray(self, anchor_posi: AnchorPosi = None):
+        return self._cached(
+            ('gray', posi_key(anchor_posi)),
+            lambda: cv2.cvtColor(self.crop(anchor_posi), cv2.COLOR_BGRA2GRAY))
+
+    def hsv(self, anchor_posi: AnchorPosi = None):
+        return self._cached(
+            ('hsv', posi_key(anchor_posi)),
+            lambda: cv2.cvtColor(self.crop(anchor_posi), cv2.COLOR_BGR2HSV))
+
+    def gray_limit(self, anchor_posi: AnchorPosi, gray_limit):
+        """等价于对裁剪区域做灰度阈值处理"""
+        def func():
+            _, image = cv2.threshold(self.gray(anchor_posi), gray_limit[0], gray_limit[1], cv2.THRESH_BINARY)
+            return image
+        return self._cached(('gray_limit', posi_key(anchor_posi), tuple(gray_limit)), func)
+
+    def hsv_limit(self, anchor_posi: AnchorPosi, hsv_limit):
+        """等价于对裁剪区域做img_utils.process_with_hsv_limit"""
+        lower, upper = hsv_limit
+        return self._cached(
+            ('hsv_limit', posi_key(anchor_posi), tuple(lower), tuple(upper)),
+            lambda: cv2.inRange(self.hsv(anchor_posi), np.array(lower), np.array(upper)))
+
+    def icon_cap(self, imgicon: img_manager.ImgIcon, anchor_posi: AnchorPosi = None):
+        """
+        按imgicon的hsv_limit或gray_limit预处理后的裁剪区域
+
+        Args:
+            imgicon:
+            anchor_posi: 裁剪区域，默认为imgicon.cap_posi
+        """
+        if anchor_posi is None:
+            anchor_posi = imgicon.cap_posi
+        if imgicon.hsv_limit is not None:
+            return self.hsv_limit(anchor_posi, imgicon.hsv_limit)
+        elif imgicon.gray_limit is not None:
+            return self.gray_limit(anchor_posi, imgicon.gray_limit)
+        return self.crop(anchor_posi)
+
+    def get_img_existence(self, imgicon: img_manager.ImgIcon, anchor_posi: AnchorPosi = None, **kwargs):
+        """在这一帧上检测图片是否存在，参数同itt.get_img_existence"""
+        cap = self.icon_cap(imgicon, anchor_posi)
+        return itt.get_img_existence(imgicon, cap=cap, is_preprocessed=True, **kwargs)
+
+
+class FramePipeline:
+    """
+    单次截图、多检测器的画面处理流水线。
+
+    检测器是以Frame为参数的函数，注册后在同一帧上并行执行。
+    OpenCV在计算时会释放GIL，所以用线程池就能并行。
+    """
+
+    def __init__(self, max_workers=4):
+        self.detectors = {}
+        self.max_workers = max_workers
+        self._executor = None
+
+    def register(self, name, detector):
+        """
+        Args:
+            name (str): 检测器名称
+            detector (callable): detector(frame: Frame) -> 检测结果
+        """
+        self.detectors[name] = detector
+
+    def unregister(self, name):
+        self.detectors.pop(name, None)
+
+    def capture(self) -> Frame:
+        # 截图缓冲的只读视图，派生图像都是复制出来的，不会受之后截图的影响
+        return Frame(itt.capture(copy=False))
+
+    def run(self, frame: Frame = None, names=None) -> dict:
+        """
+        在一帧上执行检测器
+
+        Args:
+            frame: 为None时重新截图
+            names (list[str]): 要执行的检测器，None为全部
+
+        Returns:
+            dict: 检测器名称 -> 检测结果
+        """
+        if frame is None:
+            frame = self.capture()
+        if names is None:
+            names = list(self.detectors.keys())
+        if len(names) <= 1:
+            return {name: self.detectors[name](frame) for name in names}
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='FramePipeline')
+        futures = {name: self._executor.submit(self.detectors[name], frame) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -5,7 +5,8 @@ import threading
 import time
 import cv2
 import os
-import ctypes
+from contextlib import contextmanager
+from concurrent.futures import Future
 
 from whimbox.ui.template import img_manager, text_manager, posi_manager
 from whimbox.common.timer_module import TimeoutTimer, AdvanceTimer
@@ -16,6 +17,10 @@ from whimbox.common.utils.img_utils import crop, process_with_hsv_limit, similar
 from whimbox.config.config import global_config
 from whimbox.ui.ui_assets import IconShopFeature, IconGachaFeature
 from whimbox.common.utils.asset_utils import AnchorPosi
+from whimbox.interaction.detection_cache import FrameResultCache, posi_key
+from whimbox.interaction.stability import ScreenStabilityDetector
+from whimbox.api.ocr_service import done_future, chain_future
+from whimbox.common.lazy_singleton import LazySingleton
 
 ocr_type = global_config.get('General', 'ocr')
 if ocr_type == 'rapid':
@@ -24,40 +29,37 @@ else:
     raise ValueError(f"ocr配置错误：{ocr_type}")
 
 
-GetDC = ctypes.windll.user32.GetDC
-CreateCompatibleDC = ctypes.windll.gdi32.CreateCompatibleDC
-GetClientRect = ctypes.windll.user32.GetClientRect
-CreateCompatibleBitmap = ctypes.windll.gdi32.CreateCompatibleBitmap
-SelectObject = ctypes.windll.gdi32.SelectObject
-BitBlt = ctypes.windll.gdi32.BitBlt
-SRCCOPY = 0x00CC0020
-GetBitmapBits = ctypes.windll.gdi32.GetBitmapBits
-DeleteObject = ctypes.windll.gdi32.DeleteObject
-ReleaseDC = ctypes.windll.user32.ReleaseDC
-PostMessageW = ctypes.windll.user32.PostMessageW
-MapVirtualKeyW = ctypes.windll.user32.MapVirtualKeyW
-
-
 class InteractionBGD:
     """
     thanks for https://zhuanlan.zhihu.com/p/361569101
     """
 
-    def __init__(self, hwnd_handler):
+    def __init__(self, hwnd_handler, capture_obj=None, itt_exec=None):
+        """
+        Args:
+            hwnd_handler: 窗口句柄管理
+            capture_obj (Capture, optional): 截图方式，默认为PrintWindowCapture
+            itt_exec (InteractionTemplate, optional): 键鼠操作方式，默认为InteractionNormal
+        """
         self.hwnd_handler = hwnd_handler
         logger.info("InteractionBGD created")
         self.WHEEL_DELTA = 120
         self.DEFAULT_DELAY_TIME = 0.05
-        self.itt_exec = None
-        self.capture_obj = None
+        self.itt_exec = itt_exec
+        self.capture_obj = capture_obj
         self.operation_lock = threading.Lock()
-        import whimbox.interaction.interaction_normal
-        self.itt_exec = whimbox.interaction.interaction_normal.InteractionNormal(self.hwnd_handler)
-        from whimbox.interaction.capture import PrintWindowCapture
-        self.capture_obj = PrintWindowCapture(self.hwnd_handler)
-
-
-    def capture(self, anchor_posi: AnchorPosi=None, jpgmode=NORMAL_CHANNELS):
+        if self.itt_exec is None:
+            import whimbox.interaction.interaction_normal
+            self.itt_exec = whimbox.interaction.interaction_normal.InteractionNormal(self.hwnd_handler)
+        if self.capture_obj is None:
+            from whimbox.interaction.capture import PrintWindowCapture
+            self.capture_obj = PrintWindowCapture(self.hwnd_handler)
+        # 同一帧上重复的识别直接使用缓存结果
+        self.detect_cache = FrameResultCache()
+        self._held_frame = threading.local()
+
+
+    def capture(self, anchor_posi: AnchorPosi=None, jpgmode=NORMAL_CHANNELS, copy=True):
         """窗口客户区截图
 
         Args:
@@ -66,14 +68,14 @@ class InteractionBGD:
                 0:return jpg (3 channels, delete the alpha channel)
                 1:return nikki background channel, background color is black
                 2:return nikki ui channel, background color is black
+            copy (bool): 为False时返回截图缓冲的只读视图，不复制，视图被引用期间缓冲不会被覆盖
 
         Returns:
             numpy.ndarray: 图片数组
         """
 
-        ret = self.capture_obj.capture()
-        if anchor_posi is not None:
-            ret = crop(ret, anchor_posi)
+        # 只复制需要的区域
+        ret = self.capture_obj.capture(region=anchor_posi, copy=copy)
         if ret.shape[2]==3:
             pass
         elif jpgmode == NORMAL_CHANNELS:
@@ -83,39 +85,135 @@ class InteractionBGD:
         return ret
 
 
-    def ocr_single_line(self, area: posi_manager.Area, padding=50, hsv_limit=None) -> str:
-        cap = self.capture(anchor_posi = area.position)
+    def get_frame_view(self):
+        """
+        最新一帧的帧序号和只读视图，在hold_frame中时为持有的帧
+
+        Returns:
+            tuple[int, numpy.ndarray]:
+        """
+        held = getattr(self._held_frame, 'frame', None)
+        if held is not None:
+            return held
+        return self.capture_obj.get_frame_view()
+
+    @contextmanager
+    def hold_frame(self):
+        """with中当前线程的识别都使用同一帧截图，共用识别缓存"""
+        if getattr(self._held_frame, 'frame', None) is not None:
+            yield
+            return
+        # 视图持有缓冲的租约，持有期间截图缓冲不会被覆盖，不需要复制
+        self._held_frame.frame = self.capture_obj.get_frame_view()
+        try:
+            yield
+        finally:
+            self._held_frame.frame = None
+
+    def _crop_frame(self, frame, anchor_posi: AnchorPosi=None):
+        """从get_frame_view得到的帧中截取区域，结果同capture()"""
+        if anchor_posi is not None:
+            frame = crop(frame, anchor_posi)
+        else:
+            frame = frame.copy()
+        if frame.shape[2] == 4:
+            frame = frame[:, :, :3]
+        return frame
+
+    def _cache_future_result(self, future, frame_seq, cache_key):
+        """future完成后把结果写入识别缓存"""
+        def callback(f):
+            if f.exception() is None:
+                self.detect_cache.set(frame_seq, cache_key, f.result())
+        future.add_done_callback(callback)
+        return future
+
+    def ocr_single_line_async(self, area: posi_manager.Area, padding=50, hsv_limit=None, rec_only=False) -> Future:
+        """
+        截图后立即返回，OCR结果通过Future获取
+
+        Args:
+            area: 文字区域
+            padding: 检测文字前四周填充的像素
+            hsv_limit: 先按HSV颜色范围处理
+            rec_only: 区域紧贴单行文字时，跳过文字检测和padding，只做识别
+
+        Returns:
+            Future[str]:
+        """
+        frame_seq, frame = self.get_frame_view()
+        cache_key = ('ocr_single_line', posi_key(area.position), padding, str(hsv_limit), rec_only)
+        res = self.detect_cache.get(frame_seq, cache_key)
+        if res is not None:
+            return done_future(res)
+        cap = self._crop_frame(frame, area.position)
         if hsv_limit:
             cap = process_with_hsv_limit(cap, hsv_limit[0], hsv_limit[1])
-        if padding:
-            cap = add_padding(cap, padding)
-        res = ocr.get_all_texts(cap, mode=1)
-        return res
+        if rec_only:
+            future = ocr.get_all_texts_async(cap, mode=1, rec_only=True)
+        else:
+            if padding:
+                cap = add_padding(cap, padding)
+            future = ocr.get_all_texts_async(cap, mode=1)
+        return self._cache_future_result(future, frame_seq, cache_key)
 
-    def ocr_multiple_lines(self, area: posi_manager.Area, padding=50, hsv_limit=None) -> list:
-        cap = self.capture(anchor_posi = area.position)
+    def ocr_single_line(self, area: posi_manager.Area, padding=50, hsv_limit=None, rec_only=False) -> str:
+        """参数同ocr_single_line_async"""
+        return self.ocr_single_line_async(area, padding=padding, hsv_limit=hsv_limit, rec_only=rec_only).result()
+
+    def ocr_multiple_lines_async(self, area: posi_manager.Area, padding=50, hsv_limit=None) -> Future:
+        """
+        Returns:
+            Future[list[str]]:
+        """
+        frame_seq, frame = self.get_frame_view()
+        cache_key = ('ocr_multiple_lines', posi_key(area.position), padding, str(hsv_limit))
+        res = self.detect_cache.get(frame_seq, cache_key)
+        if res is not None:
+            return done_future(list(res))
+        cap = self._crop_frame(frame, area.position)
         if hsv_limit:
             cap = process_with_hsv_limit(cap, hsv_limit[0], hsv_limit[1])
         if padding:
             cap = add_padding(cap, padding)
-        res = ocr.get_all_texts(cap, mode=0)
-        return res
+        future = self._cache_future_result(ocr.get_all_texts_async(cap, mode=0), frame_seq, cache_key)
+        return chain_future(future, list)
 
-    def ocr_and_detect_posi(self, area: posi_manager.Area, padding=50, hsv_limit=None):
-        cap = self.capture(anchor_posi=area.position)
+    def ocr_multiple_lines(self, area: posi_manager.Area, padding=50, hsv_limit=None) -> list:
+        return self.ocr_multiple_lines_async(area, padding=padding, hsv_limit=hsv_limit).result()
+
+    def ocr_and_detect_posi_async(self, area: posi_manager.Area, padding=50, hsv_limit=None) -> Future:
+        """
+        Returns:
+            Future[dict]: 文字 -> 在区域中的[x1, y1, x2, y2]
+        """
+        frame_seq, frame = self.get_frame_view()
+        cache_key = ('ocr_and_detect_posi', posi_key(area.position), padding, str(hsv_limit))
+        res = self.detect_cache.get(frame_seq, cache_key)
+        if res is not None:
+            return done_future(dict(res))
+        cap = self._crop_frame(frame, area.position)
         if hsv_limit:
             cap = process_with_hsv_limit(cap, hsv_limit[0], hsv_limit[1])
         if padding:
             cap = add_padding(cap, padding)
-        res = ocr.detect_and_ocr(cap)
-        if padding:
-            for text, box in res.items():
-                res[text] = [
+
+        def remove_padding(res):
+            if padding:
+                res = {text: [
                     box[0] - padding, 
                     box[1] - padding, 
                     box[2] - padding, 
-                    box[3] - padding]
-        return res
+                    box[3] - padding] for text, box in res.items()}
+            return res
+
+        # 缓存去掉padding后的结果，调用方拿到的是副本
+        future = self._cache_future_result(chain_future(ocr.detect_and_ocr_async(cap), remove_padding),
+                                           frame_seq, cache_key)
+        return chain_future(future, dict)
+
+    def ocr_and_detect_posi(self, area: posi_manager.Area, padding=50, hsv_limit=None):
+        return self.ocr_and_detect_posi_async(area, padding=padding, hsv_limit=hsv_limit).result()
 
 
     # def get_img_position(self, imgicon: img_manager.ImgIcon) -> list:
@@ -132,26 +230,38 @@ class InteractionBGD:
     #         return None
 
 
-    def get_img_existence(self, imgicon: img_manager.ImgIcon, is_gray=False, ret_mode = IMG_BOOL, show_res = False, cap = None):
+    def get_img_existence(self, imgicon: img_manager.ImgIcon, is_gray=False, ret_mode = IMG_BOOL, show_res = False, cap = None, is_preprocessed=False):
         """检测图片是否存在
 
         Args:
             imgicon (img_manager.ImgIcon): imgicon对象
             is_gray (bool, optional): 是否启用灰度匹配. Defaults to False.
             is_log (bool, optional): 是否打印日志. Defaults to False.
+            is_preprocessed (bool, optional): cap是否已经按hsv_limit或gray_limit处理过. Defaults to False.
 
         Returns:
             bool: bool
         """
         upper_func_name = inspect.getframeinfo(inspect.currentframe().f_back)[2]
+        # 只缓存自己截图的结果，传入的cap不一定来自最新一帧
+        frame_seq, cache_key, matching_rate = None, None, None
         if cap is None:
-            cap = self.capture(anchor_posi=imgicon.cap_posi)
-        if imgicon.hsv_limit is not None:
-            cap = process_with_hsv_limit(cap, imgicon.hsv_limit[0], imgicon.hsv_limit[1])
-        elif imgicon.gray_limit is not None:
-            cap = cv2.cvtColor(cap, cv2.COLOR_BGRA2GRAY)
-            _, cap = cv2.threshold(cap, imgicon.gray_limit[0], imgicon.gray_limit[1], cv2.THRESH_BINARY)
-        matching_rate = similar_img(cap, imgicon.image, is_gray=is_gray, is_show_res=show_res)
+            frame_seq, frame = self.get_frame_view()
+            cache_key = ('img', id(imgicon), posi_key(imgicon.cap_posi), is_gray)
+            matching_rate = self.detect_cache.get(frame_seq, cache_key)
+            if matching_rate is None:
+                cap = self._crop_frame(frame, imgicon.cap_posi)
+        if matching_rate is None:
+            if is_preprocessed:
+                pass
+            elif imgicon.hsv_limit is not None:
+                cap = process_with_hsv_limit(cap, imgicon.hsv_limit[0], imgicon.hsv_limit[1])
+            elif imgicon.gray_limit is not None:
+                cap = cv2.cvtColor(cap, cv2.COLOR_BGRA2GRAY)
+                _, cap = cv2.threshold(cap, imgicon.gray_limit[0], imgicon.gray_limit[1], cv2.THRESH_BINARY)
+            matching_rate = similar_img(cap, imgicon.image, is_gray=is_gray, is_show_res=show_res)
+            if cache_key is not None:
+                self.detect_cache.set(frame_seq, cache_key, matching_rate)
 
         if imgicon.is_print_log(matching_rate >= imgicon.threshold):
             logger.trace(
@@ -175,10 +285,18 @@ class InteractionBGD:
 
 
     def get_text_existence(self, textobj: text_manager.TextTemplate, ret_mode=IMG_BOOL, cap=None):
-        if cap == None:
-            cap = self.capture(anchor_posi=textobj.cap_area.position)
-        cap = add_padding(cap, 50)
-        res = ocr.get_all_texts(cap)
+        if cap is None:
+            # 同一区域的OCR结果可以给不同的文字模板共用
+            frame_seq, frame = self.get_frame_view()
+            cache_key = ('text', posi_key(textobj.cap_area.position))
+            res = self.detect_cache.get(frame_seq, cache_key)
+            if res is None:
+                cap = add_padding(self._crop_frame(frame, textobj.cap_area.position), 50)
+                res = ocr.get_all_texts(cap)
+                self.detect_cache.set(frame_seq, cache_key, res)
+        else:
+            cap = add_padding(cap, 50)
+            res = ocr.get_all_texts(cap)
         is_exist = textobj.match_results(res)
         if textobj.is_print_log(is_exist):
             logger.trace(f"get_text_existence: text: {textobj.text} {'Found' if is_exist else 'Not Found'}")
@@ -234,27 +352,30 @@ class InteractionBGD:
             return False
                 
 
-    def wait_until_stable(self, threshold = 0.9995, timeout = 10):
-        timeout_timer = TimeoutTimer(timeout)
-        last_cap = self.capture()
-
-        pt = time.time()
-        t = AdvanceTimer(0.25, 3).start()
-        while 1:
-            time.sleep(0.1)
-            if timeout_timer.istimeout():
-                logger.warning("TIMEOUT")
-                break
-            curr_img = self.capture()
-            simi = similar_img(last_cap, curr_img)# abs((last_cap.astype(int)-curr_img.astype(int))).sum()
-            if simi > threshold:
-                pass
-            else:
-                t.reset()
-            if t.reached():
-                if DEBUG_MODE: print('wait time: ', time.time()-pt)
-                break
-            last_cap = curr_img.copy()
+    def wait_until_stable(self, threshold = 0.9995, timeout = 10, area: AnchorPosi=None):
+        """等待画面稳定
+
+        Args:
+            threshold (float): 和稳定窗口第一帧相似度的阈值
+            timeout (float): 超时时间
+            area (AnchorPosi, optional): 只检测这个区域
+
+        Returns:
+            float: 等待的时间，超时为None
+        """
+        # 不使用hold_frame持有的帧，要等新的截图
+        latency = ScreenStabilityDetector(threshold, area=area).run(self.capture_obj.get_frame_view, timeout)
+        if DEBUG_MODE and latency is not None: print('wait time: ', latency)
+        return latency
+
+    def wait_until_stable_async(self, threshold = 0.9995, timeout = 10, area: AnchorPosi=None, callback=None):
+        """在后台线程中等待画面稳定
+
+        Returns:
+            ScreenStabilityDetector: 用wait()等待结果，或者结束时调用callback(latency)，超时latency为None
+        """
+        detector = ScreenStabilityDetector(threshold, area=area, callback=callback)
+        return detector.start(self.capture_obj.get_frame_view, timeout)
 
 
     def delay(self, x, randtime=False, is_log=True, comment=''):
@@ -492,8 +613,18 @@ class InteractionBGD:
         logger.warning(f"Snapshot saved to {img_path}")
         cv2.imwrite(img_path, img)        
 
-from whimbox.common.handle_lib import HANDLE_OBJ
-itt = InteractionBGD(HANDLE_OBJ)
+def _create_itt():
+    from whimbox.common.handle_lib import HANDLE_OBJ
+    if REPLAY_SOURCE:
+        from whimbox.interaction.replay_capture import ReplayCapture, ReplayInteraction
+        return InteractionBGD(
+            HANDLE_OBJ,
+            capture_obj=ReplayCapture(HANDLE_OBJ, REPLAY_SOURCE, realtime=REPLAY_REALTIME),
+            itt_exec=ReplayInteraction())
+    return InteractionBGD(HANDLE_OBJ)
+
+# 第一次使用时才创建，见LazySingleton
+itt = LazySingleton('itt', _create_itt)
 
 
 if __name__ == '__main__':
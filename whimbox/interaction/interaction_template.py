@@ -1,7 +1,6 @@
 import string
 from whimbox.interaction.vkcode import VK_CODE
 import ctypes
-VkKeyScanA = ctypes.windll.user32.VkKeyScanA
 
 class InteractionTemplate():
     def __init__(self):
@@ -51,7 +50,7 @@ class InteractionTemplate():
         """
         if len(key) == 1 and key in string.printable:
             # https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-vkkeyscana
-            return VkKeyScanA(ord(key)) & 0xff
+            return ctypes.windll.user32.VkKeyScanA(ord(key)) & 0xff
         else:
             key = key.lower()
             return VK_CODE[key]
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""回放录制的游戏画面，用于在没有游戏窗口的环境下测试识别性能"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+from whimbox.interaction.capture import Capture
+from whimbox.interaction.interaction_template import InteractionTemplate
+from whimbox.common.logger import logger
+
+# 没有时间戳时的默认帧率
+DEFAULT_REPLAY_FPS = 30
+
+
+class PngFrames:
+    """png文件夹中的帧，读取时才解码"""
+
+    def __init__(self, folder):
+        self.files = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith('.png')]
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, index):
+        return cv2.imread(self.files[index], cv2.IMREAD_UNCHANGED)
+
+
+def load_recording(source, preload=False):
+    """
+    读取录制的画面
+
+    Args:
+        source (str): 以下任意一种
+            - png文件夹，按文件名排序，可以有timestamps.txt，每行一个时间戳
+            - npz文件，frames为(n, h, w, c)的数组，可以有timestamps
+            - cv2能读取的视频文件，时间戳由帧率计算
+        preload (bool): png文件夹是否提前全部解码
+
+    Returns:
+        tuple[Sequence[np.ndarray], np.ndarray]: 帧，以第一帧为0的时间戳(秒)
+    """
+    timestamps = None
+    if os.path.isdir(source):
+        frames = PngFrames(source)
+        timestamps_file = os.path.join(source, 'timestamps.txt')
+        if os.path.exists(timestamps_file):
+            timestamps = np.loadtxt(timestamps_file, ndmin=1)
+        if preload:
+            frames = [frames[i] for i in range(len(frames))]
+    elif source.endswith('.npz'):
+        data = np.load(source)
+        frames = data['frames']
+        if 'timestamps' in data:
+            timestamps = data['timestamps']
+    else:
+        video = cv2.VideoCapture(source)
+        fps = video.get(cv2.CAP_PROP_FPS) or DEFAULT_REPLAY_FPS
+        frames = []
+        while True:
+            ret, frame = video.read()
+            if not ret:
+                break
+            frames.append(frame)
+        video.release()
+        timestamps = np.arange(len(frames)) / fps
+
+    if len(frames) == 0:
+        raise ValueError(f"没有可以回放的画面: {source}")
+    if timestamps is None:
+        timestamps = np.arange(len(frames)) / DEFAULT_REPLAY_FPS
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    return frames, timestamps - timestamps[0]
+
+
+def save_recording(path, frames, timestamps=None):
+    """
+    保存录制的画面，格式同load_recording
+
+    Args:
+        path (str): 以.npz结尾时保存为npz，否则保存为png文件夹
+        frames (list[np.ndarray]):
+        timestamps (list[float], optional):
+    """
+    if path.endswith('.npz'):
+        if timestamps is None:
+            np.savez_compressed(path, frames=np.array(frames))
+        else:
+            np.savez_compressed(path, frames=np.array(frames), timestamps=np.array(timestamps))
+        return
+    os.makedirs(path, exist_ok=True)
+    for i, frame in enumerate(frames):
+        cv2.imwrite(os.path.join(path, f"{i:05d}.png"), frame)
+    if timestamps is not None:
+        np.savetxt(os.path.join(path, 'timestamps.txt'), np.array(timestamps))
+
+
+def record_frames(capture_func, path, count=200, interval=0.1):
+    """
+    录制画面
+
+    Args:
+        capture_func (callable): 截图函数，例如itt.capture
+        path (str): 同save_recording
+        count (int): 帧数
+        interval (float): 截图间隔(秒)
+    """
+    frames, timestamps = [], []
+    for _ in range(count):
+        timestamps.append(time.time())
+        frames.append(capture_func())
+        time.sleep(interval)
+    save_recording(path, frames, timestamps)
+
+
+class ReplayCapture(Capture):
+    """
+    回放录制的画面
+
+    realtime为True时按录制时的时间戳取帧，和实际运行时一样会跳帧；
+    否则每次截图都取下一帧，尽可能快地回放。
+    """
+
+    def __init__(self, hwnd_handler, source, realtime=False, loop=False, preload=False):
+        super().__init__(hwnd_handler)
+        self.source = source
+        self.frames, self.timestamps = load_recording(source, preload=preload)
+        self.realtime = realtime
+        self.loop = loop
+        # 尽快回放时不限制帧率，每次截图都是新的一帧
+        self.max_fps = DEFAULT_REPLAY_FPS if realtime else float('inf')
+        self.frame_index = -1
+        self.start_time = None
+        self.finished = False
+        logger.info(f"回放录制画面: {source}, {len(self.frames)}帧")
+
+    def reset(self):
+        self.frame_index = -1
+        self.start_time = None
+        self.finished = False
+
+    def _next_index(self):
+        if self.realtime:
+            if self.start_time is None:
+                self.start_time = time.time()
+            elapsed = time.time() - self.start_time
+            if self.loop:
+                elapsed %= self.timestamps[-1] + 1 / DEFAULT_REPLAY_FPS
+            return int(np.searchsorted(self.timestamps, elapsed, side='right')) - 1
+        index = self.frame_index + 1
+        if index >= len(self.frames) and self.loop:
+            index = 0
+        return index
+
+    def _get_capture(self):
+        index = self._next_index()
+        if index >= len(self.frames):
+            # 回放结束后停在最后一帧
+            self.finished = True
+            index = len(self.frames) - 1
+        self.frame_index = index
+        frame = self.frames[index]
+        buffer = self._next_buffer(frame.shape[:2] + (4,))
+        if frame.shape[2] == 4:
+            np.copyto(buffer, frame)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=buffer)
+        return buffer
+
+    def _check_shape(self, img: np.ndarray):
+        return img.shape[1] > 0 and 1.55 < img.shape[1] / img.shape[0] < 1.80
+
+
+class ReplayInteraction(InteractionTemplate):
+    """回放时代替InteractionNormal，不执行键鼠操作，只记录下来"""
+
+    def __init__(self):
+        self.operations = []
+
+    def _record(self, name, *args):
+        self.operations.append((time.time(), name, args))
+
+    def left_click(self):
+        self._record('left_click')
+
+    def left_down(self):
+        self._record('left_down')
+
+    def left_up(self):
+        self._record('left_up')
+
+    def left_double_click(self, dt=0.05):
+        self._record('left_double_click')
+
+    def right_down(self):
+        self._record('right_down')
+
+    def right_up(self):
+        self._record('right_up')
+
+    def right_click(self):
+        self._record('right_click')
+
+    def middle_down(self):
+        self._record('middle_down')
+
+    def middle_up(self):
+        self._record('middle_up')
+
+    def middle_click(self):
+        self._record('middle_click')
+
+    def middle_scroll(self, distance):
+        self._record('middle_scroll', distance)
+
+    def key_down(self, key):
+        self._record('key_down', key)
+
+    def key_up(self, key):
+        self._record('key_up', key)
+
+    def key_press(self, key):
+        self._record('key_press', key)
+
+    def move_to(self, x: int, y: int, resolution=None, anchor=None, relative=False):
+        self._record('move_to', x, y, relative)
@@ -0,0 +1,198 @@
+"""画面稳定检测：在缩小的灰度图上比较当前帧和稳定窗口的第一帧，稳定或超时后通过Event和回调通知"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from whimbox.common.logger import logger
+from whimbox.common.utils.img_utils import crop
+from whimbox.common.utils.asset_utils import AnchorPosi
+
+# 缩略图的宽度，高度按宽高比计算
+# 缩小会降低对平移的敏感度，320宽时与窗口第一帧比较，30px/s的平移和整图similar_img间隔0.1秒一样超过0.9995的阈值
+STABLE_THUMBNAIL_WIDTH = 320
+# 两次检查的间隔（秒）
+STABLE_CHECK_INTERVAL = 0.03
+# 之后的帧和稳定窗口的第一帧连续STABLE_CHECK_COUNT次相似，并且窗口持续STABLE_TIME秒以上，认为画面稳定
+# 不比较相邻帧：30ms内的变化太小，缓慢的滚动、滑入和镜头平移会被当成稳定
+STABLE_TIME = 0.15
+# 窗口的最短时间，和原来间隔0.1秒截图比较一致
+STABLE_MIN_TIME = 0.1
+STABLE_CHECK_COUNT = 3
+
+
+def luma_thumbnail(image: np.ndarray, width=STABLE_THUMBNAIL_WIDTH) -> np.ndarray:
+    """
+    先缩小再转灰度，缩小时的区域平均同时去掉了截图噪声
+
+    Returns:
+        np.ndarray: float32
+    """
+    h, w = image.shape[:2]
+    if w > width:
+        image = cv2.resize(image, (width, max(round(h * width / w), 1)), interpolation=cv2.INTER_AREA)
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return image.astype(np.float32)
+
+
+def thumbnail_similarity(img1: np.ndarray, img2: np.ndarray) -> float:
+    """
+    归一化互相关，同cv2.TM_CCORR_NORMED，阈值和similar_img的结果可以通用
+    """
+    denominator = np.sqrt(np.dot(img1.ravel(), img1.ravel()) * np.dot(img2.ravel(), img2.ravel()))
+    if denominator == 0:
+        # 全黑的画面
+        return 1. if not img1.any() and not img2.any() else 0.
+    return float(np.dot(img1.ravel(), img2.ravel()) / denominator)
+
+
+class ScreenStabilityDetector:
+    """
+    画面稳定检测。
+
+    每一帧只计算一张缩略图，和稳定窗口第一帧的缩略图比较相似度，比整张截图做模板匹配快得多，
+    检查间隔也就可以更短。和窗口第一帧比较，缓慢的变化会一直累积，直到超过阈值后重新开始窗口。
+    画面稳定后设置stable_event，检测结束（稳定或超时）后设置done_event并调用回调，
+    latency为从开始检测到稳定的时间，超时为None。
+    可以在当前线程中run()，也可以start()后在其他地方wait()。
+    """
+
+    def __init__(self, threshold=0.9995, area: AnchorPosi = None, stable_time=STABLE_TIME,
+                 interval=STABLE_CHECK_INTERVAL, callback=None):
+        """
+        Args:
+            threshold (float): 和窗口第一帧的相似度大于该值认为没有变化
+            area (AnchorPosi): 只检测这个区域，None为整个画面
+            stable_time (float): 需要持续稳定的时间（秒），不小于STABLE_MIN_TIME
+            interval (float): 检查间隔（秒）
+            callback (callable): callback(latency)，检测结束时调用，超时latency为None
+        """
+        self.threshold = threshold
+        self.area = area
+        self.stable_time = max(stable_time, STABLE_MIN_TIME)
+        self.interval = interval
+        self.callbacks = [] if callback is None else [callback]
+        self.stable_event = threading.Event()
+        # 稳定或者超时都会设置
+        self.done_event = threading.Event()
+        # 最近一次比较的相似度和平均亮度差，调试用
+        self.similarity = 0.
+        self.diff = 0.
+        self.latency = None
+        # 稳定窗口的第一帧
+        self._anchor = None
+        self._anchor_timestamp = None
+        self._last_seq = None
+        self._start_time = None
+        self._stable_count = 0
+        self._thread = None
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+        if self.done_event.is_set():
+            callback(self.latency)
+
+    def is_stable(self):
+        return self.stable_event.is_set()
+
+    def feed(self, image: np.ndarray, seq=None, timestamp=None) -> bool:
+        """
+        加入一帧
+
+        Args:
+            image: 整个画面的截图
+            seq (int): 帧序号，和上一帧相同时跳过，截图帧率限制下可能拿到同一帧
+            timestamp (float): 截图时间
+
+        Returns:
+            bool: 画面是否已经稳定
+        """
+        if self.stable_event.is_set():
+            return True
+        timestamp = time.time() if timestamp is None else timestamp
+        if self._start_time is None:
+            self._start_time = timestamp
+        if seq is not None and seq == self._last_seq:
+            return False
+        self._last_seq = seq
+
+        if self.area is not None:
+            image = crop(image, self.area, copy=False)
+        thumbnail = luma_thumbnail(image)
+        if self._anchor is None or self._anchor.shape != thumbnail.shape:
+            self._reset_anchor(thumbnail, timestamp)
+            return False
+        self.similarity = thumbnail_similarity(self._anchor, thumbnail)
+        self.diff = float(np.mean(np.abs(thumbnail - self._anchor)))
+        if self.similarity <= self.threshold:
+            # 画面变了，从这一帧重新开始窗口
+            self._reset_anchor(thumbnail, timestamp)
+            return False
+        self._stable_count += 1
+
+        if self._stable_count >= STABLE_CHECK_COUNT and timestamp - self._anchor_timestamp >= self.stable_time:
+            self.latency = timestamp - self._start_time
+            self.stable_event.set()
+            self._set_done()
+            return True
+        return False
+
+    def _reset_anchor(self, thumbnail, timestamp):
+        self._anchor = thumbnail
+        self._anchor_timestamp = timestamp
+        self._stable_count = 0
+
+    def _set_done(self):
+        if self.done_event.is_set():
+            return
+        self.done_event.set()
+        for callback in self.callbacks:
+            try:
+                callback(self.latency)
+            except Exception as e:
+                logger.error(f"画面稳定回调出错: {e}")
+
+    def run(self, frame_func, timeout=10):
+        """
+        在当前线程中检测，直到画面稳定或超时
+
+        Args:
+            frame_func (callable): 返回(帧序号, 截图)，如itt.get_frame_view
+            timeout (float): 超时时间（秒）
+
+        Returns:
+            float: 从开始到稳定的时间，超时为None
+        """
+        start_time = time.time()
+        try:
+            while True:
+                frame_seq, frame = frame_func()
+                if self.feed(frame, seq=frame_seq):
+                    return self.latency
+                if time.time() - start_time > timeout:
+                    logger.warning(f"TIMEOUT, similarity: {round(self.similarity, 5)}, diff: {round(self.diff, 2)}")
+                    return None
+                time.sleep(self.interval)
+        finally:
+            # 截图出错时也要结束，不能让wait()一直等下去
+            self._set_done()
+
+    def start(self, frame_func, timeout=10):
+        """在后台线程中检测，用wait()或回调得到结果"""
+        self._thread = threading.Thread(target=self.run, args=(frame_func, timeout),
+                                        daemon=True, name='ScreenStabilityDetector')
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """
+        等待检测结束，timeout为None时等到稳定或者run的超时
+
+        Returns:
+            float: 从开始到稳定的时间，超时为None
+        """
+        self.done_event.wait(timeout)
+        return self.latency
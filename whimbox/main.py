@@ -41,9 +41,57 @@ def _prepare_env():
     #     HANDLE_OBJ.refresh_handle()
     # logger.info("GAME_STARTED")
 
+def _warm_up_singletons():
+    """在后台提前创建耗时的单例，不阻塞启动"""
+    from whimbox.common.lazy_singleton import warm_up
+    from whimbox.interaction.interaction_core import itt
+    from whimbox.api.ocr_rapid import ocr
+    from whimbox.map.map import nikki_map
+    return warm_up(itt, ocr, nikki_map)
+
+# 按依赖顺序导入，每个子系统的导入耗时不包含前面已经导入的模块
+STARTUP_PROFILE_MODULES = [
+    ('config', 'whimbox.config.config'),
+    ('ui_assets', 'whimbox.ui.ui_assets'),
+    ('interaction', 'whimbox.interaction.interaction_core'),
+    ('ocr', 'whimbox.api.ocr_rapid'),
+    ('map', 'whimbox.map.map'),
+    ('scripts_manager', 'whimbox.common.scripts_manager'),
+    ('material_icon', 'whimbox.ui.material_icon_assets'),
+    ('background_task', 'whimbox.task.background_task.background_task'),
+    ('daily_task', 'whimbox.task.daily_task.all_in_one_task'),
+]
+
+def profile_startup():
+    """统计各子系统的导入耗时和单例的创建耗时"""
+    import importlib
+    import time
+    from whimbox.common.lazy_singleton import get_singletons, record_startup_timing, startup_timings
+
+    for name, module_name in STARTUP_PROFILE_MODULES:
+        t = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            logger.error(f"导入{module_name}失败: {e}")
+        record_startup_timing(name, 'import', time.perf_counter() - t)
+    for name, singleton in get_singletons().items():
+        if singleton.lazy_initialized():
+            # 导入时已经被创建，耗时算在导入里
+            continue
+        try:
+            singleton.lazy_get()
+        except Exception as e:
+            logger.error(f"创建{name}失败: {e}")
+
+    print(f"{'name':<20}{'kind':<8}{'cost(s)':>10}  thread")
+    for name, kind, cost, thread_name in startup_timings:
+        print(f"{name:<20}{kind:<8}{cost:>10.3f}  {thread_name}")
+
 def run_app():
     """运行主应用程序"""
     _prepare_env()
+    _warm_up_singletons()
 
     import asyncio
     import threading
@@ -62,6 +110,7 @@ def run_app():
 def run_one_dragon():
     """直接运行一条龙任务，完成后退出"""
     _prepare_env()
+    _warm_up_singletons()
 
     from whimbox.task.daily_task.all_in_one_task import AllInOneTask
     logger.info("开始执行一条龙任务...")
@@ -76,6 +125,8 @@ def main():
             init()
         elif sys.argv[1] == "startOneDragon":
             run_one_dragon()
+        elif sys.argv[1] == "--profile-startup":
+            profile_startup()
         else:
             run_app()
     else:
@@ -17,18 +17,16 @@ def convert_PngMapPx_to_InGameMapPx(points, map_name) -> np.ndarray:
     return points
 
 def convert_GameLoc_to_PngMapPx(points, map_name, decimal=1) -> np.ndarray:
-    """游戏原生坐标->图片坐标"""
-    points = np.array(points)
-    points[0] = points[0] * GAMELOC_TO_PNGMAP_SCALE + GAMELOC_TO_PNGMAP_OFFSET_DICT[map_name][0]
-    points[1] = points[1] * GAMELOC_TO_PNGMAP_SCALE + GAMELOC_TO_PNGMAP_OFFSET_DICT[map_name][1]
+    """游戏原生坐标->图片坐标，points可以是一个点(x, y)，也可以是Nx2的数组"""
+    points = np.array(points, dtype=np.float64)
+    points[..., :2] = points[..., :2] * GAMELOC_TO_PNGMAP_SCALE + GAMELOC_TO_PNGMAP_OFFSET_DICT[map_name]
     points = np.round(points, decimals=decimal)
     return points
 
 def convert_PngMapPx_to_GameLoc(points, map_name, decimal=1) -> np.ndarray:
-    """图片坐标->游戏原生坐标"""
-    points = np.array(points)
-    points[0] = (points[0] - GAMELOC_TO_PNGMAP_OFFSET_DICT[map_name][0]) / GAMELOC_TO_PNGMAP_SCALE
-    points[1] = (points[1] - GAMELOC_TO_PNGMAP_OFFSET_DICT[map_name][1]) / GAMELOC_TO_PNGMAP_SCALE
+    """图片坐标->游戏原生坐标，points可以是一个点(x, y)，也可以是Nx2的数组"""
+    points = np.array(points, dtype=np.float64)
+    points[..., :2] = (points[..., :2] - GAMELOC_TO_PNGMAP_OFFSET_DICT[map_name]) / GAMELOC_TO_PNGMAP_SCALE
     points = np.round(points, decimals=decimal)
     return points
 
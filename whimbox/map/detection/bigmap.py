@@ -5,6 +5,8 @@ from whimbox.common.logger import logger
 from whimbox.map.detection.cvars import *
 from whimbox.map.detection.map_assets import *
 from whimbox.map.detection.utils import *
+from whimbox.map.data.nikki_teleporter import DICT_TELEPORTER
+import time
 import typing as t
 
 
@@ -17,12 +19,43 @@ class BigMap:
         self.bigmap_similarity_local = 0.
         # Current position on png
         self.bigmap_position: t.Tuple[float, float] = (0, 0)
+        # Map of the last bigmap position
+        self.bigmap_map_name = None
+        self.region_name = None
 
 
-    def _predict_bigmap(self, image):
+    def _get_bigmap_search_area(self, image):
+        """
+        Search area around the teleporters of current region and the last bigmap position
+
+        Args:
+            image: Screenshot
+
+        Returns:
+            AnchorPosi: Search area on luma_0125x, None to search the whole map
+        """
+        points = []
+        if self.region_name:
+            points += [tp.position for tp in DICT_TELEPORTER.get(self.map_name, []) if tp.region == self.region_name]
+        if self.bigmap_map_name == self.map_name:
+            points.append(self.bigmap_position)
+        if not points:
+            return None
+
+        scale = BIGMAP_POSITION_SCALE_DICT[self.map_name] * BIGMAP_SEARCH_SCALE
+        # Screen center can be anywhere in the area, so pad with half of the screen
+        pad = np.array(image_size(image)) * scale / 2 + BIGMAP_REGION_PADDING
+        points = np.array(points) * BIGMAP_SEARCH_SCALE
+        x1, y1 = np.min(points, axis=0) - pad
+        x2, y2 = np.max(points, axis=0) + pad
+        return AnchorPosi(x1, y1, x2, y2)
+
+
+    def _predict_bigmap(self, image, search_area: AnchorPosi = None):
         """
         Args:
             image:
+            search_area: Search area on luma_0125x, None to search the whole map
 
         Returns: (new)png position
         """
@@ -31,12 +64,22 @@ class BigMap:
         center = np.array(image_size(image)) / 2 * scale
         image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
 
-        result = cv2.matchTemplate(MAP_ASSETS_DICT[self.map_name]["luma_0125x"].img, image, cv2.TM_CCOEFF_NORMED)
+        if search_area is None:
+            search_image = MAP_ASSETS_DICT[self.map_name]["luma_0125x"].img
+            origin = np.array((0, 0))
+        else:
+            search_image = MAP_TILES_DICT[self.map_name]["luma_0125x"].crop(search_area)
+            origin = np.array((search_area.x1, search_area.y1))
+        result = cv2.matchTemplate(search_image, image, cv2.TM_CCOEFF_NORMED)
         _, sim, _, loca = cv2.minMaxLoc(result)
 
         # Gaussian filter to get local maximum
         local_maximum = cv2.subtract(result, cv2.GaussianBlur(result, (9, 9), 0))
-        mask = image_center_crop(MAP_ASSETS_DICT[self.map_name]["mask_0125x"].img, size=image_size(local_maximum))
+        # Mask of the template center, same as image_center_crop on the whole map
+        mask_origin = origin + (np.array(image_size(image)) - 1) // 2
+        h, w = local_maximum.shape[:2]
+        mask_area = AnchorPosi(mask_origin[0], mask_origin[1], mask_origin[0] + w, mask_origin[1] + h)
+        mask = crop(MAP_ASSETS_DICT[self.map_name]["mask_0125x"].img, mask_area)
         local_maximum = cv2.copyTo(local_maximum, mask)
         _, local_sim, _, loca = cv2.minMaxLoc(local_maximum)
 
@@ -47,17 +90,17 @@ class BigMap:
         precise_sim, precise_loca = cubic_find_maximum(precise, precision=0.05)
         precise_loca -= 5
 
-        global_loca = (loca + precise_loca + center) / BIGMAP_SEARCH_SCALE
+        global_loca = (origin + loca + precise_loca + center) / BIGMAP_SEARCH_SCALE
         self.bigmap_similarity = sim
         self.bigmap_similarity_local = local_sim
         self.bigmap_position = global_loca
 
         if CV_DEBUG_MODE:
             cv2.imshow("image",image)
-            loca = loca + precise_loca + center
+            loca = origin + loca + precise_loca + center
             area = AnchorPosi(loca[0]-200, loca[1]-200, loca[0]+200, loca[1]+200)
             area = AnchorPosi(area[0], area[1], area[2], area[3])
-            close_area = crop(MAP_ASSETS_DICT[self.map_name]["luma_0125x"].img, area)
+            close_area = MAP_TILES_DICT[self.map_name]["luma_0125x"].crop(area)
             center = (close_area.shape[1] // 2, close_area.shape[0] // 2)
             cv2.circle(close_area, center, 5, (0, 0, 255), 2)
             cv2.imshow("bigmap_nearby", close_area)
@@ -75,12 +118,24 @@ class BigMap:
         - bigmap_similarity_local
         - bigmap
         """
-        self._predict_bigmap(image)
+        start_time = time.time()
+        search_area = self._get_bigmap_search_area(image)
+        if search_area is not None:
+            sim, _ = self._predict_bigmap(image, search_area=search_area)
+            local_sim = self.bigmap_similarity_local
+            if sim < BIGMAP_REGION_MIN_SIMILARITY or local_sim < BIGMAP_REGION_MIN_SIMILARITY_LOCAL:
+                logger.debug(f'bigmap region search failed ({float2str(sim, 3)}|{float2str(local_sim, 3)}), '
+                             f'search the whole map')
+                search_area = None
+        if search_area is None:
+            self._predict_bigmap(image)
+        self.bigmap_map_name = self.map_name
 
         logger.trace(
             f'BigMap '
             f'P:({float2str(self.bigmap_position[0], 4)}, {float2str(self.bigmap_position[1], 4)}) '
-            f'({float2str(self.bigmap_similarity, 3)}|{float2str(self.bigmap_similarity_local, 3)})'
+            f'({float2str(self.bigmap_similarity, 3)}|{float2str(self.bigmap_similarity_local, 3)}) '
+            f'cost: {float2str(time.time() - start_time, 3)}s'
         )
 
 if __name__ == '__main__':
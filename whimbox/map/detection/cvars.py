@@ -29,10 +29,17 @@ GAMELOC_TO_PNGMAP_OFFSET_DICT = {
 # 预计最大移动速度
 MOVE_SPEED = 100
 
+# 后台定位每秒识别小地图的次数
+LOCALIZATION_RATE = 10
+# 后台定位结果超过这个时间(秒)就不用了，改为同步识别
+LOCALIZATION_MAX_AGE = 0.3
+
 # Magic numbers for 1920x1080 desktop
 MINIMAP_CENTER = (79 + 102, 20 + 102)
 MINIMAP_RADIUS = 102
 MINIMAP_POSITION_RADIUS = 100
+# 小地图遮罩和remap表的版本号，修改生成方法后要增加
+MINIMAP_TABLE_VERSION = 1
 MINIMAP_POSITION_SCALE_DICT = {
     MAP_NAME_MIRALAND: 0.975,
     MAP_NAME_STARSEA: 0.8,
@@ -44,6 +51,45 @@ POSITION_SEARCH_SCALE = 0.5
 POSITION_SEARCH_RADIUS = 1.3
 # Can't figure out why but the result_of_0.5_lookup_scale + 0.5 ~= result_of_1.0_lookup_scale
 POSITION_MOVE = (0.5, 0.5)
+# Coarse-to-fine pyramid levels relative to luma_05x, from coarse to fine
+POSITION_PYRAMID_SCALES = (0.25, 0.5)
+# Candidates kept on each coarse pyramid level
+POSITION_PYRAMID_CANDIDATES = 5
+# Search margin (px) around each candidate when going to a finer level
+POSITION_PYRAMID_MARGIN = 6
+# Position similarity below this is considered lost, usually to be 0.4~0.5 when tracking
+POSITION_LOST_SIMILARITY = 0.25
+# Relocalized position is accepted without speed limit only above this similarity
+POSITION_RELOCATE_SIMILARITY = 0.35
+POSITION_RELOCATE_LOCAL_SIMILARITY = 0.02
+# Search radius to try one by one when position lost, None for the whole map
+POSITION_RELOCATE_RADIUS_LIST = (4, 12, None)
+# Whole map search only after this many lost frames in a row, and no more often than every N seconds,
+# so loading screens and unmapped interiors don't run it on every frame
+POSITION_RELOCATE_WHOLE_MAP_LOST_FRAMES = 5
+POSITION_RELOCATE_WHOLE_MAP_INTERVAL = 2
+# Phase correlation tracking runs a full position match every N frames
+POSITION_TRACK_FULL_INTERVAL = 10
+# Phase correlation response below this falls back to a full position match
+POSITION_TRACK_MIN_RESPONSE = 0.15
+# Phase correlation shift above this (ratio of minimap size) falls back to a full position match
+POSITION_TRACK_MAX_SHIFT = 0.25
+
+# Pose filter, a constant velocity Kalman filter on png px
+# Std of acceleration (px/s^2) as process noise
+POSE_FILTER_ACCEL_NOISE = 60
+# Std of minimap position (px)
+POSE_FILTER_MEASURE_NOISE = 2
+# Std of velocity (px/s) given by move commands
+POSE_FILTER_CONTROL_NOISE = 10
+# Squared Mahalanobis distance above this is an outlier, chi-square of 2 dof at 99.9%
+POSE_FILTER_GATE = 13.8
+# Outliers consistent with each other this many times in a row are accepted, the filter resets to them
+POSE_FILTER_MAX_REJECTS = 5
+# Search window covers the predicted position +/- N std, no larger than POSITION_SEARCH_RADIUS
+POSE_FILTER_SEARCH_SIGMA = 3
+# Minimum search margin (px on luma_05x) around the predicted minimap
+POSE_FILTER_SEARCH_MARGIN = 8
 
 DIRECTION_SIMILARITY_COLOR = (155, 255, 255)
 # Radius to search direction arrow, about 15px
@@ -52,6 +98,16 @@ DIRECTION_RADIUS = 13
 DIRECTION_SEARCH_SCALE = 0.5
 # Scale to png
 DIRECTION_ROTATION_SCALE = 1.0
+# Direction bank has a rotated arrow every N degrees
+DIRECTION_BANK_STEP = 0.5
+# Angle samples of the arrow polar descriptor, radius samples are 1px apart up to DIRECTION_RADIUS
+DIRECTION_POLAR_ANGLES = 90
+# Similarity to DIRECTION_SIMILARITY_COLOR <= threshold is not arrow
+DIRECTION_ARROW_THRESHOLD = 128
+
+# Maps are cropped from tiles of this size, only the recently used tiles stay in memory
+MAP_TILE_SIZE = 256
+MAP_TILE_CACHE_SIZE = 128
 
 # Downscale png map to run faster
 BIGMAP_SEARCH_SCALE = 0.125
@@ -60,3 +116,10 @@ BIGMAP_POSITION_SCALE_DICT = {
     MAP_NAME_MIRALAND: 0.637,
     MAP_NAME_STARSEA: 0.62,
 }
+# Bigmap searches around the teleporters of current region and the last bigmap position,
+# padded by this (px on luma_0125x)
+BIGMAP_REGION_PADDING = 100
+# Region search falls back to the whole map unless both similarities reach the level of a true match,
+# true matches are usually 0.4~0.5 and > 0.05 locally, a wrong peak inside the region can reach 0.3
+BIGMAP_REGION_MIN_SIMILARITY = 0.4
+BIGMAP_REGION_MIN_SIMILARITY_LOCAL = 0.05
@@ -1,37 +1,223 @@
+import os
+
+import cv2
 import numpy as np
 
+from whimbox.common.logger import logger
+from whimbox.common.path_lib import ASSETS_PATH, CACHE_PATH
 from whimbox.map.detection.cvars import *
-from whimbox.map.detection.utils import create_circle_mask
+from whimbox.map.detection.utils import create_circle_mask, rotate_bound, polar_descriptor
+from whimbox.common.utils.img_utils import color_similarity_2d
 from whimbox.map.detection.utils import MapAsset
+from whimbox.map.detection.tiled_map import TiledMap
+
+# 打包时生成的小地图遮罩和remap表，和地图放在一起
+MINIMAP_TABLE_FOLDER = os.path.join(ASSETS_PATH, 'imgs', 'Maps')
+# 运行时生成的表，不写入安装目录
+MINIMAP_TABLE_CACHE_FOLDER = os.path.join(CACHE_PATH, 'Maps')
+# 新生成的表保存到哪里，打包工具会改成MINIMAP_TABLE_FOLDER
+MINIMAP_TABLE_SAVE_FOLDER = MINIMAP_TABLE_CACHE_FOLDER
 
 
-def create_minimap_mask():
+def create_minimap_mask(position_radius=MINIMAP_POSITION_RADIUS, direction_radius=DIRECTION_RADIUS):
     '''小地图遮罩，扣掉中心箭头，避免匹配上地图上的小建筑'''
     # Create outer circle mask (within MINIMAP_POSITION_RADIUS)
-    outer_mask = create_circle_mask(h=MINIMAP_POSITION_RADIUS * 2, w=MINIMAP_POSITION_RADIUS * 2)
+    outer_mask = create_circle_mask(h=position_radius * 2, w=position_radius * 2)
     # Create inner circle mask (within DIRECTION_RADIUS) to exclude
-    inner_mask = create_circle_mask(h=MINIMAP_POSITION_RADIUS * 2, w=MINIMAP_POSITION_RADIUS * 2,  radius=DIRECTION_RADIUS)
+    inner_mask = create_circle_mask(h=position_radius * 2, w=position_radius * 2,  radius=direction_radius)
     # Create ring mask: keep outer circle but exclude inner circle
     mask = outer_mask & ~inner_mask
     mask = (mask * 255).astype(np.uint8)
     return mask
 
 
-def create_rotation_remap_table():
-    d = MINIMAP_RADIUS * 2
-    mx = np.zeros((d, d), dtype=np.float32)
-    my = np.zeros((d, d), dtype=np.float32)
-    for i in range(d):
-        for j in range(d):
-            mx[i, j] = d / 2 + i / 2 * np.cos(2 * np.pi * j / d)
-            my[i, j] = d / 2 + i / 2 * np.sin(2 * np.pi * j / d)
-    return mx, my
+def create_rotation_remap_table(radius=MINIMAP_RADIUS):
+    '''
+    把圆形的小地图展开为矩形的remap表，行为半径，列为角度
+
+    Returns:
+        np.ndarray: Shape (2, d, d)，依次为mx, my
+    '''
+    d = radius * 2
+    i = np.arange(d, dtype=np.float64)[:, np.newaxis]
+    j = np.arange(d, dtype=np.float64)[np.newaxis, :]
+    mx = d / 2 + i / 2 * np.cos(2 * np.pi * j / d)
+    my = d / 2 + i / 2 * np.sin(2 * np.pi * j / d)
+    return np.stack([mx, my]).astype(np.float32)
+
+
+def get_minimap_table_path(name, *params, folder=MINIMAP_TABLE_FOLDER):
+    '''文件名包含参数和版本号，参数或生成方法变化后不会读到旧文件'''
+    params = '_'.join(str(p) for p in params)
+    return os.path.join(folder, f'{name}_{params}_v{MINIMAP_TABLE_VERSION}.npy')
+
+
+def save_minimap_table(path, table):
+    '''先写临时文件再替换，中途退出不会留下读不了的文件'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"保存{path}失败: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_minimap_table(name, *params):
+    '''依次读取打包的和运行时生成的表，文件损坏时当作没有'''
+    for folder in (MINIMAP_TABLE_FOLDER, MINIMAP_TABLE_CACHE_FOLDER):
+        path = get_minimap_table_path(name, *params, folder=folder)
+        if not os.path.exists(path):
+            continue
+        try:
+            return np.load(path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取{path}失败，重新生成: {e}")
+    return None
+
+
+_minimap_tables = {}
+
+def load_minimap_table(name, create_func, *params, regenerate=False):
+    '''
+    以memmap方式读取生成好的表，没有或者读取失败时生成并保存到MINIMAP_TABLE_SAVE_FOLDER
+
+    Args:
+        name (str): 表名
+        create_func (callable): create_func(*params) -> np.ndarray
+        params: 生成参数
+        regenerate (bool): 忽略已有的文件重新生成
+
+    Returns:
+        np.ndarray: 只读
+    '''
+    key = (name,) + params
+    if not regenerate and key in _minimap_tables:
+        return _minimap_tables[key]
+    table = None if regenerate else _read_minimap_table(name, *params)
+    if table is None:
+        table = create_func(*params)
+        save_minimap_table(get_minimap_table_path(name, *params, folder=MINIMAP_TABLE_SAVE_FOLDER), table)
+        table.flags.writeable = False
+    _minimap_tables[key] = table
+    return table
+
+
+def get_minimap_mask(position_radius=MINIMAP_POSITION_RADIUS, direction_radius=DIRECTION_RADIUS, regenerate=False):
+    return load_minimap_table('minimap_mask', create_minimap_mask, position_radius, direction_radius,
+                              regenerate=regenerate)
+
+
+def get_rotation_remap_table(radius=MINIMAP_RADIUS, regenerate=False):
+    '''
+    Returns:
+        tuple[np.ndarray, np.ndarray]: mx, my，可以直接传给cv2.remap
+    '''
+    table = load_minimap_table('rotation_remap', create_rotation_remap_table, radius, regenerate=regenerate)
+    return table[0], table[1]
+
+
+def arrow_similarity(image, color):
+    '''箭头颜色的相似度，不像箭头的部分置为0'''
+    image = color_similarity_2d(image, color=color)
+    _, image = cv2.threshold(image, DIRECTION_ARROW_THRESHOLD, 255, cv2.THRESH_TOZERO)
+    return image
+
+
+def create_direction_bank(direction_radius=DIRECTION_RADIUS):
+    '''
+    每隔DIRECTION_BANK_STEP度旋转一次箭头，计算极坐标描述子
+
+    Returns:
+        np.ndarray: Shape (360 / DIRECTION_BANK_STEP, direction_radius * DIRECTION_POLAR_ANGLES)，
+            第i行为旋转i * DIRECTION_BANK_STEP度的箭头
+    '''
+    arrow = MapAsset('ARROW').img
+    bank = []
+    for degree in np.arange(0, 360, DIRECTION_BANK_STEP):
+        rotated = arrow_similarity(rotate_bound(arrow, degree), color=(255, 255, 255))
+        bank.append(polar_descriptor(rotated, direction_radius, DIRECTION_POLAR_ANGLES))
+    return np.array(bank, dtype=np.float32)
 
 
-# 小地图遮罩，用于位置匹配
-MiniMapMask = create_minimap_mask()
-# 用于识别小地图的镜头朝向
-RotationRemapTable = create_rotation_remap_table()
+def get_direction_bank(direction_radius=DIRECTION_RADIUS, regenerate=False):
+    return load_minimap_table('direction_bank', create_direction_bank, direction_radius, regenerate=regenerate)
+
+
+class MinimapGeometry:
+    """
+    小地图在截图上的位置和大小，以及按这些半径生成的遮罩、remap表和箭头朝向表。
+    游戏界面缩放后用set_minimap_geometry换成新的，MiniMap每次识别时读取当前的。
+    """
+
+    def __init__(self, center=MINIMAP_CENTER, radius=MINIMAP_RADIUS, position_radius=MINIMAP_POSITION_RADIUS,
+                 direction_radius=DIRECTION_RADIUS, regenerate=False):
+        self.center = tuple(int(v) for v in center)
+        self.radius = int(radius)
+        self.position_radius = int(position_radius)
+        self.direction_radius = int(direction_radius)
+        # 小地图遮罩，用于位置匹配
+        self.mask = get_minimap_mask(self.position_radius, self.direction_radius, regenerate=regenerate)
+        # 用于识别小地图的镜头朝向
+        self.remap = get_rotation_remap_table(self.radius, regenerate=regenerate)
+        # 箭头朝向表
+        self.direction_bank = get_direction_bank(self.direction_radius, regenerate=regenerate)
+
+    @property
+    def hud_scale(self):
+        """小地图相对1920x1080默认大小的缩放，小地图越大，每个像素对应的地图范围越小"""
+        return self.radius / MINIMAP_RADIUS
+
+    def __repr__(self):
+        return (f'MinimapGeometry(center={self.center}, radius={self.radius}, '
+                f'position_radius={self.position_radius}, direction_radius={self.direction_radius})')
+
+
+_minimap_geometry = None
+
+def get_minimap_geometry() -> MinimapGeometry:
+    global _minimap_geometry
+    if _minimap_geometry is None:
+        _minimap_geometry = MinimapGeometry()
+    return _minimap_geometry
+
+
+def set_minimap_geometry(center=None, radius=None, position_radius=None, direction_radius=None,
+                         regenerate=False) -> MinimapGeometry:
+    """
+    修改小地图的位置和大小，不指定的参数沿用当前值。
+    先生成好新的表再整体替换，识别线程不会读到一半新一半旧的参数。
+
+    Args:
+        center (tuple[int, int]): 小地图中心在1920x1080截图上的坐标
+        radius (int): 小地图半径
+        position_radius (int): 用于位置匹配的半径
+        direction_radius (int): 箭头半径
+        regenerate (bool): 忽略已有的文件重新生成表
+
+    Returns:
+        MinimapGeometry:
+    """
+    global _minimap_geometry
+    current = get_minimap_geometry()
+    _minimap_geometry = MinimapGeometry(
+        center=current.center if center is None else center,
+        radius=current.radius if radius is None else radius,
+        position_radius=current.position_radius if position_radius is None else position_radius,
+        direction_radius=current.direction_radius if direction_radius is None else direction_radius,
+        regenerate=regenerate,
+    )
+    logger.info(f'minimap geometry: {_minimap_geometry}')
+    return _minimap_geometry
+
+
+def regenerate_minimap_tables(center=None, radius=None, position_radius=None, direction_radius=None):
+    '''游戏界面缩放导致小地图大小变化时，按新的半径重新生成小地图遮罩、remap表和箭头朝向表，并让MiniMap使用新的表'''
+    return set_minimap_geometry(center, radius, position_radius, direction_radius, regenerate=True)
+
 
 # 箭头旋转表
 ArrowRotateMap = MapAsset("ArrowRotateMap")
@@ -63,4 +249,21 @@ MAP_ASSETS_DICT = {
         "luma_0125x": StarSeaBigMap,
         "mask_0125x": StarSeaBigMapMask
     }
-}
\ No newline at end of file
+}
+
+# 分块地图，每帧只需要组装当前位置附近的几个tile
+MAP_TILES_DICT = {
+    MAP_NAME_MIRALAND: {
+        "luma_05x": TiledMap(MiraLandMap),
+        "luma_0125x": TiledMap(MiraLandBigMap),
+    },
+    MAP_NAME_STARSEA: {
+        "luma_05x": TiledMap(StarSeaMap),
+        "luma_0125x": TiledMap(StarSeaBigMap),
+    }
+}
+
+
+def get_map_pyramid(map_name, scale):
+    '''获取luma_05x地图缩小scale倍后的图片，用于小地图由粗到精的位置搜索'''
+    return MAP_ASSETS_DICT[map_name]['luma_05x'].get_pyramid(scale)
@@ -1,3 +1,4 @@
+import time
 import typing as t
 import cv2
 
@@ -6,8 +7,34 @@ from whimbox.interaction.interaction_core import itt
 from whimbox.common.timer_module import Timer
 from whimbox.common.utils.posi_utils import *
 from whimbox.map.detection.map_assets import *
+from whimbox.map.pose_filter import PoseFilter
 from whimbox.common.utils.utils import *
 
+
+class MinimapPose:
+    """
+    One observation of the minimap, all from the same screenshot.
+    Reuse it within a tick instead of capturing again.
+    """
+
+    def __init__(self, timestamp, map_name, position, position_similarity,
+                 direction=None, direction_similarity=None, rotation=None, rotation_confidence=None):
+        self.timestamp = timestamp
+        self.map_name = map_name
+        # Position on png
+        self.position = position
+        self.position_similarity = position_similarity
+        # None if not observed
+        self.direction = direction
+        self.direction_similarity = direction_similarity
+        self.rotation = rotation
+        self.rotation_confidence = rotation_confidence
+
+    def __repr__(self):
+        return (f'MinimapPose(P:{self.position}, D:{self.direction}, R:{self.rotation}, '
+                f't:{round(self.timestamp, 3)})')
+
+
 class MiniMap:
     def __init__(self):
         # Usually to be 0.4~0.5
@@ -29,60 +56,112 @@ class MiniMap:
         self.rotation: float = 0
 
         self.pos_change_timer = Timer(diff_start_time=30)
+        # Predicts position to narrow the search area and rejects outliers
+        self.pose_filter = PoseFilter()
+
+        # Track position by phase correlation between full position matches
+        self.position_tracking = False
+        # Usually > 0.3 when tracking well
+        self.position_track_response = 0.
+        # Frames left before the next full position match
+        self.position_track_count = 0
+
+        # Last result of observe()
+        self.pose: t.Optional[MinimapPose] = None
+
+        # Lost frames in a row, whole map search backs off by it
+        self.position_lost_count = 0
+        self.whole_map_search_timer = Timer(diff_start_time=POSITION_RELOCATE_WHOLE_MAP_INTERVAL)
 
     def init_position(self, position: t.Tuple[int, int]):
         self.position = position
+        self.position_track_count = 0
+        self.pose_filter.reset(position)
+        self.position_lost_count = 0
+
+    def set_move_command(self, velocity):
+        """
+        Args:
+            velocity (tuple[float, float]): Commanded velocity on png (px/s), None if not controlled
+        """
+        self.pose_filter.set_control(velocity)
+
+    @property
+    def geometry(self) -> MinimapGeometry:
+        """Current minimap center and radii, replaced by set_minimap_geometry"""
+        return get_minimap_geometry()
+
+    def set_minimap_geometry(self, center=None, radius=None, position_radius=None, direction_radius=None,
+                             regenerate=False):
+        """
+        Change where the minimap is and how large it is, e.g. after the HUD scale changes.
+        Masks, remap table and direction bank are loaded or generated for the new radii.
+        """
+        geometry = set_minimap_geometry(center, radius, position_radius, direction_radius, regenerate=regenerate)
+        self.position_track_count = 0
+        return geometry
+
+    def _get_position_scale(self):
+        """Minimap to png scale, a larger HUD shows less of the map per pixel"""
+        return MINIMAP_POSITION_SCALE_DICT[self.map_name] / self.geometry.hud_scale
 
     def _get_minimap(self, image, radius):
-        area = area_offset((-radius, -radius, radius, radius), offset=MINIMAP_CENTER)
+        area = area_offset((-radius, -radius, radius, radius), offset=self.geometry.center)
         area = AnchorPosi(area[0], area[1], area[2], area[3], anchor=ANCHOR_TOP_LEFT)
         image = crop(image, area)
         return image
 
 
-    def _predict_position(self, image, scale):
+    def _get_position_search_area(self, local, search_radius):
         """
         Args:
-            image:
-            scale:
+            local: Minimap resized to luma_05x
+            search_radius: Multiple of the minimap size, None to search the whole map
 
         Returns:
-            float: Precise similarity
-            float: local_sim
-            tuple[float, float]: Location on png
+            AnchorPosi: Search area on luma_05x
         """
-        scale *= POSITION_SEARCH_SCALE
-        local = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
-        mask = cv2.resize(MiniMapMask, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
-        if CV_DEBUG_MODE:
-            local_copy = local.copy()
-            local_copy[mask == 0] = 0
-            cv2.imshow('local', local_copy)
-            cv2.waitKey(1)
-        # Product search area
+        if search_radius is None:
+            h, w = MAP_TILES_DICT[self.map_name]['luma_05x'].shape[:2]
+            return AnchorPosi(0, 0, w, h)
         search_position = np.array(self.position, dtype=np.int64)
-        search_size = np.array(image_size(local)) * POSITION_SEARCH_RADIUS
+        search_size = np.array(image_size(local)) * search_radius
+        if search_radius <= POSITION_SEARCH_RADIUS and self.pose_filter.initialized:
+            # Search around the predicted position, only as large as the prediction uncertainty
+            predicted, sigma = self.pose_filter.predict()
+            search_position = np.round(predicted).astype(np.int64)
+            margin = max(sigma * POSE_FILTER_SEARCH_SIGMA * POSITION_SEARCH_SCALE, POSE_FILTER_SEARCH_MARGIN)
+            search_size = np.minimum(np.array(image_size(local)) + 2 * margin, search_size)
         search_size = (search_size // 2 * 2).astype(np.int64)
         search_area = area_offset((0, 0, *search_size), offset=(-search_size // 2).astype(np.int64))
         search_area = area_offset(search_area, offset=np.multiply(search_position, POSITION_SEARCH_SCALE))
         search_area = np.array(search_area).astype(np.int64)
-        search_area = AnchorPosi(search_area[0], search_area[1], search_area[2], search_area[3])
-        search_image = crop(MAP_ASSETS_DICT[self.map_name]['luma_05x'].img, search_area)
-        if CV_DEBUG_MODE:
-            show_search_image = search_image.copy()
-            # 在show_search_image中心画一个半径为2px的方块
-            h, w = show_search_image.shape[:2]
-            cx, cy = w // 2, h // 2
-            # 方块边界
-            x1, y1 = max(cx - 2, 0), max(cy - 2, 0)
-            x2, y2 = min(cx + 2, w - 1), min(cy + 2, h - 1)
-            # 画方块
-            show_search_image[y1:y2+1, x1:x2+1] = 255
-            cv2.imshow('search_image', show_search_image)
-            cv2.waitKey(1)
+        return AnchorPosi(search_area[0], search_area[1], search_area[2], search_area[3])
+
 
+    def _match_minimap(self, search_image, local, mask):
+        """
+        Masked template matching, flat areas such as the black outside of map give nan, inf
+        or values out of [-1, 1], they are set to 0.
+        """
         result = cv2.matchTemplate(search_image, local, cv2.TM_CCOEFF_NORMED, mask=mask)
-        _, sim, _, loca = cv2.minMaxLoc(result)
+        result[~(np.abs(result) <= 1)] = 0
+        return result
+
+
+    def _refine_position(self, search_image, local, mask):
+        """
+        Args:
+            search_image: Area on luma_05x
+            local: Minimap resized to luma_05x
+            mask:
+
+        Returns:
+            float: Precise similarity
+            float: local_sim
+            np.ndarray[float, float]: Upper-left corner of the minimap on search_image
+        """
+        result = self._match_minimap(search_image, local, mask)
 
         # Gaussian filter to get local maximum
         local_maximum = cv2.subtract(result, cv2.GaussianBlur(result, (5, 5), 0))
@@ -94,16 +173,148 @@ class MiniMap:
         precise = crop(result, area)
         precise_sim, precise_loca = cubic_find_maximum(precise, precision=0.05)
         precise_loca -= 5
+        return precise_sim, local_sim, precise_loca + loca
+
+
+    def _get_position_mask(self, image):
+        """Mask of the same size as the minimap, so it always matches the minimap even if geometry just changed"""
+        return get_minimap_mask(image.shape[0] // 2, self.geometry.direction_radius)
+
+
+    def _search_pyramid_candidates(self, image, scale, search_area):
+        """
+        Match minimap on the coarse levels of luma_05x pyramid to pick candidates.
+        The coarsest level searches the whole search_area and keeps several peaks,
+        the following levels only search a small window around each candidate.
 
-        # Location on search_image
-        lookup_loca = precise_loca + loca + np.array(image_size(image)) * scale / 2
+        Args:
+            image: Luma minimap
+            scale: Minimap to luma_05x scale
+            search_area (AnchorPosi): Search area on luma_05x
+
+        Returns:
+            list[tuple[float, float]]: Upper-left corner of candidates on luma_05x
+        """
+        candidates = None
+        last_level = 1
+        for level in POSITION_PYRAMID_SCALES:
+            local = cv2.resize(image, None, fx=scale * level, fy=scale * level, interpolation=cv2.INTER_AREA)
+            mask = cv2.resize(self._get_position_mask(image), None, fx=scale * level, fy=scale * level,
+                              interpolation=cv2.INTER_NEAREST)
+            level_map = get_map_pyramid(self.map_name, level)
+            if candidates is None:
+                areas = [AnchorPosi(search_area.x1 * level, search_area.y1 * level,
+                                    search_area.x2 * level, search_area.y2 * level)]
+                count = POSITION_PYRAMID_CANDIDATES
+            else:
+                ratio = level / last_level
+                w, h = image_size(local)
+                margin = POSITION_PYRAMID_MARGIN
+                areas = [AnchorPosi(x * ratio - margin, y * ratio - margin, x * ratio + w + margin, y * ratio + h + margin)
+                         for x, y in candidates]
+                count = 1
+
+            peaks = []
+            for area in areas:
+                result = self._match_minimap(crop(level_map, area), local, mask)
+                peaks += [(sim, (area.x1 + x, area.y1 + y)) for sim, (x, y) in top_k_maximum(result, k=count)]
+            peaks = sorted(peaks, key=lambda peak: peak[0], reverse=True)[:POSITION_PYRAMID_CANDIDATES]
+            candidates = list(dict.fromkeys(loca for _, loca in peaks))
+            last_level = level
+
+        return [(x / last_level, y / last_level) for x, y in candidates]
+
+
+    def _predict_position(self, image, scale, search_radius=POSITION_SEARCH_RADIUS):
+        """
+        Args:
+            image:
+            scale:
+            search_radius: Multiple of the minimap size, None to search the whole map.
+                Search larger than POSITION_SEARCH_RADIUS goes coarse-to-fine through the map pyramid.
+
+        Returns:
+            float: Precise similarity
+            float: local_sim
+            tuple[float, float]: Location on png
+        """
+        scale *= POSITION_SEARCH_SCALE
+        local = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        mask = cv2.resize(self._get_position_mask(image), None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        if CV_DEBUG_MODE:
+            local_copy = local.copy()
+            local_copy[mask == 0] = 0
+            cv2.imshow('local', local_copy)
+            cv2.waitKey(1)
+        # Product search area
+        search_area = self._get_position_search_area(local, search_radius)
+        if search_radius is None or search_radius > POSITION_SEARCH_RADIUS:
+            # Refine candidates on full resolution
+            w, h = image_size(local)
+            margin = POSITION_PYRAMID_MARGIN
+            search_areas = [AnchorPosi(x - margin, y - margin, x + w + margin, y + h + margin)
+                            for x, y in self._search_pyramid_candidates(image, scale, search_area)]
+        else:
+            search_areas = [search_area]
+
+        best = None
+        for search_area in search_areas:
+            search_image = MAP_TILES_DICT[self.map_name]['luma_05x'].crop(search_area)
+            if CV_DEBUG_MODE:
+                show_search_image = search_image.copy()
+                # 在show_search_image中心画一个半径为2px的方块
+                h, w = show_search_image.shape[:2]
+                cx, cy = w // 2, h // 2
+                # 方块边界
+                x1, y1 = max(cx - 2, 0), max(cy - 2, 0)
+                x2, y2 = min(cx + 2, w - 1), min(cy + 2, h - 1)
+                # 画方块
+                show_search_image[y1:y2+1, x1:x2+1] = 255
+                cv2.imshow('search_image', show_search_image)
+                cv2.waitKey(1)
+
+            precise_sim, local_sim, loca = self._refine_position(search_image, local, mask)
+            # Flat areas around the black outside of map may get a high similarity but never a sharp peak,
+            # so candidates are compared by local_sim
+            if best is None or local_sim > best[1]:
+                best = (precise_sim, local_sim, loca + [search_area.x1, search_area.y1])
+        if best is None:
+            return 0., 0., np.array(self.position, dtype=np.float64)
+        precise_sim, local_sim, loca = best
+
+        # Location on luma_05x
+        lookup_loca = loca + np.array(image_size(image)) * scale / 2
         # Location on png
-        global_loca = (lookup_loca + [search_area.x1, search_area.y1]) / POSITION_SEARCH_SCALE
+        global_loca = lookup_loca / POSITION_SEARCH_SCALE
         # Can't figure out why but the result_of_0.5_lookup_scale + 0.5 ~= result_of_1.0_lookup_scale
         global_loca += POSITION_MOVE
         return precise_sim, local_sim, global_loca
 
 
+    def _relocate_position(self, image, scale):
+        """
+        Search wider and wider until the position is found again, so a lost position
+        (teleport, loading screen, bad frame) does not need the bigmap to recover.
+        The whole map search waits for POSITION_RELOCATE_WHOLE_MAP_LOST_FRAMES lost frames in a row
+        and runs at most every POSITION_RELOCATE_WHOLE_MAP_INTERVAL seconds.
+
+        Returns:
+            tuple[float, float, tuple[float, float]]: Same as _predict_position, None if not found
+        """
+        self.position_lost_count += 1
+        for search_radius in POSITION_RELOCATE_RADIUS_LIST:
+            if search_radius is None:
+                if self.position_lost_count < POSITION_RELOCATE_WHOLE_MAP_LOST_FRAMES \
+                        or self.whole_map_search_timer.get_diff_time() < POSITION_RELOCATE_WHOLE_MAP_INTERVAL:
+                    return None
+                self.whole_map_search_timer.reset()
+            sim, local_sim, loca = self._predict_position(image, scale, search_radius=search_radius)
+            if sim >= POSITION_RELOCATE_SIMILARITY and local_sim >= POSITION_RELOCATE_LOCAL_SIMILARITY:
+                logger.info(f'position relocated with search radius {search_radius}: {np.round(loca, 1)} ({round(sim, 3)})')
+                return sim, local_sim, loca
+        return None
+
+
     def update_position(self, origin_image):
         """
         Get position on png
@@ -112,16 +323,41 @@ class MiniMap:
         - position_similarity
         - position
         """
+        image = self._get_minimap(origin_image, self.geometry.position_radius)
+        image = rgb2luma(image)
+        return self._update_position(image)
+
+
+    def _update_position(self, image):
+        """
+        Args:
+            image: Luma minimap of position radius
+        """
         if self.map_name == MAP_NAME_UNSUPPORTED:
             self.position = (0, 0)
             return self.position
-            
-        image = self._get_minimap(origin_image, MINIMAP_POSITION_RADIUS)
-        image = rgb2luma(image)
 
-        best_sim, best_local_sim, best_loca = self._predict_position(image, MINIMAP_POSITION_SCALE_DICT[self.map_name])
+        scale = self._get_position_scale()
+        best_sim, best_local_sim, best_loca = self._predict_position(image, scale)
+
+        if best_sim < POSITION_LOST_SIMILARITY:
+            relocated = self._relocate_position(image, scale)
+            if relocated is not None:
+                self.position_lost_count = 0
+                # Confident enough to skip the outlier gate of verify_position
+                best_sim, best_local_sim, best_loca = relocated
+                self.pos_change_timer.reset()
+                self.pose_filter.reset(best_loca)
+                self.position_similarity = round(best_sim, 5)
+                self.position_similarity_local = round(best_local_sim, 5)
+                self.position = tuple(np.round(best_loca, 1))
+                return self.position
+
+        else:
+            self.position_lost_count = 0
 
         if self.verify_position(tuple(np.round(best_loca, 1))):
+            self.pose_filter.update(best_loca)
             self.position_similarity = round(best_sim, 5)
             self.position_similarity_local = round(best_local_sim, 5)
             self.position = tuple(np.round(best_loca, 1))
@@ -129,17 +365,105 @@ class MiniMap:
 
 
     def verify_position(self, pos):
+        """
+        Gate the position by its Mahalanobis distance to the pose filter prediction,
+        so the allowed jump follows the actual speed and time since the last accepted position.
+        """
         dt = self.pos_change_timer.get_diff_time()
         if dt > 20:
             self.pos_change_timer.reset()
+            self.pose_filter.reset(pos)
             return True
-        else:
-            if euclidean_distance(pos, self.position) >= MOVE_SPEED * dt + 1:
-                logger.warning(f'position change above limit: {euclidean_distance(pos, self.position)} >= {MOVE_SPEED * dt + 1}. result will be abandon.')
-                return False
-            else:
+        if self.pose_filter.gate(pos):
+            self.pos_change_timer.reset()
+            return True
+        logger.warning(f'position change is an outlier: {self.position} -> {pos}, '
+                       f'mahalanobis^2: {float2str(self.pose_filter.mahalanobis(pos))}. result will be abandon.')
+        return False
+
+
+    def set_position_tracking(self, enable: bool):
+        """
+        Tracking mode estimates the position shift by phase correlation,
+        which is much cheaper than the full template matching in update_position.
+        """
+        self.position_tracking = enable
+        self.position_track_count = 0
+
+
+    def _track_position_shift(self, image, scale):
+        """
+        Phase correlation between minimap and the luma_05x patch around current position.
+        The patch is cut from the map instead of the last minimap, so errors don't accumulate.
+
+        Args:
+            image: Luma minimap
+            scale:
+
+        Returns:
+            float: Response of phase correlation, 0~1
+            np.ndarray[float, float]: Location on png, None if shift is too large
+        """
+        scale *= POSITION_SEARCH_SCALE
+        local = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR).astype(np.float32)
+        mask = cv2.resize(self._get_position_mask(image), None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        # Cover direction arrow and outside of minimap with the average luma
+        local[mask == 0] = np.mean(local[mask > 0])
+
+        # Upper-left corner of the minimap on luma_05x if position doesn't change
+        half_size = np.array(image_size(image)) * scale / 2
+        origin = (np.subtract(self.position, POSITION_MOVE) * POSITION_SEARCH_SCALE - half_size).round()
+        w, h = image_size(local)
+        area = AnchorPosi(origin[0], origin[1], origin[0] + w, origin[1] + h)
+        patch = MAP_TILES_DICT[self.map_name]['luma_05x'].crop(area).astype(np.float32)
+
+        window = cv2.createHanningWindow((w, h), cv2.CV_32F)
+        shift, response = cv2.phaseCorrelate(patch, local, window)
+        # Minimap moves opposite to the character
+        shift = -np.array(shift)
+        if np.max(np.abs(shift)) > min(w, h) * POSITION_TRACK_MAX_SHIFT:
+            return response, None
+
+        lookup_loca = origin + shift + half_size
+        global_loca = lookup_loca / POSITION_SEARCH_SCALE + POSITION_MOVE
+        return response, global_loca
+
+
+    def track_position(self, origin_image):
+        """
+        Get position on png by phase correlation tracking,
+        fall back to update_position every POSITION_TRACK_FULL_INTERVAL frames or when the tracking is weak.
+
+        The following attributes will be set:
+        - position_track_response
+        - position
+        """
+        image = self._get_minimap(origin_image, self.geometry.position_radius)
+        image = rgb2luma(image)
+        return self._track_position(image)
+
+
+    def _track_position(self, image):
+        """
+        Args:
+            image: Luma minimap of position radius
+        """
+        if self.map_name == MAP_NAME_UNSUPPORTED:
+            return self._update_position(image)
+
+        if self.position_track_count > 0:
+            response, loca = self._track_position_shift(image, self._get_position_scale())
+            self.position_track_response = round(response, 5)
+            if loca is not None and response >= POSITION_TRACK_MIN_RESPONSE:
+                self.position_track_count -= 1
                 self.pos_change_timer.reset()
-                return True
+                self.pose_filter.update(loca)
+                self.position = tuple(np.round(loca, 1))
+                return self.position
+            logger.trace(f'position tracking lost, response: {float2str(response)}')
+
+        self.position_track_count = POSITION_TRACK_FULL_INTERVAL
+        return self._update_position(image)
 
 
     def update_direction(self, image):
@@ -150,56 +474,34 @@ class MiniMap:
         - direction_similarity
         - direction
         """
-        image = self._get_minimap(image, DIRECTION_RADIUS)
-        image = color_similarity_2d(image, color=DIRECTION_SIMILARITY_COLOR)
-        try:
-            area = area_pad(get_bbox(image, threshold=128), pad=-1)
-            area = AnchorPosi(area[0], area[1], area[2], area[3])
-        except IndexError:
-            # IndexError: index 0 is out of bounds for axis 0 with size 0
-            logger.warning('No direction arrow on minimap')
-            return
-        image = crop(image, area=area)
+        return self._update_direction(self._get_minimap(image, self.geometry.direction_radius))
+
+
+    def _update_direction(self, image):
+        """
+        Args:
+            image: Minimap of direction radius
+        """
+        direction_radius = image.shape[0] // 2
+        image = arrow_similarity(image, color=DIRECTION_SIMILARITY_COLOR)
         if CV_DEBUG_MODE:
             cv2.imshow('direction_image', image)
             cv2.waitKey(1)
+        descriptor = polar_descriptor(image, direction_radius, DIRECTION_POLAR_ANGLES)
+        if descriptor is None:
+            logger.warning('No direction arrow on minimap')
+            return
+
+        # Correlation with arrows rotated every DIRECTION_BANK_STEP degrees
+        result = get_direction_bank(direction_radius) @ descriptor
+        index = int(np.argmax(result))
+        # Parabola through the highest score and its neighbours for sub-step precision
+        prev_sim, precise_sim, next_sim = result[index - 1], result[index], result[(index + 1) % len(result)]
+        denominator = prev_sim - 2 * precise_sim + next_sim
+        offset = 0.5 * (prev_sim - next_sim) / denominator if denominator < 0 else 0.
+        precise_loca = round(float((index + offset) * DIRECTION_BANK_STEP), 1)
 
-        scale = DIRECTION_ROTATION_SCALE * DIRECTION_SEARCH_SCALE
-        mapping = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
-        result = cv2.matchTemplate(ArrowRotateMap.img, mapping, cv2.TM_CCOEFF_NORMED)
-        result = cv2.subtract(result, cv2.GaussianBlur(result, (5, 5), 0))
-        _, sim, _, loca = cv2.minMaxLoc(result)
-        loca = np.array(loca) / DIRECTION_SEARCH_SCALE // (DIRECTION_RADIUS * 2)
-        degree = int((loca[0] + loca[1] * 8) * 5)
-
-        def to_map(x):
-            return int((x * DIRECTION_RADIUS * 2 + DIRECTION_RADIUS) * POSITION_SEARCH_SCALE)
-
-        # Row on ArrowRotateMapAll
-        row = int(degree // 8) + 45
-        # Calculate +-1 rows to get result with a precision of 1
-        row = (row - 2, row + 3)
-        # Convert to ArrowRotateMapAll and to be 5px larger
-        row = (to_map(row[0]) - 5, to_map(row[1]) + 5)
-
-        precise_map = ArrowRotateMapAll.img[row[0]:row[1], :]
-        result = cv2.matchTemplate(precise_map, mapping, cv2.TM_CCOEFF_NORMED)
-        result = cv2.subtract(result, cv2.GaussianBlur(result, (5, 5), 0))
-
-        def to_map(x):
-            return int((x * DIRECTION_RADIUS * 2) * POSITION_SEARCH_SCALE)
-
-        def get_precise_sim(d):
-            y, x = divmod(d, 8)
-            im = result[to_map(y):to_map(y + 1), to_map(x):to_map(x + 1)]
-            _, sim, _, _ = cv2.minMaxLoc(im)
-            return sim
-
-        precise = np.array([[get_precise_sim(_) for _ in range(24)]])
-        precise_sim, precise_loca = cubic_find_maximum(precise, precision=0.1)
-        precise_loca = degree // 8 * 8 - 8 + precise_loca[0]
-
-        self.direction_similarity = round(precise_sim, 3)
+        self.direction_similarity = round(float(precise_sim), 3)
         self.direction = precise_loca % 360
         # Convert
         if self.direction > 180:
@@ -224,11 +526,23 @@ class MiniMap:
             self.update_position(image)
 
         # Get current minimap
-        scale = MINIMAP_POSITION_SCALE_DICT[self.map_name] * POSITION_SEARCH_SCALE
-        minimap = self._get_minimap(image, radius=MINIMAP_RADIUS)
+        minimap = self._get_minimap(image, radius=self.geometry.radius)
         minimap = rgb2luma(minimap)
+        return self._subtract_minimap_background(minimap)
+
 
-        radius = MINIMAP_RADIUS * scale
+    def _subtract_minimap_background(self, minimap):
+        """
+        Args:
+            minimap: Luma minimap of minimap radius, position should be updated
+
+        Returns:
+            np.ndarray
+        """
+        scale = self._get_position_scale() * POSITION_SEARCH_SCALE
+        minimap_radius = minimap.shape[0] // 2
+
+        radius = minimap_radius * scale
         area = area_offset((-radius, -radius, radius, radius),
                            offset=np.array(self.position) * POSITION_SEARCH_SCALE)
         # Search 15% larger
@@ -237,7 +551,7 @@ class MiniMap:
         area = AnchorPosi(area[0], area[1], area[2], area[3])
 
         # Crop pngmap around current position and resize to current minimap
-        image = crop(MAP_ASSETS_DICT[self.map_name]['luma_05x'].img, area)
+        image = MAP_TILES_DICT[self.map_name]['luma_05x'].crop(area)
         image = cv2.resize(image, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_LINEAR)
         # if CV_DEBUG_MODE:
         #     cv2.imshow('minimap', minimap)
@@ -248,7 +562,7 @@ class MiniMap:
         result = cv2.matchTemplate(image, minimap, cv2.TM_CCOEFF_NORMED)
         sim, loca = cubic_find_maximum(result, precision=0.05)
         # Re-crop the pngmap that best match current map
-        area = (0, 0, MINIMAP_RADIUS * 2, MINIMAP_RADIUS * 2)
+        area = (0, 0, minimap_radius * 2, minimap_radius * 2)
         src = area2corner(area_offset(area, loca)).astype(np.float32)
         dst = area2corner(area).astype(np.float32)
         homo = cv2.getPerspectiveTransform(src, dst)
@@ -264,12 +578,12 @@ class MiniMap:
 
     def _predict_rotation(self, image):
         '''具体原理：https://www.bilibili.com/video/BV1A84y1A7ku'''
-        d = MINIMAP_RADIUS * 2
+        d = image.shape[0]
         # Upscale image and apply Gaussian filter for smother results
         scale = 2
         image = cv2.GaussianBlur(image, (3, 3), 0)
         # Expand circle into rectangle
-        remap = cv2.remap(image, *RotationRemapTable, cv2.INTER_LINEAR)[d * 2 // 10:d * 7 // 10].astype(
+        remap = cv2.remap(image, *get_rotation_remap_table(d // 2), cv2.INTER_LINEAR)[d * 2 // 10:d * 7 // 10].astype(
             np.float32)
         remap = cv2.resize(remap, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
         # Find derivative
@@ -280,28 +594,22 @@ class MiniMap:
             cv2.imshow('gradx', gradx_display)
             cv2.waitKey(1)
 
-        # Magic parameters for scipy.find_peaks
-        para = {
-            'height': 150,
-            'wlen': d * scale,
-        }
-
+        length = d * scale
         # `l` for the left of sight area, derivative is positive
         # `r` for the right of sight area, derivative is negative
-        l = np.bincount(signal.find_peaks(gradx.ravel(), **para)[0] % (d * scale), minlength=d * scale)
-        r = np.bincount(signal.find_peaks(-gradx.ravel(), **para)[0] % (d * scale), minlength=d * scale)
+        gradx = gradx.ravel()
+        l = np.bincount(find_peaks_above(gradx, 150) % length, minlength=length)
+        r = np.bincount(find_peaks_above(-gradx, 150) % length, minlength=length)
         l, r = np.maximum(l - r, 0), np.maximum(r - l, 0)
 
-        conv0 = []
+        # All offsets at once, convolving before rolling is the same as rolling before convolving
         kernel = 2 * scale
-        for offset in range(-kernel + 1, kernel):
-            result = l * convolve(np.roll(r, -d * scale // 4 + offset), kernel=3 * scale)
-            minus = l * convolve(np.roll(r, offset), kernel=10 * scale) // 5
-            result -= minus
-            result = convolve(result, kernel=3 * scale)
-            conv0 += [result]
-
-        conv0 = np.array(conv0)
+        offsets = np.arange(-kernel + 1, kernel)[:, np.newaxis]
+        index = np.arange(length)
+        right = convolve_fft(r, kernel=3 * scale)[(index - offsets + length // 4) % length]
+        minus = convolve_fft(r, kernel=10 * scale)[(index - offsets) % length] / 5
+        conv0 = convolve_fft(l * (right - minus), kernel=3 * scale)
+
         conv0[conv0 < 1] = 1
         maximum = np.max(conv0, axis=0)
         if peak_confidence(maximum) > 0.3:
@@ -311,16 +619,12 @@ class MiniMap:
             # Convolve again to reduce noice
             average = np.mean(conv0, axis=0)
             minimum = np.min(conv0, axis=0)
-            result = convolve(maximum * average * minimum, 2 * scale)
+            result = convolve_fft(maximum * average * minimum, 2 * scale)
 
         # Convert match point to degree
         self.degree = np.argmax(result) / (d * scale) * 2 * np.pi + np.pi / 4
         degree = np.argmax(result) / (d * scale) * 360 + 135
         degree = round(degree % 360, 3)
-        self.rotation = degree
-
-        # Calculate confidence
-        self.rotation_confidence = round(peak_confidence(result), 3)
 
         # Convert
         if degree > 180:
@@ -362,6 +666,44 @@ class MiniMap:
         self.minimap_print_log()
 
 
+    def observe(self, image, direction=False, rotation=False) -> MinimapPose:
+        """
+        Update position, and optionally direction and rotation, from one screenshot.
+        The minimap is cropped and converted to luma once and shared by all estimators.
+        Position is tracked by phase correlation if position_tracking is enabled.
+
+        Args:
+            image: Screenshot
+            direction (bool): Also update character direction
+            rotation (bool): Also update camera rotation
+
+        Returns:
+            MinimapPose:
+        """
+        timestamp = time.time()
+        geometry = self.geometry
+        minimap = self._get_minimap(image, geometry.radius)
+        luma = rgb2luma(minimap)
+        # Smaller minimaps share the same center, crop them from the bigger one
+        pad = geometry.radius - geometry.position_radius
+        position_luma = luma[pad:luma.shape[0] - pad, pad:luma.shape[1] - pad]
+        if self.position_tracking:
+            self._track_position(position_luma)
+        else:
+            self._update_position(position_luma)
+
+        pose = MinimapPose(timestamp, self.map_name, self.position, self.position_similarity)
+        if direction:
+            pad = geometry.radius - geometry.direction_radius
+            pose.direction = self._update_direction(minimap[pad:minimap.shape[0] - pad, pad:minimap.shape[1] - pad])
+            pose.direction_similarity = self.direction_similarity
+        if rotation and self.map_name != MAP_NAME_UNSUPPORTED:
+            pose.rotation = self._predict_rotation(self._subtract_minimap_background(luma))
+            pose.rotation_confidence = self.rotation_confidence
+        self.pose = pose
+        return pose
+
+
     def minimap_print_log(self):
         logger.trace(
             f'MiniMap '
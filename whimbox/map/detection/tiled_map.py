@@ -0,0 +1,152 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from whimbox.common.logger import logger
+from whimbox.common.utils.asset_utils import AnchorPosi
+from whimbox.map.detection.cvars import MAP_TILE_SIZE, MAP_TILE_CACHE_SIZE
+from whimbox.map.detection.utils import MapAsset
+
+
+def get_map_tiles_npy_path(path, tile_size=MAP_TILE_SIZE):
+    """
+    Path of the tiled npy file generated by dev_tool/map_assets_gen.py
+
+    Args:
+        path (str): Path of the png map
+        tile_size (int):
+
+    Returns:
+        str:
+    """
+    return f'{os.path.splitext(path)[0]}_tiles_{tile_size}.npy'
+
+
+def split_map_tiles(image, tile_size=MAP_TILE_SIZE):
+    """
+    Args:
+        image (np.ndarray): Shape (h, w) or (h, w, channel)
+        tile_size (int):
+
+    Returns:
+        np.ndarray: Shape (rows, cols, tile_size, tile_size, ...), the last row and col are padded with 0
+    """
+    h, w = image.shape[:2]
+    rows, cols = -(-h // tile_size), -(-w // tile_size)
+    padded = np.zeros((rows * tile_size, cols * tile_size) + image.shape[2:], dtype=image.dtype)
+    padded[:h, :w] = image
+    tiles = padded.reshape((rows, tile_size, cols, tile_size) + image.shape[2:])
+    return np.ascontiguousarray(tiles.swapaxes(1, 2))
+
+
+class TiledMap:
+    """
+    Map stored as fixed-size tiles. A crop is assembled from the tiles it covers,
+    and only the recently used tiles are kept in memory behind a bounded LRU.
+
+    Tiles are read from the tiled npy file with memmap, so each tile is one contiguous read.
+    If the file doesn't exist, tiles are cut from MapAsset.img.
+    """
+
+    def __init__(self, map_asset: MapAsset, tile_size=MAP_TILE_SIZE, cache_size=MAP_TILE_CACHE_SIZE):
+        self.map_asset = map_asset
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        self._tiles = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load_tiles(self):
+        if self._tiles is None:
+            path = get_map_tiles_npy_path(self.map_asset.path, self.tile_size)
+            self._tiles = False
+            if os.path.exists(path):
+                try:
+                    self._tiles = np.load(path, mmap_mode='r')
+                except (OSError, ValueError) as e:
+                    logger.warning(f'Failed to load {path}: {e}')
+            if self._tiles is False:
+                # The whole map will be decoded, run dev_tool/map_assets_gen.py to generate the tiles
+                logger.warning(f'Map tiles {path} not available, fall back to decoding {self.map_asset.path}')
+        return self._tiles
+
+    @property
+    def shape(self):
+        """
+        Shape of the map. When loaded from the tiled npy file, it's padded to whole tiles.
+        """
+        tiles = self._load_tiles()
+        if tiles is False:
+            return self.map_asset.img.shape
+        rows, cols = tiles.shape[:2]
+        return (rows * self.tile_size, cols * self.tile_size) + tiles.shape[4:]
+
+    @property
+    def dtype(self):
+        tiles = self._load_tiles()
+        if tiles is False:
+            return self.map_asset.img.dtype
+        return tiles.dtype
+
+    def _get_tile(self, row, col):
+        key = (row, col)
+        with self._lock:
+            tile = self._cache.get(key)
+            if tile is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return tile
+            self.misses += 1
+
+        tiles = self._load_tiles()
+        if tiles is False:
+            size = self.tile_size
+            tile = np.array(self.map_asset.img[row * size:(row + 1) * size, col * size:(col + 1) * size])
+        else:
+            tile = np.array(tiles[row, col])
+
+        with self._lock:
+            self._cache[key] = tile
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tile
+
+    def crop(self, anchor_posi: AnchorPosi):
+        """
+        Same as img_utils.crop on the full map, provides a black background if cropping outside of map.
+
+        Args:
+            anchor_posi (AnchorPosi): Crop area on map
+
+        Returns:
+            np.ndarray: A new array
+        """
+        x1, y1, x2, y2 = anchor_posi.x1, anchor_posi.y1, anchor_posi.x2, anchor_posi.y2
+        shape = self.shape
+        h, w = shape[:2]
+        size = self.tile_size
+        image = np.zeros((max(y2 - y1, 0), max(x2 - x1, 0)) + shape[2:], dtype=self.dtype)
+        for row in range(max(y1, 0) // size, (min(y2, h) - 1) // size + 1):
+            for col in range(max(x1, 0) // size, (min(x2, w) - 1) // size + 1):
+                tile = self._get_tile(row, col)
+                tile_x, tile_y = col * size, row * size
+                ix1, iy1 = max(x1, tile_x), max(y1, tile_y)
+                ix2, iy2 = min(x2, tile_x + tile.shape[1]), min(y2, tile_y + tile.shape[0])
+                if ix2 <= ix1 or iy2 <= iy1:
+                    continue
+                image[iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = \
+                    tile[iy1 - tile_y:iy2 - tile_y, ix1 - tile_x:ix2 - tile_x]
+        return image
+
+    def cache_info(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': hit_rate, 'tiles': len(self._cache)}
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
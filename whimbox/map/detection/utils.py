@@ -2,7 +2,10 @@ from scipy import signal
 from whimbox.common.utils.img_utils import *
 from whimbox.common.utils.asset_utils import *
 from whimbox.map.detection.cvars import MAP_NAME_UNSUPPORTED, REGION_NAME_TO_MAP_NAME_DICT
+import os
+import threading
 import traceback
+from functools import lru_cache
 
 def trans_region_name_to_map_name(region_name):
     for map_name, region_names in REGION_NAME_TO_MAP_NAME_DICT.items():
@@ -11,6 +14,40 @@ def trans_region_name_to_map_name(region_name):
     return MAP_NAME_UNSUPPORTED
 
 
+def get_map_npy_path(path, scale=None):
+    """
+    Path of the npy file generated by dev_tool/map_assets_gen.py
+
+    Args:
+        path (str): Path of the png map
+        scale (float): Pyramid level, None for the map itself
+
+    Returns:
+        str:
+    """
+    root = os.path.splitext(path)[0]
+    if scale is None:
+        return f'{root}.npy'
+    return f'{root}_pyramid_{scale}.npy'
+
+
+def load_map_image(path):
+    """
+    Load a map from the pre-generated npy file with memmap, so only the pages in use stay in memory.
+    Fall back to decoding the png if the npy file doesn't exist.
+
+    Args:
+        path (str): Path of the png map
+
+    Returns:
+        np.ndarray: Read-only if loaded from npy
+    """
+    npy_path = get_map_npy_path(path)
+    if os.path.exists(npy_path):
+        return np.load(npy_path, mmap_mode='r')
+    return load_image(path)
+
+
 class MapAsset(AssetBase):
     def __init__(self, name=None):
         if name is None:
@@ -18,7 +55,39 @@ class MapAsset(AssetBase):
         else:
             super().__init__(name)
         self.path = self.get_img_path()
-        self.img = load_image(self.path)
+        # Maps are huge, load them on first use
+        self._img = None
+        self._pyramid = {}
+        self._lock = threading.RLock()
+
+    @property
+    def img(self):
+        if self._img is None:
+            with self._lock:
+                if self._img is None:
+                    self._img = load_map_image(self.path)
+        return self._img
+
+    def get_pyramid(self, scale):
+        """
+        Args:
+            scale (float): Pyramid level, 1 for the map itself
+
+        Returns:
+            np.ndarray: Map downscaled by scale
+        """
+        if scale == 1:
+            return self.img
+        if scale not in self._pyramid:
+            with self._lock:
+                if scale not in self._pyramid:
+                    npy_path = get_map_npy_path(self.path, scale)
+                    if os.path.exists(npy_path):
+                        image = np.load(npy_path, mmap_mode='r')
+                    else:
+                        image = cv2.resize(self.img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                    self._pyramid[scale] = image
+        return self._pyramid[scale]
 
 
 def create_circle_mask(h, w, center=None, radius=None):
@@ -35,6 +104,43 @@ def create_circle_mask(h, w, center=None, radius=None):
     return mask
 
 
+@lru_cache(maxsize=None)
+def _polar_grid(radius, angles):
+    r = np.arange(1, radius + 1, dtype=np.float32)[:, np.newaxis]
+    theta = np.arange(angles, dtype=np.float32)[np.newaxis, :] * np.float32(2 * np.pi / angles)
+    return r * np.cos(theta), r * np.sin(theta)
+
+
+def polar_descriptor(image, radius, angles):
+    """
+    Sample image on a polar grid around its intensity centroid.
+    Rotating the image only moves values along the angle axis,
+    so a rotated copy can be recognized by a dot product with descriptors of rotated templates.
+
+    Args:
+        image (np.ndarray): Shape (h, w), weights of the shape
+        radius (int): Rings 1px apart from 1 to radius
+        angles (int): Samples on each ring
+
+    Returns:
+        np.ndarray: Shape (radius * angles,), float32 with zero mean and unit norm.
+            None if image is empty.
+    """
+    image = image.astype(np.float32)
+    moments = cv2.moments(image)
+    if moments['m00'] <= 0:
+        return None
+    cx, cy = moments['m10'] / moments['m00'], moments['m01'] / moments['m00']
+    mx, my = _polar_grid(radius, angles)
+    polar = cv2.remap(image, mx + np.float32(cx), my + np.float32(cy), cv2.INTER_LINEAR,
+                      borderMode=cv2.BORDER_CONSTANT, borderValue=0).ravel()
+    polar -= polar.mean()
+    norm = np.linalg.norm(polar)
+    if norm <= 0:
+        return None
+    return polar / norm
+
+
 def rotate_bound(image, angle):
     """
     Rotate an image with outbound
@@ -90,6 +196,30 @@ def cubic_find_maximum(image, precision=0.05):
     return sim, loca
 
 
+def top_k_maximum(image, k=5, radius=2):
+    """
+    Find the top k local maximums, neighbours within radius of a found maximum are suppressed.
+
+    Args:
+        image (np.ndarray): Shape (h, w), float
+        k (int):
+        radius (int):
+
+    Returns:
+        list[tuple[float, tuple[int, int]]]: [(value, (x, y)), ...] sorted from high to low
+    """
+    image = image.copy()
+    peaks = []
+    for _ in range(k):
+        _, value, _, loca = cv2.minMaxLoc(image)
+        if value <= 0:
+            break
+        peaks.append((value, loca))
+        x, y = loca
+        image[max(y - radius, 0):y + radius + 1, max(x - radius, 0):x + radius + 1] = 0
+    return peaks
+
+
 def image_center_pad(image, size, value=(0, 0, 0)):
     """
     Create a new image with given `size`, placing given `image` in the middle.
@@ -150,12 +280,52 @@ def convolve(arr, kernel=3):
     return sum(np.roll(arr, i) * (kernel - abs(i)) // kernel for i in range(-kernel + 1, kernel))
 
 
+@lru_cache(maxsize=None)
+def _triangle_kernel_fft(length, kernel):
+    weight = np.zeros(length, dtype=np.float64)
+    offsets = np.arange(-kernel + 1, kernel)
+    np.add.at(weight, offsets % length, (kernel - np.abs(offsets)) / kernel)
+    return np.fft.rfft(weight)
+
+
+def convolve_fft(arr, kernel=3):
+    """
+    Same circular triangle convolution as `convolve`, done with FFT along the last axis.
+    Not rounded to integers.
+
+    Args:
+        arr (np.ndarray): Shape (N,) or (M, N)
+        kernel (int):
+
+    Returns:
+        np.ndarray:
+    """
+    length = arr.shape[-1]
+    return np.fft.irfft(np.fft.rfft(arr, axis=-1) * _triangle_kernel_fft(length, kernel), n=length, axis=-1)
+
+
+def find_peaks_above(arr, height):
+    """
+    Local maxima not lower than `height`, same as `signal.find_peaks(arr, height=height)[0]`
+    except that flat peaks are ignored.
+
+    Args:
+        arr (np.ndarray): Shape (N,)
+        height (float):
+
+    Returns:
+        np.ndarray: Indexes of peaks
+    """
+    mid = arr[1:-1]
+    return np.flatnonzero((mid > arr[:-2]) & (mid > arr[2:]) & (mid >= height)) + 1
+
+
 def peak_confidence(arr, **kwargs):
     """
     Evaluate the prominence of the highest peak
 
     Args:
-        arr (np.ndarray): Shape (N,)
+        arr (np.ndarray): Shape (N,), circular
         **kwargs: Additional kwargs for signal.find_peaks
 
     Returns:
@@ -166,9 +336,16 @@ def peak_confidence(arr, **kwargs):
         'prominence': 10,
     }
     para.update(kwargs)
-    length = len(arr)
-    peaks, properties = signal.find_peaks(np.concatenate((arr, arr, arr)), **para)
-    peaks = [h for p, h in zip(peaks, properties['peak_heights']) if length <= p < length * 2]
+    # Start the circle from the highest point and close it there,
+    # so no peak lies across the ends and prominences are the same as on a circle.
+    top = int(np.argmax(arr))
+    ring = np.roll(arr, -top)
+    ring = np.append(ring, ring[0])
+    peaks, properties = signal.find_peaks(ring, **para)
+    peaks = list(properties['peak_heights'])
+    # The highest point itself is at the ends, its prominence reaches the lowest point
+    if arr[top] >= para['height'] and arr[top] - np.min(arr) >= para['prominence']:
+        peaks.append(arr[top])
     peaks = sorted(peaks, reverse=True)
 
     count = len(peaks)
@@ -0,0 +1,81 @@
+import time
+import typing as t
+
+from whimbox.common.base_threading import AdvanceThreading
+from whimbox.common.logger import logger
+from whimbox.map.detection.cvars import LOCALIZATION_RATE
+from whimbox.map.detection.minimap import MinimapPose
+
+
+class LocalizationService(AdvanceThreading):
+    """
+    后台定位线程，按固定频率识别小地图，发布最新的位置和朝向。
+
+    每次识别产生一个新的MinimapPose，发布时只替换引用，读取不需要加锁，也不会读到一半的结果。
+    控制循环用latest_pose()取结果，不用等待截图和匹配。
+    """
+
+    def __init__(self, nikki_map, rate=LOCALIZATION_RATE, direction=False, rotation=True):
+        """
+        Args:
+            nikki_map (Map):
+            rate (float): 每秒识别次数
+            direction (bool): 是否识别角色朝向
+            rotation (bool): 是否识别镜头朝向
+        """
+        super().__init__(thread_name='LocalizationService')
+        self.daemon = True
+        self.nikki_map = nikki_map
+        self.direction = direction
+        self.rotation = rotation
+        self.interval = 1 / rate
+        self.while_sleep = 0
+        # (位置的重置次数, 识别结果)，一起替换
+        self._published: t.Tuple[int, t.Optional[MinimapPose]] = (nikki_map.position_generation, None)
+        # 实际的识别频率和每次识别的耗时，指数平均
+        self.measured_rate = 0.
+        self.measured_cost = 0.
+        self._last_loop_time = None
+
+    def set_rate(self, rate):
+        self.interval = 1 / rate
+
+    def latest_pose(self) -> t.Optional[MinimapPose]:
+        """
+        Returns:
+            MinimapPose: 位置重置之后还没有新的识别结果时为None
+        """
+        generation, pose = self._published
+        if generation != self.nikki_map.position_generation:
+            return None
+        return pose
+
+    def reset_pose(self):
+        """位置被重置，丢弃之前的识别结果"""
+        self._published = (self.nikki_map.position_generation, None)
+
+    def _update_stats(self, start_time, cost):
+        if self._last_loop_time is not None:
+            period = start_time - self._last_loop_time
+            if period > 0:
+                self.measured_rate = 0.9 * self.measured_rate + 0.1 / period if self.measured_rate else 1 / period
+        self._last_loop_time = start_time
+        self.measured_cost = 0.9 * self.measured_cost + 0.1 * cost if self.measured_cost else cost
+
+    def loop(self):
+        start_time = time.time()
+        # 还没有初始化位置时，等同步调用的get_position去初始化
+        if self.nikki_map.small_map_init_flag:
+            # 识别过程中位置可能被重置，用识别前的重置次数发布，latest_pose会丢弃这次结果
+            generation = self.nikki_map.position_generation
+            try:
+                pose = self.nikki_map.observe_frame(direction=self.direction, rotation=self.rotation)
+            except Exception as e:
+                logger.error(f"后台定位失败: {e}")
+                pose = None
+            if pose is not None:
+                self._published = (generation, pose)
+        cost = time.time() - start_time
+        self._update_stats(start_time, cost)
+        # run()在每次loop前sleep，扣掉本次识别的耗时，保持固定频率
+        self.while_sleep = max(self.interval - cost, 0)
@@ -1,12 +1,13 @@
 from whimbox.common import timer_module
-from whimbox.map.detection.cvars import MOVE_SPEED
+from whimbox.map.detection.cvars import MOVE_SPEED, LOCALIZATION_RATE, LOCALIZATION_MAX_AGE
 from whimbox.ui.ui import ui_control
 from whimbox.ui.ui_assets import *
 from whimbox.ui.page_assets import *
 from whimbox.interaction.interaction_core import itt
 from whimbox.map.data.nikki_teleporter import DICT_TELEPORTER
 from whimbox.map.detection.bigmap import BigMap
-from whimbox.map.detection.minimap import MiniMap
+from whimbox.map.detection.minimap import MiniMap, MinimapPose
+from whimbox.map.localization import LocalizationService
 from whimbox.map.detection.utils import trans_region_name_to_map_name
 from whimbox.map.convert import *
 from whimbox.common.logger import logger
@@ -14,8 +15,11 @@ from whimbox.common.utils.posi_utils import *
 from whimbox.common.errors import BigMapTPError
 from whimbox.common.utils.ui_utils import *
 from whimbox.common.cvars import get_current_stop_flag
+from whimbox.common.lazy_singleton import LazySingleton
 
+import copy
 import threading
+from collections import deque
 import time
 import typing as t
 
@@ -39,14 +43,40 @@ class Map(MiniMap, BigMap):
         self.lock = threading.Lock()
         self.check_bigmap_timer = timer_module.Timer(5)
         self.last_valid_position = [0, 0]
-        self.history_position_list = []
+        self.history_position_list = deque(maxlen=20)
         self.region_name = None
         self.map_name = None
+        # 后台定位线程，见start_localization
+        self.localization = None
+        # get_rotation上一次返回的识别结果的时间
+        self.rotation_timestamp = 0
+        # 每次重置位置加一，后台定位用来丢弃重置前的识别结果
+        self.position_generation = 0
         
 
-    def _upd_smallmap(self) -> None:
-        if itt.get_img_existence(IconPageMainFeature):
-            self.update_position(itt.capture())
+    def init_position(self, position: t.Tuple[int, int]):
+        # 后台定位线程也会更新位置，重置要在锁内进行
+        with self.lock:
+            MiniMap.init_position(self, position)
+            self.position_generation += 1
+        if self.localization is not None:
+            self.localization.reset_pose()
+
+    def observe_frame(self, direction=False, rotation=False) -> t.Optional[MinimapPose]:
+        """
+        截图并识别小地图，更新位置。同步调用和后台定位都用这个方法
+
+        Returns:
+            MinimapPose: 不在主界面时为None
+        """
+        # 判断页面和识别小地图用同一帧截图
+        with itt.hold_frame():
+            if not itt.get_img_existence(IconPageMainFeature):
+                return None
+            _, frame = itt.get_frame_view()
+            # 后台定位线程和同步调用都会更新位置，不能同时进行
+            with self.lock:
+                return self.observe(frame[:, :, :3], direction=direction, rotation=rotation)
 
 
     def _is_reset_position(self, curr_posi, threshold=0.8):
@@ -59,17 +89,17 @@ class Map(MiniMap, BigMap):
         Returns:
             _type_: _description_
         """
-        if len(self.history_position_list) >= 20:
-            over_times = 0
-            for i in self.history_position_list:
-                if euclidean_distance(i, curr_posi) >= 150:
-                    over_times += 1
-            return over_times / 20 > threshold
+        if len(self.history_position_list) >= self.history_position_list.maxlen:
+            distance = np.linalg.norm(np.subtract(self.history_position_list, curr_posi), axis=1)
+            return np.count_nonzero(distance >= 150) / len(distance) > threshold
         return False
 
-    def get_position(self, is_verify_position=False, use_cache = False):
+    def get_position(self, is_verify_position=False, use_cache = False, direction=False, rotation=False):
         """get current character position
 
+        Args:
+            direction, rotation: 同一帧截图中顺便识别角色朝向和镜头朝向，结果在self.pose中
+
         Returns:
             list: px format
         """
@@ -81,12 +111,12 @@ class Map(MiniMap, BigMap):
             ui_control.ensure_page(page_main)
             self.small_map_init_flag = True
             
-        self._upd_smallmap()
+        self.observe_frame(direction=direction, rotation=rotation)
         self.history_position_list.append(self.position)
         # 由于minimap的update_position方法种已经有校验了，所以这里一般不校验
         if is_verify_position:
             if self._is_reset_position(self.position):
-                self.history_position_list = []
+                self.history_position_list.clear()
             else:
                 last_dist = euclidean_distance(self.last_valid_position, self.position)
                 error_limit = self.MINIMAP_ERROR_BASE_LIMIT + self.smallmap_upd_timer.get_diff_time() * MOVE_SPEED
@@ -99,8 +129,6 @@ class Map(MiniMap, BigMap):
         self.smallmap_upd_timer.reset()
         r_posi = self.position
         self.last_valid_position = r_posi
-        if len(self.history_position_list) > 20:
-            self.history_position_list.pop(0)
         return list(r_posi)
 
 
@@ -110,7 +138,7 @@ class Map(MiniMap, BigMap):
         else:
             hsv_lower = [0, 0, 0]
             hsv_upper = [180, 255, 180] # hsv阈值处理，排除地图背景图案和文字的干扰
-            self.region_name= itt.ocr_single_line(AreaBigMapRegionName, padding=50, hsv_limit=(hsv_lower, hsv_upper))
+            self.region_name= itt.ocr_single_line(AreaBigMapRegionName, hsv_limit=(hsv_lower, hsv_upper), rec_only=True)
             self.map_name = trans_region_name_to_map_name(self.region_name)
             return self.region_name, self.map_name
 
@@ -165,13 +193,73 @@ class Map(MiniMap, BigMap):
         # self.init_position(tuple(list(map(int,max_position))))
         # logger.info(f"init_smallmap_from_teleporter:{max_n} {max_position} {max_tper.name}")
 
+    def get_pose(self, direction=False, rotation=False, is_verify_position=False) -> MinimapPose:
+        """
+        一次截图得到位置，按需同时得到角色朝向和镜头朝向。
+        同一轮循环中复用返回的记录，不要再分别调用get_position和get_rotation
+
+        Returns:
+            MinimapPose: 不在主界面时为上一次的结果
+        """
+        position = self.get_position(is_verify_position=is_verify_position, direction=direction, rotation=rotation)
+        if self.pose is None:
+            pose = MinimapPose(time.time(), self.map_name, self.position, self.position_similarity)
+        else:
+            # 发布给后台定位的记录不能修改
+            pose = copy.copy(self.pose)
+        # 校验失败时get_position返回的是上一个有效位置
+        pose.position = tuple(position)
+        return pose
+
+    def start_localization(self, rate=LOCALIZATION_RATE, direction=False, rotation=True):
+        """启动后台定位线程，之后可以用latest_pose()取结果"""
+        if self.localization is not None:
+            self.localization.set_rate(rate)
+            return
+        self.localization = LocalizationService(self, rate=rate, direction=direction, rotation=rotation)
+        self.localization.start_threading()
+
+    def stop_localization(self):
+        if self.localization is not None:
+            self.localization.stop_threading()
+            self.localization = None
+
+    def latest_pose(self, max_age=LOCALIZATION_MAX_AGE) -> t.Optional[MinimapPose]:
+        """
+        后台定位发布的最新结果，不会阻塞
+
+        Returns:
+            MinimapPose: 没有启动后台定位，或结果超过max_age秒时为None
+        """
+        if self.localization is None:
+            return None
+        pose = self.localization.latest_pose()
+        if pose is None or time.time() - pose.timestamp > max_age:
+            return None
+        return pose
+
+    def current_pose(self, direction=False, rotation=False, max_age=LOCALIZATION_MAX_AGE) -> MinimapPose:
+        """优先使用后台定位的结果，没有时同步识别"""
+        pose = self.latest_pose(max_age)
+        if pose is not None and (not direction or pose.direction is not None) \
+                and (not rotation or pose.rotation is not None):
+            return pose
+        return self.get_pose(direction=direction, rotation=rotation)
+
     def get_direction(self) -> float:
         self.update_direction(itt.capture())
         return self.direction
 
     def get_rotation(self) -> float:
+        # 后台定位有新结果时直接用，每次调用仍然是一次新的识别
+        pose = self.latest_pose()
+        if pose is not None and pose.rotation is not None and pose.timestamp > self.rotation_timestamp:
+            self.rotation_timestamp = pose.timestamp
+            return pose.rotation
         pt = time.time()
-        self.update_rotation(itt.capture())
+        with self.lock:
+            self.update_rotation(itt.capture())
+        self.rotation_timestamp = pt
         if time.time() - pt > 0.1:
             logger.info(f"get_rotation spent too long: {time.time() - pt}")
         return self.rotation
@@ -338,7 +426,7 @@ class Map(MiniMap, BigMap):
         click_posi = self._move_bigmap(tp_posi)
         itt.move_and_click(click_posi)
         itt.wait_until_stable()
-        button_text = itt.ocr_single_line(AreaBigMapTeleportButton)
+        button_text = itt.ocr_single_line(AreaBigMapTeleportButton, rec_only=True)
         if button_text == "传送":
             AreaBigMapTeleportButton.click()
         elif button_text == "追踪":
@@ -349,7 +437,7 @@ class Map(MiniMap, BigMap):
             hsv_upper = [180, 15, 255]   # hsv阈值处理，排除地图背景图案和文字的干扰
             if scroll_find_click(AreaBigMapTeleporterSelect, target_teleporter.name, hsv_limit=(hsv_lower, hsv_upper)):
                 itt.wait_until_stable()
-                button_text = itt.ocr_single_line(AreaBigMapTeleportButton)
+                button_text = itt.ocr_single_line(AreaBigMapTeleportButton, rec_only=True)
                 if button_text == "传送":
                     AreaBigMapTeleportButton.click()
                 elif button_text == "追踪":
@@ -368,8 +456,12 @@ class Map(MiniMap, BigMap):
         itt.delay(0.5, comment="等待小地图彻底加载完毕")
         return tp_posi
 
-nikki_map = Map()
-logger.info(f"nikki map object created")
+def _create_nikki_map():
+    nikki_map = Map()
+    logger.info(f"nikki map object created")
+    return nikki_map
+
+nikki_map = LazySingleton('nikki_map', _create_nikki_map)
 
 if __name__ == '__main__':
     # 传送到菇菇聚落
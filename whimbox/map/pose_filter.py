@@ -0,0 +1,134 @@
+import time
+
+import numpy as np
+
+from whimbox.map.detection.cvars import *
+
+
+class PoseFilter:
+    """
+    匀速模型的卡尔曼滤波，状态为png地图上的(x, y, vx, vy)。
+
+    小地图定位结果作为位置观测，MoveController发出的移动指令作为速度观测。
+    预测的位置和不确定度用来缩小小地图匹配的搜索范围，
+    观测和预测的马氏距离超过门限时认为是错误的定位结果。
+    """
+
+    def __init__(self):
+        self.x = np.zeros(4)
+        self.P = np.eye(4)
+        self.timestamp = None
+        self.control = None
+        # 连续被拒绝、且彼此一致的观测次数，和最后一次被拒绝的观测
+        self.reject_count = 0
+        self._rejected = None
+
+    @property
+    def initialized(self):
+        return self.timestamp is not None
+
+    def reset(self, position, timestamp=None):
+        """位置突变（初始化、传送、重新定位）后重置，速度清零"""
+        self.x = np.array([position[0], position[1], 0., 0.])
+        self.P = np.diag([POSE_FILTER_MEASURE_NOISE ** 2] * 2 + [(MOVE_SPEED / 2) ** 2] * 2)
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.reject_count = 0
+        self._rejected = None
+
+    def set_control(self, velocity):
+        """
+        Args:
+            velocity (tuple[float, float]): 移动指令对应的速度(png px/s)，None为没有指令
+        """
+        self.control = None if velocity is None else np.array(velocity, dtype=np.float64)
+
+    def _predicted(self, timestamp):
+        dt = max(timestamp - self.timestamp, 0.)
+        F = np.eye(4)
+        F[0, 2] = F[1, 3] = dt
+        # 加速度作为过程噪声
+        q = POSE_FILTER_ACCEL_NOISE ** 2
+        Q = np.zeros((4, 4))
+        Q[[0, 1], [0, 1]] = q * dt ** 4 / 4
+        Q[[0, 1], [2, 3]] = Q[[2, 3], [0, 1]] = q * dt ** 3 / 2
+        Q[[2, 3], [2, 3]] = q * dt ** 2
+        x = F @ self.x
+        P = F @ self.P @ F.T + Q
+        if self.control is not None:
+            # 移动指令作为速度观测
+            H = np.zeros((2, 4))
+            H[0, 2] = H[1, 3] = 1
+            S = H @ P @ H.T + np.eye(2) * POSE_FILTER_CONTROL_NOISE ** 2
+            K = P @ H.T @ np.linalg.inv(S)
+            x = x + K @ (self.control - H @ x)
+            P = (np.eye(4) - K @ H) @ P
+        return x, P
+
+    def predict(self, timestamp=None):
+        """
+        不改变状态，只预测
+
+        Returns:
+            np.ndarray: 预测位置
+            float: 位置标准差的最大值(png px)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        x, P = self._predicted(timestamp)
+        sigma = np.sqrt(np.max(np.linalg.eigvalsh(P[:2, :2])))
+        return x[:2], sigma
+
+    def mahalanobis(self, position, timestamp=None):
+        """
+        Returns:
+            float: 观测位置和预测位置马氏距离的平方
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        x, P = self._predicted(timestamp)
+        S = P[:2, :2] + np.eye(2) * POSE_FILTER_MEASURE_NOISE ** 2
+        y = np.asarray(position, dtype=np.float64) - x[:2]
+        return float(y @ np.linalg.inv(S) @ y)
+
+    def gate(self, position, timestamp=None):
+        """
+        Returns:
+            bool: 观测是否可信。
+                被拒绝的观测连续多次彼此一致时，说明是滤波器跟丢了而不是识别错误，重新接受观测
+        """
+        if not self.initialized:
+            return True
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.mahalanobis(position, timestamp) <= POSE_FILTER_GATE:
+            self.reject_count = 0
+            self._rejected = None
+            return True
+        if self._rejected is not None:
+            last_position, last_timestamp = self._rejected
+            limit = MOVE_SPEED * (timestamp - last_timestamp) + 3 * POSE_FILTER_MEASURE_NOISE
+            consistent = np.linalg.norm(np.subtract(position, last_position)) <= limit
+        else:
+            consistent = False
+        self.reject_count = self.reject_count + 1 if consistent else 1
+        self._rejected = (position, timestamp)
+        if self.reject_count > POSE_FILTER_MAX_REJECTS:
+            self.reset(position, timestamp)
+            return True
+        return False
+
+    def update(self, position, timestamp=None):
+        """加入一个位置观测"""
+        timestamp = time.time() if timestamp is None else timestamp
+        if not self.initialized:
+            self.reset(position, timestamp)
+            return
+        x, P = self._predicted(timestamp)
+        H = np.zeros((2, 4))
+        H[0, 0] = H[1, 1] = 1
+        S = H @ P @ H.T + np.eye(2) * POSE_FILTER_MEASURE_NOISE ** 2
+        K = P @ H.T @ np.linalg.inv(S)
+        self.x = x + K @ (np.asarray(position, dtype=np.float64) - H @ x)
+        self.P = (np.eye(4) - K @ H) @ P
+        self.timestamp = timestamp
+
+    @property
+    def velocity(self):
+        return self.x[2:]
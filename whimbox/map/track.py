@@ -5,7 +5,7 @@ from whimbox.interaction.interaction_core import itt
 from whimbox.common.utils.img_utils import *
 from whimbox.ui.material_icon_assets import material_icon_dict
 from whimbox.common.utils.ui_utils import *
-from whimbox.map.map import nikki_map, MINIMAP_RADIUS
+from whimbox.map.map import nikki_map
 from whimbox.view_and_move.utils import *
 from whimbox.ability.cvar import *
 
@@ -90,12 +90,13 @@ class Track:
     def get_material_track_degree(self):
         '''根据小地图，计算材料与玩家之间的角度'''
         cap = itt.capture()
-        minimap_img = nikki_map._get_minimap(cap, MINIMAP_RADIUS)
+        minimap_radius = nikki_map.geometry.radius
+        minimap_img = nikki_map._get_minimap(cap, minimap_radius)
         lower = [13, 90, 160]
         upper = [15, 200, 255]
         minimap_hsv = process_with_hsv_limit(minimap_img, lower, upper)
         # 在小地图中心绘制一个圆，来遮住箭头
-        cv2.circle(minimap_hsv, (MINIMAP_RADIUS, MINIMAP_RADIUS), 10, (255, 255, 255), -1)
+        cv2.circle(minimap_hsv, (minimap_radius, minimap_radius), 10, (255, 255, 255), -1)
         minimap_blur = cv2.GaussianBlur(minimap_hsv, (3, 3), 1)
         if CV_DEBUG_MODE:
             cv2.imshow("minimap_blur", minimap_blur)
@@ -113,7 +114,7 @@ class Track:
         )
         
         if circles is not None:
-            minimap_center = (MINIMAP_RADIUS, MINIMAP_RADIUS)
+            minimap_center = (minimap_radius, minimap_radius)
             min_dist = 99999
             track_circle = None
             for x, y, r in circles[0, :]:
@@ -2,16 +2,17 @@ import time
 import threading
 from enum import Enum
 from whimbox.interaction.interaction_core import itt
+from whimbox.interaction.frame_pipeline import FramePipeline, Frame
 from whimbox.ui.ui_assets import *
 from whimbox.action.fishing import FishingTask
 from whimbox.action.skip_dialog import SkipDialogTask
 from whimbox.common.logger import logger
 from whimbox.common.cvars import has_foreground_task
-from whimbox.common.utils.img_utils import crop
 from whimbox.task.task_template import STATE_TYPE_SUCCESS
 from whimbox.common.cvars import current_stop_flag
 from whimbox.common.keybind import keybind
 from whimbox.common.handle_lib import HANDLE_OBJ
+from whimbox.common.lazy_singleton import LazySingleton
 
 
 class BackgroundFeature(Enum):
@@ -75,10 +76,10 @@ class BackgroundTaskManager:
         
         # 功能配置（默认全部关闭，设置不同的执行间隔）
         self.feature_configs = {
-            BackgroundFeature.AUTO_FISHING: FeatureConfig(enabled=False, interval=5),
-            BackgroundFeature.AUTO_DIALOGUE: FeatureConfig(enabled=False, interval=5),
+            BackgroundFeature.AUTO_FISHING: FeatureConfig(enabled=False, interval=10),
+            BackgroundFeature.AUTO_DIALOGUE: FeatureConfig(enabled=False, interval=10),
             BackgroundFeature.AUTO_PICKUP: FeatureConfig(enabled=False, interval=1),
-            BackgroundFeature.AUTO_CLEAR: FeatureConfig(enabled=False, interval=3),
+            BackgroundFeature.AUTO_CLEAR: FeatureConfig(enabled=False, interval=6),
         }
         
         # 从配置文件加载状态（但不自动启动任务）
@@ -182,10 +183,24 @@ class BackgroundTask:
     
     def __init__(self, manager: BackgroundTaskManager):
         self.manager = manager
-        self.check_interval = 0.1  # 画面检测间隔（秒）
+        self.check_interval = 0.05  # 画面检测间隔（秒），扣除检测耗时
         self.was_paused = False  # 上一次循环是否处于暂停状态
         self.stop_event = threading.Event()  # 停止事件
 
+        # 所有检测器共享一次截图，在线程池中并行检测
+        self.pipeline = FramePipeline(max_workers=len(BackgroundFeature))
+        self.pipeline.register(BackgroundFeature.AUTO_PICKUP, self._detect_pickup_opportunity)
+        self.pipeline.register(BackgroundFeature.AUTO_CLEAR, self._detect_clear_opportunity)
+        self.pipeline.register(BackgroundFeature.AUTO_FISHING, self._detect_fishing_opportunity)
+        self.pipeline.register(BackgroundFeature.AUTO_DIALOGUE, self._detect_dialogue_opportunity)
+        # 检测到后执行的操作，按执行顺序排列
+        self.executors = [
+            (BackgroundFeature.AUTO_PICKUP, self._execute_pickup),
+            (BackgroundFeature.AUTO_CLEAR, self._execute_clear),
+            (BackgroundFeature.AUTO_FISHING, self._execute_fishing),
+            (BackgroundFeature.AUTO_DIALOGUE, self._execute_dialogue),
+        ]
+
     def log_to_gui(self, msg, is_error=False, type="update_ai_message"):
         from whimbox.ingame_ui.ingame_ui import win_ingame_ui
         if is_error:
@@ -225,6 +240,7 @@ class BackgroundTask:
         
         try:
             while not self.stop_event.is_set():
+                loop_start = time.time()
                 # 检测是否有前台任务在运行
                 if has_foreground_task():
                     # 有前台任务在运行，暂停后台任务
@@ -243,44 +259,27 @@ class BackgroundTask:
                 
                 # 检测各种画面状态
                 try:
-                    cap = itt.capture()
-                    
-                    # 检测采集状态 - 根据间隔执行
-                    pickup_config = self.manager.get_feature_config(BackgroundFeature.AUTO_PICKUP)
-                    if pickup_config and pickup_config.should_execute():
-                        if self._detect_pickup_opportunity(cap):
-                            # 快速按F连续采集
-                            while True:
-                                itt.key_press(keybind.KEYBIND_INTERACTION)
-                                time.sleep(0.02)
-                                cap = itt.capture()
-                                if not self._detect_pickup_opportunity(cap):
-                                    break
+                    # 本轮需要执行的检测
+                    features = [feature for feature, config in self.manager.feature_configs.items()
+                                if config.should_execute()]
+                    if not features:
+                        time.sleep(self.check_interval)
+                        continue
+                    results = self.pipeline.run(self.pipeline.capture(), features)
 
-                    # 检测清洁跳过状态
-                    clear_config = self.manager.get_feature_config(BackgroundFeature.AUTO_CLEAR)
-                    if clear_config and clear_config.should_execute():
-                        if self._detect_clear_opportunity(cap):
-                            itt.key_press(keybind.KEYBIND_INTERACTION)
-                            # 清洁的跳过按钮和剧情动画的跳过按钮是一样的
-                            # 所以判断按了F后，跳过按钮是否消失，如果没消失就一直等待，避免又检测到跳过按钮，不断按F
-                            while not self.stop_event.is_set():
-                                time.sleep(0.3)
-                                if not itt.get_img_existence(IconSkip):
-                                    break
+                    # 按顺序处理：采集、清洁跳过、钓鱼、对话
+                    remaining = list(features)
+                    for feature, execute in self.executors:
+                        if feature not in remaining:
+                            continue
+                        remaining.remove(feature)
+                        if not results.get(feature):
+                            continue
+                        execute()
+                        # 执行过操作后画面已经变了，剩下的功能要用新的截图重新检测
+                        if remaining and not self.stop_event.is_set():
+                            results = self.pipeline.run(self.pipeline.capture(), remaining)
 
-                    # 检测钓鱼状态 - 根据间隔执行
-                    fishing_config = self.manager.get_feature_config(BackgroundFeature.AUTO_FISHING)
-                    if fishing_config and fishing_config.should_execute():
-                        if self._detect_fishing_opportunity(cap):
-                            self._execute_fishing()      
-                    
-                    # 检测对话状态 - 根据间隔执行
-                    dialogue_config = self.manager.get_feature_config(BackgroundFeature.AUTO_DIALOGUE)
-                    if dialogue_config and dialogue_config.should_execute():
-                        if self._detect_dialogue_opportunity(cap):
-                            self._execute_dialogue()
-                            
                 except Exception as e:
                     if not HANDLE_OBJ.is_alive():
                         time.sleep(10)
@@ -294,19 +293,35 @@ class BackgroundTask:
                             logger.error(f"后台小工具检测出错: {e}")
                 
                 # 等待一段时间再检测
-                time.sleep(self.check_interval)
+                time.sleep(max(self.check_interval - (time.time() - loop_start), 0))
         
         except Exception as e:
             logger.error(f"后台小工具运行出错: {e}")
         finally:
+            self.pipeline.shutdown()
             logger.info("后台小工具已停止")
     
-    def _detect_fishing_opportunity(self, cap) -> bool:
+    def _execute_pickup(self):
+        """快速按F连续采集"""
+        while True:
+            itt.key_press(keybind.KEYBIND_INTERACTION)
+            time.sleep(0.02)
+            if not self._detect_pickup_opportunity(self.pipeline.capture()):
+                break
+
+    def _execute_clear(self):
+        """跳过清洁动画"""
+        itt.key_press(keybind.KEYBIND_INTERACTION)
+        # 清洁的跳过按钮和剧情动画的跳过按钮是一样的
+        # 所以判断按了F后，跳过按钮是否消失，如果没消失就一直等待，避免又检测到跳过按钮，不断按F
+        while not self.stop_event.is_set():
+            time.sleep(0.3)
+            if not itt.get_img_existence(IconSkip):
+                break
+
+    def _detect_fishing_opportunity(self, frame: Frame) -> bool:
         """检测是否可以钓鱼"""
-        cap = crop(cap, AreaFishingIcons.position)
-        if itt.get_img_existence(IconFishingFinish, cap=cap):
-            return True
-        return False
+        return frame.get_img_existence(IconFishingFinish, AreaFishingIcons.position)
     
     def _execute_fishing(self):
         """执行钓鱼任务"""
@@ -323,12 +338,9 @@ class BackgroundTask:
         except Exception as e:
             logger.error(f"自动钓鱼出错: {e}")
 
-    def _detect_dialogue_opportunity(self, cap) -> bool:
+    def _detect_dialogue_opportunity(self, frame: Frame) -> bool:
         """检测是否进入对话"""
-        cap = crop(cap, IconSkipDialog.cap_posi)
-        if itt.get_img_existence(IconSkipDialog, cap=cap):
-            return True
-        return False
+        return frame.get_img_existence(IconSkipDialog, IconSkipDialog.cap_posi)
     
     def _execute_dialogue(self):
         """执行对话任务"""
@@ -337,24 +349,22 @@ class BackgroundTask:
         skip_dialog_task.task_run()
         # self.log_to_gui(f"自动对话结束", type="finalize_ai_message")
 
-    def _detect_pickup_opportunity(self, cap) -> bool:
+    def _detect_pickup_opportunity(self, frame: Frame) -> bool:
         """检测是否可以采集"""
-        cap = crop(cap, AreaPickup.position)
-        if itt.get_img_existence(IconPickupFeature, cap=cap):
-            return True
-        return False
+        return frame.get_img_existence(IconPickupFeature, AreaPickup.position)
 
-    def _detect_clear_opportunity(self, cap) -> bool:
+    def _detect_clear_opportunity(self, frame: Frame) -> bool:
         """检测是否可以清洁跳过"""
-        cap = crop(cap, IconSkip.cap_posi)
-        if itt.get_img_existence(IconSkip, cap=cap):
-            return True
-        return False
+        return frame.get_img_existence(IconSkip, IconSkip.cap_posi)
 
 
-# 全局后台任务管理器实例
-background_manager = BackgroundTaskManager()
-background_manager.start_background_task()
+def _create_background_manager():
+    manager = BackgroundTaskManager()
+    manager.start_background_task()
+    return manager
+
+# 全局后台任务管理器实例，第一次使用时才创建并启动后台线程
+background_manager = LazySingleton('background_manager', _create_background_manager)
 
 if __name__ == "__main__":
     # 测试代码
@@ -261,7 +261,7 @@ class MapCollectionTask(TaskTemplate):
 
             # 检查确认按钮
             try:
-                button_text = itt.ocr_single_line(AreaBigMapTeleportButton)
+                button_text = itt.ocr_single_line(AreaBigMapTeleportButton, rec_only=True)
                 logger.info(f"OCR 结果: {button_text}")
 
                 if "确认" in button_text:
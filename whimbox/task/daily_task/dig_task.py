@@ -59,7 +59,7 @@ class DigTask(TaskTemplate):
         if itt.appear_then_click(ButtonDigGather):
             return "step3" # 可一键收获
         else:
-            dig_num_str = itt.ocr_single_line(AreaDigingNumText, padding=50)
+            dig_num_str = itt.ocr_single_line(AreaDigingNumText, rec_only=True)
             try:
                 diging_num = int(dig_num_str.split("/")[0])
             except:
@@ -17,6 +17,8 @@ class RunMacroTask(TaskTemplate):
         self.macro_record = scripts_manager.query_macro(macro_filename)
         if not self.macro_record:
             raise ValueError(f"宏\"{macro_filename}\"不存在，请先下载该宏")
+        if isinstance(self.macro_record, ScriptEntry):
+            self.macro_record = scripts_manager.load_script(self.macro_record)
         if self.macro_record and self.macro_record.info.version != "3.0":
             raise ValueError(f"宏版本不匹配，请更新宏")
 
@@ -1,7 +1,8 @@
 """自动跑图"""
 from whimbox.task.task_template import TaskTemplate, register_step, STATE_TYPE_STOP
 from whimbox.interaction.interaction_core import itt
-import time, copy
+import time
+import numpy as np
 from whimbox.common.path_lib import *
 from whimbox.task.navigation_task.common import *
 from whimbox.map.map import nikki_map
@@ -25,29 +26,31 @@ class AutoPathTask(TaskTemplate):
         super().__init__("auto_path_task")
         self.excepted_num = excepted_num # 期望的素材数量，获取到该数量后就停止
         self.step_sleep = 0.01
-        if path_record is not None:
-            self.path_info = path_record.info
-            self.path_points = copy.deepcopy(path_record.points)
-        elif path_name is not None:
+        if path_record is None:
+            if path_name is None:
+                raise ValueError("path_record和path_name不能同时为空")
             path_record = scripts_manager.query_path(path_name=path_name)
             if path_record is None:
                 raise ValueError(f"路线\"{path_name}\"不存在，请先下载该路线")
-            self.path_info = path_record.info
-            self.path_points = copy.deepcopy(path_record.points)
-        else:
-            raise ValueError("path_record和path_name不能同时为空")
+        if isinstance(path_record, ScriptEntry):
+            # 先读取完整的路线，info和points来自同一个文件
+            path_record = scripts_manager.load_script(path_record)
+        self.path_info = path_record.info
         
         if self.path_info.version != "2.0":
             raise ValueError("路线版本不匹配，请更新路线")
         
-        # 路线脚本中的坐标为游戏原生坐标，whimbox使用时需要转换为图片像素坐标
-        for point in self.path_points:
-            pngmap_position = convert_GameLoc_to_PngMapPx(point.position, self.path_info.map)
-            point.position = [pngmap_position[0], pngmap_position[1]]
+        # 路线脚本中的坐标为游戏原生坐标，whimbox使用时需要转换为图片像素坐标，整条路线一次转换
+        self.path_arrays = PathArrays.from_points(path_record.points)
+        self.path_arrays.positions = convert_GameLoc_to_PngMapPx(self.path_arrays.positions, self.path_info.map)
+        self.path_points = self.path_arrays.to_points()
+        self.target_point_indexes = self.path_arrays.indexes_of(POINT_TYPE_TARGET)
         
         # 各种状态记录
         self.last_position = None
         self.curr_position = None
+        # 本轮循环的小地图识别结果，同一轮中复用，不重复截图
+        self.pose = None
         self.curr_target_point_id = 0
         self.target_point: PathPoint = None
         self.need_move_mode = MOVE_MODE_WALK
@@ -82,12 +85,11 @@ class AutoPathTask(TaskTemplate):
 
     def _update_next_target_point(self):
         """更新下一个必经点"""
-        if self.curr_target_point_id < len(self.path_points) - 1:
-            for index in range(self.curr_target_point_id+1, len(self.path_points)):
-                if self.path_points[index].point_type == POINT_TYPE_TARGET:
-                    self.curr_target_point_id = index
-                    self.target_point = self.path_points[index]
-                    return
+        i = np.searchsorted(self.target_point_indexes, self.curr_target_point_id, side='right')
+        if i < len(self.target_point_indexes):
+            index = int(self.target_point_indexes[i])
+            self.curr_target_point_id = index
+            self.target_point = self.path_points[index]
     
     def start_move(self, current_posi, target_posi, offset):
         if self.move_controller:
@@ -133,12 +135,14 @@ class AutoPathTask(TaskTemplate):
     def step0(self):
         # 启动动作控制线程
         self.jump_controller = JumpController()
-        self.move_controller = MoveController()
+        self.move_controller = MoveController(pose_filter=nikki_map.pose_filter)
         self.jump_controller.start_threading()
         self.move_controller.start_threading()
         # 初始化地图信息
         nikki_map.reinit_smallmap()
+        nikki_map.set_position_tracking(True)
         self.curr_position = nikki_map.get_position(use_cache=True)
+        nikki_map.start_localization(rotation=True)
         # 初始化能力盘
         ability_manager.reinit()
 
@@ -169,7 +173,8 @@ class AutoPathTask(TaskTemplate):
     def inner_step_update_target(self):
         is_end = False
         self.last_position = self.curr_position
-        self.curr_position = nikki_map.get_position()
+        self.pose = nikki_map.current_pose(rotation=True)
+        self.curr_position = list(self.pose.position)
         self.target_point = self.path_points[self.curr_target_point_id]
 
         # 计算当前位置与必经点的距离
@@ -185,6 +190,8 @@ class AutoPathTask(TaskTemplate):
         
         if target_dist <= self.offset:
             logger.debug(f"arrive target point {self.target_point.id}")
+            # 执行动作后位置和视角可能都变了，要重新识别
+            self.pose = None
 
             # 处理各种ACTION
             if self.target_point.action:
@@ -269,6 +276,7 @@ class AutoPathTask(TaskTemplate):
                 self.stop_move()
                 self.change_to_walk()
                 nikki_map.bigmap_tp(self.target_point.position, self.path_info.map)
+                self.pose = None
                 self.curr_position = nikki_map.get_position()
             else:
                 ui_control.ensure_page(page_main)
@@ -278,13 +286,21 @@ class AutoPathTask(TaskTemplate):
 
 
     def inner_step_change_view(self):
+        if self.pose is None:
+            self.pose = nikki_map.current_pose(rotation=True)
+        self.curr_position = list(self.pose.position)
         # 距离太近就不转视角了，避免观感太差
-        self.curr_position = nikki_map.get_position()
         distance = euclidean_distance(self.curr_position, self.target_point.position)
         if distance < 0.5:
             return
         target_degree = calculate_posi2degree(self.curr_position, self.target_point.position)
-        delta_degree = abs(calculate_delta_angle(nikki_map.get_rotation(), target_degree))
+        # 优先用转动视角时推算的镜头朝向，不用再识别
+        rotation = rotation_tracker.predict()
+        if rotation is None:
+            rotation = self.pose.rotation
+        if rotation is None:
+            rotation = nikki_map.get_rotation()
+        delta_degree = abs(calculate_delta_angle(rotation, target_degree))
         # 如果要转很大的角度，需要先停下来
         if delta_degree >= 45 and self.is_moving():
             self.stop_move()
@@ -311,6 +327,9 @@ class AutoPathTask(TaskTemplate):
     def clear_all(self):
         self.stop_move()
         self.change_to_walk()
+        nikki_map.stop_localization()
+        nikki_map.set_position_tracking(False)
+        nikki_map.set_move_command(None)
         if self.jump_controller is not None and self.move_controller is not None:
             self.jump_controller.stop_threading()
             self.move_controller.stop_threading()
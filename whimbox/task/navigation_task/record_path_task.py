@@ -114,10 +114,9 @@ class RecordPathTask(TaskTemplate):
         json_name = f"{name}.json"
         region_name, map_name = nikki_map.update_region_and_map_name(use_cache=True)
         # 将坐标转换为游戏原生坐标，便于永久保存
-        for pp in self.path_point_list:
-            position = convert_PngMapPx_to_GameLoc(pp.position, map_name, decimal=2)
-            pp.position = [position[0], position[1]]
-        path_record = PathRecord(
+        path_arrays = PathArrays.from_points(self.path_point_list)
+        path_arrays.positions = convert_PngMapPx_to_GameLoc(path_arrays.positions, map_name, decimal=2)
+        path_record = PathRecord.from_arrays(
             info=PathInfo(
                 name=name, 
                 type="", 
@@ -128,7 +127,7 @@ class RecordPathTask(TaskTemplate):
                 version="2.0",
                 test_mode=False
             ),
-            points=self.path_point_list
+            arrays=path_arrays
         )
         if not os.path.exists(SCRIPT_PATH):
             os.makedirs(SCRIPT_PATH)
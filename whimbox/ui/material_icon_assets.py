@@ -1,19 +1,26 @@
 from whimbox.common.path_lib import ASSETS_PATH
+from whimbox.common.lazy_singleton import LazySingleton
 from whimbox.ui.template.img_manager import GameImg
 
 import os
 import json
 
-material_icon_dict = {}
-
 material_json_filepath = os.path.join(ASSETS_PATH, 'material.json')
-with open(material_json_filepath, 'r', encoding='utf-8') as f:
-    material_json = json.load(f)
-    for material_name, value in material_json.items():
-        material_icon_dict[material_name] = {
-            "icon": GameImg(name=value['game_img']),
-            "type": value['type'],
-            "dig": value['dig'],
-            "track": value['track'],
-            "jihua": value['jihua']
-        }
+
+
+def _load_material_icon_dict():
+    material_icon_dict = {}
+    with open(material_json_filepath, 'r', encoding='utf-8') as f:
+        material_json = json.load(f)
+        for material_name, value in material_json.items():
+            material_icon_dict[material_name] = {
+                "icon": GameImg(name=value['game_img']),
+                "type": value['type'],
+                "dig": value['dig'],
+                "track": value['track'],
+                "jihua": value['jihua']
+            }
+    return material_icon_dict
+
+# 第一次使用时才读取
+material_icon_dict = LazySingleton('material_icon_dict', _load_material_icon_dict)
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from whimbox.interaction.interaction_core import itt
+from whimbox.interaction.detection_cache import posi_key
+from whimbox.interaction.frame_pipeline import Frame
+from whimbox.common.utils.img_utils import similar_img
+from whimbox.ui.page import UIPage, TitlePage
+from whimbox.ui.template.img_manager import ImgIcon
+from whimbox.ui.template.text_manager import Text
+from whimbox.ui.ui_assets import AreaPageTitleFeature
+
+
+class PageRecognizer:
+    """
+    在同一帧上一次性检测所有页面，返回按置信度排序的结果。
+
+    所有页面的检测图标去重后在线程池中并行匹配，裁剪和预处理按区域共用，
+    标题只OCR一次。匹配结果写入itt.detect_cache，之后同一帧上的is_current_page可以直接使用。
+    """
+
+    def __init__(self, pages: List[UIPage], max_workers=4):
+        self.pages = pages
+        self.max_workers = max_workers
+        self._executor = None
+        # 不同页面共用的检测图标只匹配一次
+        icons = {}
+        for page in pages:
+            if isinstance(page, TitlePage):
+                continue
+            for icon in page.check_icon_list:
+                if isinstance(icon, ImgIcon):
+                    icons[id(icon)] = icon
+        self.icons = list(icons.values())
+
+    def _match_icons(self, frame_seq, frame: Frame) -> dict:
+        """
+        Returns:
+            dict: id(imgicon) -> 匹配度
+        """
+        rates = {}
+        todo = []
+        for icon in self.icons:
+            # 和itt.get_img_existence使用同样的缓存键
+            cache_key = ('img', id(icon), posi_key(icon.cap_posi), False)
+            rate = itt.detect_cache.get(frame_seq, cache_key)
+            if rate is None:
+                todo.append((icon, cache_key))
+            else:
+                rates[id(icon)] = rate
+        if not todo:
+            return rates
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='PageRecognizer')
+        futures = [
+            (icon, cache_key, self._executor.submit(lambda icon=icon: similar_img(frame.icon_cap(icon), icon.image)))
+            for icon, cache_key in todo
+        ]
+        for icon, cache_key, future in futures:
+            rate = future.result()
+            itt.detect_cache.set(frame_seq, cache_key, rate)
+            rates[id(icon)] = rate
+        return rates
+
+    def recognize(self) -> List[Tuple[UIPage, float]]:
+        """
+        Returns:
+            list[tuple[UIPage, float]]: 页面和得分，按得分从高到低排序。
+                图片的得分为匹配度/阈值，文字和标题匹配时为1，得分>=1即为匹配。
+        """
+        with itt.hold_frame():
+            frame_seq, image = itt.get_frame_view()
+            frame = Frame(image[:, :, :3])
+            rates = self._match_icons(frame_seq, frame)
+            title_text = None
+            scores = []
+            for page in self.pages:
+                if isinstance(page, TitlePage):
+                    if title_text is None:
+                        title_text = itt.ocr_single_line(area=AreaPageTitleFeature, hsv_limit=([0, 0, 220], [179, 35, 255]), rec_only=True)
+                    score = 1. if page.title == title_text else 0.
+                else:
+                    score = 0.
+                    for icon in page.check_icon_list:
+                        if isinstance(icon, ImgIcon):
+                            score = max(score, rates[id(icon)] / icon.threshold)
+                        elif isinstance(icon, Text):
+                            score = max(score, 1. if itt.get_text_existence(icon) else 0.)
+                scores.append((page, score))
+        return sorted(scores, key=lambda x: x[1], reverse=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
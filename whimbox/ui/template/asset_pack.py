@@ -0,0 +1,118 @@
+"""预编译的图片素材包
+
+ImgIcon、GameImg、Area等素材在创建时要读取图片、计算bbox、做HSV/灰度预处理，
+素材包把预处理后的结果和元数据存在一个文件里，创建素材时只读元数据，图片在第一次使用时才解码。
+素材包由dev_tool/asset_pack_generator.py生成，源图片改动过的素材会自动回退到直接读取图片。
+"""
+
+import json
+import os
+import threading
+import weakref
+import zlib
+
+import numpy as np
+
+from whimbox.common.path_lib import ASSETS_PATH
+from whimbox.common.logger import logger
+
+ASSET_PACK_PATH = os.path.join(ASSETS_PATH, 'imgs', 'assets_pack.npz')
+# 素材包格式的版本号，修改预处理方法后要增加
+ASSET_PACK_VERSION = 1
+
+
+def file_crc(path) -> int:
+    with open(path, 'rb') as f:
+        return zlib.crc32(f.read())
+
+
+class AssetPack:
+    def __init__(self, path=ASSET_PACK_PATH):
+        self.path = path
+        # 为False时不使用素材包，生成素材包时用
+        self.enabled = True
+        self.index = {}
+        self._npz = None
+        self._opened = False
+        self._lock = threading.Lock()
+        # 创建过的素材，生成素材包时遍历
+        self.assets = weakref.WeakSet()
+
+    def _open(self):
+        if self._opened:
+            return
+        self._opened = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            npz = np.load(self.path, allow_pickle=False)
+            index = json.loads(str(npz['__index__']))
+        except Exception as e:
+            logger.warning(f"素材包读取失败，直接读取图片: {e}")
+            return
+        if index.get('version') != ASSET_PACK_VERSION:
+            logger.warning(f"素材包版本不匹配，直接读取图片")
+            return
+        self.index = index['assets']
+        self._npz = npz
+
+    def register(self, asset):
+        self.assets.add(asset)
+
+    def get_meta(self, key, source_path):
+        """
+        Args:
+            key (str): 素材的键，包含素材名和影响预处理的参数
+            source_path (str): 源图片路径
+
+        Returns:
+            dict: 素材的元数据，不在素材包中或源图片改动过时为None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._open()
+        meta = self.index.get(key)
+        if meta is None:
+            return None
+        try:
+            if file_crc(source_path) != meta['crc']:
+                return None
+        except OSError:
+            return None
+        return meta
+
+    def load_array(self, member) -> np.ndarray:
+        """读取一张预处理后的图片，每次都是新的数组"""
+        with self._lock:
+            return self._npz[member]
+
+
+asset_pack = AssetPack()
+
+
+def save_asset_pack(entries, path=ASSET_PACK_PATH):
+    """
+    Args:
+        entries (Iterable[tuple[str, str, dict, np.ndarray]]): 键、源图片路径、元数据、预处理后的图片(可以为None)
+        path (str):
+
+    Returns:
+        int: 素材数量
+    """
+    index = {}
+    arrays = {}
+    for key, source_path, meta, array in entries:
+        if key in index:
+            continue
+        index[key] = dict(meta, crc=file_crc(source_path))
+        # 只有坐标的素材没有图片
+        if array is not None:
+            member = f'a{len(arrays)}'
+            index[key]['member'] = member
+            arrays[member] = np.ascontiguousarray(array)
+    index_json = json.dumps({'version': ASSET_PACK_VERSION, 'assets': index}, ensure_ascii=False)
+    # 不压缩，读取单张图片只需要一次拷贝
+    with open(path, 'wb') as f:
+        np.savez(f, __index__=np.array(index_json), **arrays)
+    return len(index)
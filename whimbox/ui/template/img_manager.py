@@ -6,6 +6,13 @@ from copy import deepcopy
 from whimbox.common.utils.asset_utils import *
 from whimbox.common.cvars import *
 from whimbox.common.utils.img_utils import crop, process_with_hsv_limit
+from whimbox.ui.template.asset_pack import asset_pack
+
+
+def _posi_tuple(anchor_posi: AnchorPosi):
+    if anchor_posi is None:
+        return None
+    return [anchor_posi.x1, anchor_posi.y1, anchor_posi.x2, anchor_posi.y2, anchor_posi.anchor, anchor_posi.expand]
 
 
 class ImgIcon(AssetBase):
@@ -45,8 +52,16 @@ class ImgIcon(AssetBase):
             threshold = 0.98
 
         self.origin_path = path
-        self.raw_image = cv2.imread(self.origin_path)
-        if is_bbg == None:
+        self._raw_image = None
+        self._image = None
+        # 素材包中有预处理好的结果时，只读取元数据，图片在第一次使用时才解码
+        self.pack_key = f'ImgIcon|{self.name}|{[is_bbg, _posi_tuple(bbg_posi), hsv_limit, gray_limit, anchor]}'
+        meta = asset_pack.get_meta(self.pack_key, self.origin_path)
+        self._pack_member = None if meta is None else meta.get('member')
+        if meta is not None:
+            is_bbg = meta['is_bbg']
+            bbg_posi = None if meta['bbg_posi'] is None else AnchorPosi(*meta['bbg_posi'])
+        elif is_bbg == None:
             if self.raw_image.shape == (1080,1920,3):
                 is_bbg = True
             else:
@@ -56,6 +71,8 @@ class ImgIcon(AssetBase):
             self.bbg_posi = asset_get_bbox(self.raw_image, anchor=anchor)
         else:
             self.bbg_posi = bbg_posi
+        # 整张截图大小的原图只在预处理时用到，不常驻内存
+        self._raw_image = None
         if cap_posi == 'bbg':
             self.cap_posi = self.bbg_posi
         elif cap_posi == None and is_bbg == True:
@@ -74,22 +91,49 @@ class ImgIcon(AssetBase):
         self.print_log = print_log
             
         self.cap_center_position_xy = self.cap_posi.get_center()
-        
-        
+        asset_pack.register(self)
+
+    @property
+    def raw_image(self):
+        if self._raw_image is None:
+            self._raw_image = cv2.imread(self.origin_path)
+        return self._raw_image
+
+    @property
+    def image(self):
+        """预处理后的模板，第一次使用时才从素材包解码或者读取原图计算"""
+        if self._image is None:
+            if self._pack_member is not None:
+                self._image = asset_pack.load_array(self._pack_member)
+            else:
+                self._image = self._preprocess()
+                self._raw_image = None
+        return self._image
+
+    def _preprocess(self):
         if self.is_bbg:
-            self.image = crop(self.raw_image, self.bbg_posi)
+            image = crop(self.raw_image, self.bbg_posi)
         else:
-            self.image = self.raw_image.copy()
+            image = self.raw_image.copy()
         
         if self.hsv_limit is not None:
-            temp_image = process_with_hsv_limit(self.image, self.hsv_limit[0], self.hsv_limit[1])
+            temp_image = process_with_hsv_limit(image, self.hsv_limit[0], self.hsv_limit[1])
             box = asset_get_bbox(temp_image)
-            self.image = crop(temp_image, box, copy=False)
+            image = crop(temp_image, box, copy=False)
         elif self.gray_limit is not None:
-            self.image = cv2.cvtColor(self.image, cv2.COLOR_BGRA2GRAY)
-            _, temp_image = cv2.threshold(self.image, self.gray_limit[0], self.gray_limit[1], cv2.THRESH_BINARY)
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+            _, temp_image = cv2.threshold(image, self.gray_limit[0], self.gray_limit[1], cv2.THRESH_BINARY)
             box = asset_get_bbox(temp_image)
-            self.image = crop(temp_image, box, copy=False)
+            image = crop(temp_image, box, copy=False)
+        return image
+
+    def pack_entry(self):
+        """
+        Returns:
+            tuple: 素材包的键、源图片路径、元数据、预处理后的图片，见asset_pack.save_asset_pack
+        """
+        meta = {'is_bbg': bool(self.is_bbg), 'bbg_posi': _posi_tuple(self.bbg_posi)}
+        return self.pack_key, self.origin_path, meta, self.image
             
     def copy(self):
         return deepcopy(self)
@@ -110,7 +154,24 @@ class GameImg(AssetBase):
             path = self.get_img_path()
     
         self.origin_path = path
-        self.raw_image = cv2.imread(self.origin_path, cv2.IMREAD_UNCHANGED)
+        self._raw_image = None
+        self.pack_key = f'GameImg|{self.name}'
+        meta = asset_pack.get_meta(self.pack_key, self.origin_path)
+        self._pack_member = None if meta is None else meta.get('member')
+        asset_pack.register(self)
+
+    @property
+    def raw_image(self):
+        """第一次使用时才从素材包解码或者读取图片"""
+        if self._raw_image is None:
+            if self._pack_member is not None:
+                self._raw_image = asset_pack.load_array(self._pack_member)
+            else:
+                self._raw_image = cv2.imread(self.origin_path, cv2.IMREAD_UNCHANGED)
+        return self._raw_image
+
+    def pack_entry(self):
+        return self.pack_key, self.origin_path, {}, self.raw_image
     
     def copy(self):
         return deepcopy(self)
@@ -2,6 +2,7 @@ import cv2
 import traceback
 from whimbox.common.utils.asset_utils import *
 from whimbox.common.cvars import *
+from whimbox.ui.template.asset_pack import asset_pack
 
 class PosiTemplate(AssetBase):
     def __init__(self, name = None, posi=None, img_path=None, anchor=ANCHOR_TOP_LEFT, expand=False):
@@ -24,11 +25,26 @@ class PosiTemplate(AssetBase):
         if posi is None and img_path is None:
             img_path = self.get_img_path()
 
+        self.origin_path = img_path
+        self.pack_key = None
         if posi != None:
             self.position = posi
         else:
-            image = cv2.imread(img_path)
-            self.position = asset_get_bbox(image, anchor=self.anchor, expand=self.expand)
+            # 素材包中有计算好的坐标时不用读取图片
+            self.pack_key = f'Posi|{self.name}|{[self.anchor, self.expand]}'
+            meta = asset_pack.get_meta(self.pack_key, img_path)
+            if meta is not None:
+                self.position = None if meta['position'] is None else AnchorPosi(*meta['position'])
+            else:
+                image = cv2.imread(img_path)
+                self.position = asset_get_bbox(image, anchor=self.anchor, expand=self.expand)
+            asset_pack.register(self)
+
+    def pack_entry(self):
+        position = self.position
+        if position is not None:
+            position = [position.x1, position.y1, position.x2, position.y2, position.anchor, position.expand]
+        return self.pack_key, self.origin_path, {'position': position}, None
 
 
 class Area(PosiTemplate):
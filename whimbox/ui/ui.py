@@ -1,9 +1,11 @@
 from whimbox.common.cvars import *
 from whimbox.interaction.interaction_core import itt
+from whimbox.api.ocr_rapid import ocr
 from whimbox.ui.page_assets import *
 from whimbox.ui.template.button_manager import Button
 from whimbox.common.logger import logger
 from whimbox.ui.page import TitlePage
+from whimbox.ui.page_recognizer import PageRecognizer
 from whimbox.common.utils.ui_utils import back_to_page_main
 from whimbox.common.cvars import get_current_stop_flag
 
@@ -13,6 +15,7 @@ class UI():
 
     def __init__(self) -> None:
         self.switch_ui_lock = Lock()
+        self.page_recognizer = PageRecognizer(ui_pages)
 
     def ui_additional(self):
         """
@@ -30,17 +33,13 @@ class UI():
             return False
 
     def get_current_page(self):
-        ret_page = None
-        title_text = itt.ocr_single_line(area=AreaPageTitleFeature, hsv_limit=([0, 0, 220], [179, 35, 255]))
-        for page in ui_pages:
-            if isinstance(page, TitlePage):
-                if page.title == title_text:
-                    ret_page = page
-                    break
-            else:
-                if page.is_current_page(itt):
-                    ret_page = page
-                    break
+        ranking = self.page_recognizer.recognize()
+        logger.trace("page scores: " + ", ".join(f"{page}:{score:.2f}" for page, score in ranking[:3]))
+        logger.trace(f"detect cache: {itt.detect_cache.cache_info()}")
+        logger.trace(f"ocr cache: {ocr.cache.cache_info()}")
+        # 多个页面同时匹配时，和之前一样按ui_pages中的顺序优先
+        matched = {page for page, score in ranking if score >= 1}
+        ret_page = next((page for page in ui_pages if page in matched), None)
         if not ret_page:
             raise Exception("无法识别当前页面")
         else:
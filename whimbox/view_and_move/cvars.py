@@ -12,4 +12,15 @@ ACTION_CATCH_INSECT = "CATCH_INSECT"
 ACTION_CLEAN_ANIMAL = "CLEAN_ANIMAL"
 ACTION_FISHING = "FISHING"
 ACTION_WAIT = "WAIT"
-ACTION_KEY_CLICK = "KEY_CLICK"
\ No newline at end of file
+ACTION_KEY_CLICK = "KEY_CLICK"
+# 视角转动后，等这么久(秒)截图才能看到新的镜头朝向
+VIEW_SETTLE_TIME = 0.1
+# 视角推算：镜头朝向识别结果的误差(度)
+VIEW_TRACK_MEASURE_ERROR = 1.5
+# 视角推算：每次转动的相对误差，来自视角旋转比例的校准误差
+VIEW_TRACK_MOVE_ERROR = 0.03
+# 视角推算：不转动时每秒累积的误差(度)，角色移动、镜头跟随等原因
+VIEW_TRACK_DRIFT = 2
+# 视角推算：误差超过这个值(度)，或连续推算了这么多次转动后，重新识别一次
+VIEW_TRACK_MAX_ERROR = 4
+VIEW_TRACK_MAX_MOVES = 8
@@ -103,8 +103,13 @@ class JumpController(AdvanceThreading):
 
 
 class MoveController(AdvanceThreading):
-    def __init__(self):
+    def __init__(self, pose_filter=None):
+        """
+        Args:
+            pose_filter (PoseFilter): 可选，把移动指令对应的速度告诉定位的滤波器
+        """
         super().__init__()
+        self.pose_filter = pose_filter
         self.while_sleep = 0.02
         self.move_ahead_timer = None
         self.is_moving = False
@@ -130,6 +135,10 @@ class MoveController(AdvanceThreading):
         loop_time = (sum(self.loop_time_list) - max(self.loop_time_list) - min(self.loop_time_list)) / (len(self.loop_time_list) - 2)
         return round(loop_time, 2)
 
+    def _set_move_command(self, velocity):
+        if self.pose_filter is not None:
+            self.pose_filter.set_control(velocity)
+
     def start_move_ahead(self, current_posi, target_posi, offset, once_loop_time):
         # 更新历史移动速度
         now_time = time.time()
@@ -157,6 +166,8 @@ class MoveController(AdvanceThreading):
         # 开始移动
         itt.key_down(keybind.KEYBIND_FORWARD)
         self.is_moving = True
+        if target_dist > 0:
+            self._set_move_command(np.subtract(target_posi, current_posi) / target_dist * speed)
         self.move_ahead_timer = AdvanceTimer(duration).start()
         logger.debug(f'start move ahead, duration: {duration}, loop_time: {loop_time}')
 
@@ -165,12 +176,14 @@ class MoveController(AdvanceThreading):
         self.move_ahead_timer = None
         self.last_posi = None # 让下次开始移动时，速度延用停止移动前的估算速度
         itt.key_up(keybind.KEYBIND_FORWARD)
+        self._set_move_command((0, 0))
         logger.debug('stop move ahead')
 
     def switch_move(self):
         if self.is_moving and self.move_ahead_timer.reached():
             itt.key_up(keybind.KEYBIND_FORWARD)
             self.is_moving = False
+            self._set_move_command((0, 0))
 
     def loop(self):
         self.switch_move()
@@ -2,13 +2,126 @@ from whimbox.common.logger import logger
 from whimbox.map.map import nikki_map
 from whimbox.common.timer_module import TimeoutTimer
 from whimbox.view_and_move.utils import *
+from whimbox.view_and_move.cvars import *
 from whimbox.interaction.interaction_core import itt
 from whimbox.common.cvars import get_current_stop_flag
+import math
 import time
 
+
+class RotationTracker:
+    """
+    镜头朝向的航位推算。
+
+    每次转动视角都知道鼠标移动了多少，按视角旋转比例换算成角度，就能推算出转动后的镜头朝向，
+    不用每次都截图识别。推算的误差随转动角度和时间累积，误差太大或连续推算太多次后，
+    再用一次识别结果校正。识别结果和推算差太多时，以识别为准，但下次还要再识别一次确认。
+    """
+
+    def __init__(self):
+        # 推算的镜头朝向，None为还没有识别过
+        self.rotation = None
+        # 推算误差的方差
+        self.variance = 0.
+        self.timestamp = 0.
+        # 最后一次转动视角的时间，早于转动完成的识别结果作废
+        self.move_timestamp = 0.
+        # 上次校正后推算了几次转动
+        self.move_count = 0
+        # 最后一次校正用的截图时间，同一个识别结果不重复使用
+        self.measure_timestamp = 0.
+
+    def reset(self):
+        """视角旋转比例变化、传送等情况下，之前的推算不可信了"""
+        self.rotation = None
+
+    def _variance_at(self, now):
+        return self.variance + VIEW_TRACK_DRIFT ** 2 * max(now - self.timestamp, 0)
+
+    def predict(self):
+        """
+        Returns:
+            float: 推算的镜头朝向，需要重新识别时为None
+        """
+        if self.rotation is None or self.move_count >= VIEW_TRACK_MAX_MOVES:
+            return None
+        if math.sqrt(self._variance_at(time.time())) > VIEW_TRACK_MAX_ERROR:
+            return None
+        return self.rotation
+
+    def move(self, angle):
+        """
+        Args:
+            angle (float): direct_cview实际转动的角度
+        """
+        now = time.time()
+        self.move_timestamp = now
+        if self.rotation is None:
+            return
+        self.variance = self._variance_at(now) + (VIEW_TRACK_MOVE_ERROR * angle) ** 2
+        self.rotation = (self.rotation - angle) % 360
+        self.timestamp = now
+        self.move_count += 1
+
+    def correct(self, rotation, timestamp=None):
+        """
+        Args:
+            rotation (float): 识别的镜头朝向
+            timestamp (float): 截图时间，None为已经确认过转动完成的结果
+
+        Returns:
+            bool: 识别结果是否可用
+        """
+        now = time.time()
+        if timestamp is not None:
+            if timestamp < self.move_timestamp + VIEW_SETTLE_TIME or timestamp <= self.measure_timestamp:
+                return False
+            self.measure_timestamp = timestamp
+        measure_variance = VIEW_TRACK_MEASURE_ERROR ** 2
+        if self.rotation is None:
+            self.rotation = rotation
+            self.variance = measure_variance
+        else:
+            variance = self._variance_at(now)
+            innovation = calculate_delta_angle(rotation, self.rotation)
+            if innovation ** 2 > 9 * (variance + measure_variance):
+                logger.trace(f"rotation tracking lost, predict: {round(self.rotation, 1)}, measure: {rotation}")
+                self.rotation = rotation
+                self.variance = (2 * VIEW_TRACK_MAX_ERROR) ** 2
+            else:
+                k = variance / (variance + measure_variance)
+                self.rotation = (self.rotation + k * innovation) % 360
+                self.variance = (1 - k) * variance
+        self.timestamp = now
+        self.move_count = 0
+        return True
+
+
+rotation_tracker = RotationTracker()
+
+
 def direct_cview(angel):
     px = angle2movex(angel)
     itt.move_to([px, 0], relative=True)
+    rotation_tracker.move(px / config["view_rotation_ratio"])
+
+
+def measure_rotation():
+    """
+    识别一次镜头朝向，校正rotation_tracker。
+    刚转动过视角时，先等转动完成，后台定位发布的旧结果不用。
+
+    Returns:
+        float: 校正后推算的镜头朝向，识别结果和推算不一致时为None
+    """
+    wait = rotation_tracker.move_timestamp + VIEW_SETTLE_TIME - time.time()
+    if wait > 0:
+        time.sleep(wait)
+    for _ in range(2):
+        rotation = nikki_map.get_rotation()
+        if rotation_tracker.correct(rotation, nikki_map.rotation_timestamp):
+            return rotation_tracker.predict()
+    return None
 
 
 def get_safe_rotation(last_angle=None, offset=5):
@@ -45,11 +158,27 @@ def get_safe_rotation(last_angle=None, offset=5):
     return angle_list[-1]
 
 
+def get_tracked_rotation(offset=5):
+    """
+    优先用推算的镜头朝向，推算不可信时识别一次校正，
+    识别结果和推算不一致时才用get_safe_rotation多取几次
+    """
+    cangle = rotation_tracker.predict()
+    if cangle is None and rotation_tracker.rotation is not None:
+        cangle = measure_rotation()
+    if cangle is None:
+        cangle = get_safe_rotation(offset=offset)
+        rotation_tracker.reset()
+        rotation_tracker.correct(cangle)
+    return cangle
+
+
 def calibrate_view_rotation_ratio(offset=5):
     """校准视角旋转比例"""
     if config["view_rotation_ratio"] != 1:
         return
     stop_flag = get_current_stop_flag()
+    rotation_tracker.reset()
     while not stop_flag.is_set():
         cangle = get_safe_rotation(offset=offset)
         direct_cview(90)
@@ -61,14 +190,20 @@ def calibrate_view_rotation_ratio(offset=5):
         if dangle == 0:
             continue
         config["view_rotation_ratio"] = 90 / dangle * config["view_rotation_ratio"]
+    # 校准过程中比例在变，转动的推算不准
+    rotation_tracker.reset()
 
 
 def change_view_to_angle(tangle, offset:float=5, use_last_rotation=False):
     """转动视角到指定角度"""
-    if use_last_rotation:
+    if use_last_rotation and nikki_map.pose is not None and nikki_map.pose.rotation is not None:
+        # 调用方刚识别过，转动完成后的识别结果可以直接用来校正
+        rotation_tracker.correct(nikki_map.pose.rotation, nikki_map.pose.timestamp)
+    if use_last_rotation and rotation_tracker.rotation is None:
         cangle = get_safe_rotation(last_angle=nikki_map.rotation, offset=offset)
+        rotation_tracker.correct(cangle)
     else:
-        cangle = get_safe_rotation(offset=offset)
+        cangle = get_tracked_rotation(offset=offset)
     dangle = calculate_delta_angle(cangle, tangle)
     if abs(dangle) > offset:
         direct_cview(dangle)